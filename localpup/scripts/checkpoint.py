@@ -0,0 +1,118 @@
+"""
+LocalPup 运行日志（断点续跑）
+把已完成的列表页和详情结果逐条追加到 JSONL 日志，每条写入后 fsync；
+进程中途被杀后，下一次运行读取日志，跳过已完成的任务、页面和详情，继续写入同一个输出文件。
+
+- 每个任务（booking:hangzhou 等）成功结束时单独记录，一个任务失败不影响其他任务的完成状态
+- 超过 max_age_hours 的未完成运行不再恢复：它的页面早已过时，应当重新开始
+
+事件格式（每行一个 JSON）：
+    {"event": "start", "timestamp": ..., "output": ..., "started_at": ...}
+    {"event": "page", "source": ..., "city": ..., "page": 0, "count": 25}
+    {"event": "detail", "source": ..., "url": ..., "result": {...}}
+    {"event": "job", "job": "booking:hangzhou"}
+    {"event": "finish"}
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+class RunJournal:
+    """断点续跑日志：上一次运行没有 finish 时恢复其进度，否则开始新的运行"""
+
+    def __init__(self, path: str, resume: bool = True, max_age_hours: float = 12):
+        """
+        path: 日志文件路径
+        resume: 为 False 时忽略未完成的日志，总是开始新的运行
+        max_age_hours: 未完成的运行开始于该小时数之前时不再恢复（expired 为 True）
+        """
+        self.path = path
+        self.max_age = timedelta(hours=max_age_hours)
+        self.meta: Dict[str, Any] = {}
+        self.pages: Set[Tuple[str, str, int]] = set()
+        self.details: Dict[Tuple[str, str], Any] = {}
+        self.jobs: Set[str] = set()
+        self.expired = False
+        self.resumed = resume and self._replay()
+        if not self.resumed:
+            self.meta, self.pages, self.details, self.jobs = {}, set(), {}, set()
+        self._file = open(path, 'a' if self.resumed else 'w', encoding='utf-8')
+
+    def _replay(self) -> bool:
+        """读取已有日志，返回是否存在可恢复的未完成运行"""
+        if not os.path.exists(self.path):
+            return False
+        finished = False
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # 被中断写入的末行
+                    continue
+                kind = event.get('event')
+                if kind == 'start':
+                    self.meta = event
+                elif kind == 'page':
+                    self.pages.add((event['source'], event['city'], event['page']))
+                elif kind == 'detail':
+                    self.details[(event['source'], event['url'])] = event['result']
+                elif kind == 'job':
+                    self.jobs.add(event['job'])
+                elif kind == 'finish':
+                    finished = True
+        if not self.meta or finished:
+            return False
+        self.expired = datetime.now() - self._started_at() > self.max_age
+        return not self.expired
+
+    def _started_at(self) -> datetime:
+        """运行开始时间；旧日志没有 started_at 时取日志文件的修改时间"""
+        if self.meta.get('started_at'):
+            return datetime.fromisoformat(self.meta['started_at'])
+        return datetime.fromtimestamp(os.path.getmtime(self.path))
+
+    def _append(self, event: Dict):
+        self._file.write(json.dumps(event, ensure_ascii=False))
+        self._file.write('\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, **meta):
+        """记录新运行的元数据（输出文件路径、时间戳等）"""
+        self.meta = {'event': 'start', 'started_at': datetime.now().isoformat(timespec='seconds'), **meta}
+        self._append(self.meta)
+
+    def page_done(self, source: str, city: str, page: int) -> bool:
+        return (source, city, page) in self.pages
+
+    def record_page(self, source: str, city: str, page: int, count: int):
+        """列表页（含详情）已写入输出文件"""
+        self.pages.add((source, city, page))
+        self._append({'event': 'page', 'source': source, 'city': city, 'page': page, 'count': count})
+
+    def detail(self, source: str, url: str) -> Optional[Any]:
+        """之前已抓取成功的详情结果"""
+        return self.details.get((source, url))
+
+    def record_detail(self, source: str, url: str, result: Any):
+        self.details[(source, url)] = result
+        self._append({'event': 'detail', 'source': source, 'url': url, 'result': result})
+
+    def job_done(self, job: str) -> bool:
+        return job in self.jobs
+
+    def record_job(self, job: str):
+        """任务（source:city）的所有页面和详情都已完成，恢复运行时不再执行"""
+        self.jobs.add(job)
+        self._append({'event': 'job', 'job': job})
+
+    def finish(self):
+        """运行完整结束，下一次运行不再恢复"""
+        self._append({'event': 'finish'})
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,94 @@
+"""
+LocalPup 抓取计划
+把 城市 × 数据源 展开为抓取任务，并按上次抓取时间排序：从未抓取过和最久没抓取的城市先跑
+
+每个 (数据源, 城市) 上次成功抓取的时间保存在 data/crawl_state.json：
+    {"booking": {"hangzhou": "2026-01-01T02:00:00"}, "ctrip": {...}}
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 城市 -> 各数据源使用的城市名：Booking 按英文名搜索，携程按中文名查城市 ID（CtripScraper.CITY_IDS）
+CITIES: Dict[str, Dict[str, str]] = {
+    'beijing': {'booking': 'Beijing', 'ctrip': '北京'},
+    'shanghai': {'booking': 'Shanghai', 'ctrip': '上海'},
+    'tianjin': {'booking': 'Tianjin', 'ctrip': '天津'},
+    'chongqing': {'booking': 'Chongqing', 'ctrip': '重庆'},
+    'qingdao': {'booking': 'Qingdao', 'ctrip': '青岛'},
+    'xian': {'booking': "Xi'an", 'ctrip': '西安'},
+    'nanjing': {'booking': 'Nanjing', 'ctrip': '南京'},
+    'suzhou': {'booking': 'Suzhou', 'ctrip': '苏州'},
+    'hangzhou': {'booking': 'Hangzhou', 'ctrip': '杭州'},
+    'xiamen': {'booking': 'Xiamen', 'ctrip': '厦门'},
+    'chengdu': {'booking': 'Chengdu', 'ctrip': '成都'},
+    'shenzhen': {'booking': 'Shenzhen', 'ctrip': '深圳'},
+    'guangzhou': {'booking': 'Guangzhou', 'ctrip': '广州'},
+    'guilin': {'booking': 'Guilin', 'ctrip': '桂林'},
+    'kunming': {'booking': 'Kunming', 'ctrip': '昆明'},
+    'lijiang': {'booking': 'Lijiang', 'ctrip': '丽江'},
+    'sanya': {'booking': 'Sanya', 'ctrip': '三亚'},
+}
+
+
+def resolve_city(name: str) -> str:
+    """把城市键、英文名或中文名统一为 CITIES 中的键，未知城市抛出 ValueError"""
+    wanted = name.strip().lower().replace("'", '')
+    for key, names in CITIES.items():
+        if wanted == key or wanted in (n.lower().replace("'", '') for n in names.values()):
+            return key
+    raise ValueError(f"未知城市: {name}（可选: {', '.join(CITIES)}）")
+
+
+class CrawlState:
+    """{source: {city: 上次成功抓取的时间}}"""
+
+    def __init__(self, last_scraped: Optional[Dict[str, Dict[str, str]]] = None):
+        self.last_scraped = last_scraped or {}
+
+    def last(self, source: str, city: str) -> Optional[datetime]:
+        value = self.last_scraped.get(source, {}).get(city)
+        return datetime.fromisoformat(value) if value else None
+
+    def mark(self, source: str, city: str, when: Optional[datetime] = None):
+        """记录 (source, city) 刚刚抓取成功"""
+        when = when or datetime.now()
+        self.last_scraped.setdefault(source, {})[city] = when.isoformat(timespec='seconds')
+
+    @classmethod
+    def load(cls, path: str) -> 'CrawlState':
+        """文件不存在或损坏时视为所有城市都从未抓取过"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+    def save(self, path: str):
+        """先写临时文件再替换"""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.last_scraped, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+def plan_jobs(cities: Iterable[str], sources: Iterable[str], state: CrawlState,
+              min_age_hours: float = 0, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+    """
+    展开 城市 × 数据源，返回按上次抓取时间从旧到新排列的 [(source, city)]
+    min_age_hours: 距上次成功抓取不足该小时数的任务不再安排
+    """
+    now = now or datetime.now()
+    cutoff = now - timedelta(hours=min_age_hours)
+    jobs = []
+    for city in cities:
+        for source in sources:
+            last = state.last(source, city)
+            if min_age_hours and last and last > cutoff:
+                continue
+            jobs.append((last or datetime.min, source, city))
+    # sorted 是稳定排序，时间相同（如都从未抓取）时保持命令行给出的顺序
+    jobs.sort(key=lambda job: job[0])
+    return [(source, city) for _, source, city in jobs]
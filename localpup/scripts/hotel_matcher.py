@@ -0,0 +1,317 @@
+"""
+LocalPup 跨平台酒店匹配
+把 Booking 和携程抓到的同一家酒店合并为一条记录
+
+名称先做归一化（全半角、大小写、常见品牌/地名中英对照、去掉"酒店""Hotel"等后缀），
+商圈/景区名只按记录所在城市的对照表翻译（南京的"鼓楼"是 Gulou，西安的"鼓楼"是 Drum Tower），
+再切分为英文单词和中文二元组。候选只从共享低频词的倒排索引中产生，不做两两比较；
+得分为按 IDF 加权的 Dice 系数，按得分从高到低一对一配对。
+
+纯数字（"99"、分店号、楼层）不能单独说明是同一家酒店：不参与产生候选，计分时降权，
+候选必须至少共享一个非数字的名称词。
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from crawl_schedule import CITIES, resolve_city
+from hotel_record import HotelRecord
+
+
+# 中文品牌和通用词 → 英文，使两种语言的名称落到同一组词上
+NAME_ALIASES = {
+    '四季': 'four seasons',
+    '柏悦': 'park hyatt',
+    '君悦': 'grand hyatt',
+    '凯悦': 'hyatt',
+    '安达仕': 'andaz',
+    '洲际': 'intercontinental',
+    '皇冠假日': 'crowne plaza',
+    '英迪格': 'indigo',
+    '假日': 'holiday inn',
+    '丽思卡尔顿': 'ritz carlton',
+    '丽思': 'ritz carlton',
+    'jw万豪': 'jw marriott',
+    '万豪': 'marriott',
+    '万怡': 'courtyard',
+    '喜来登': 'sheraton',
+    '福朋': 'four points',
+    '威斯汀': 'westin',
+    '艾美': 'le meridien',
+    '瑞吉': 'st regis',
+    '雅乐轩': 'aloft',
+    '文华东方': 'mandarin oriental',
+    '悦榕庄': 'banyan tree',
+    '安缦': 'aman',
+    '法云': 'fayun',
+    '希尔顿': 'hilton',
+    '康莱德': 'conrad',
+    '华尔道夫': 'waldorf astoria',
+    '逸林': 'doubletree',
+    '欢朋': 'hampton',
+    '香格里拉': 'shangri la',
+    '嘉里': 'kerry',
+    '索菲特': 'sofitel',
+    '诺富特': 'novotel',
+    '铂尔曼': 'pullman',
+    '美居': 'mercure',
+    '宜必思': 'ibis',
+    '温德姆': 'wyndham',
+    '华美达': 'ramada',
+    '雷迪森': 'radisson',
+    '开元': 'new century',
+    '宝格丽': 'bulgari',
+    '半岛': 'peninsula',
+    '朗廷': 'langham',
+    '康得思': 'cordis',
+    '汉庭': 'hanting',
+    '全季': 'ji hotel',
+    '如家': 'home inn',
+    '亚朵': 'atour',
+    '桔子': 'orange',
+    '维也纳': 'vienna',
+    '锦江': 'jinjiang',
+    '国际': 'international',
+    '度假': 'resort',
+}
+
+# 各城市的商圈/景区名 → 英文，只用于该城市的记录（城市名本身由 CITIES 生成，见 CITY_ALIASES）
+DISTRICT_ALIASES = {
+    'hangzhou': {
+        '西子湖': 'west lake',
+        '西湖': 'west lake',
+        '西溪': 'xixi',
+        '湖滨': 'hubin',
+        '钱江': 'qianjiang',
+        '钱塘': 'qiantang',
+        '滨江': 'binjiang',
+        '萧山': 'xiaoshan',
+        '余杭': 'yuhang',
+        '千岛湖': 'qiandao lake',
+        '灵隐': 'lingyin',
+        '龙井': 'longjing',
+        '武林': 'wulin',
+    },
+    'shanghai': {
+        '外滩': 'bund',
+        '陆家嘴': 'lujiazui',
+        '浦东': 'pudong',
+        '虹桥': 'hongqiao',
+        '静安': 'jingan',
+        '徐汇': 'xuhui',
+        '新天地': 'xintiandi',
+    },
+    'nanjing': {
+        '鼓楼': 'gulou',
+        '新街口': 'xinjiekou',
+        '夫子庙': 'confucius temple',
+    },
+    'beijing': {
+        '王府井': 'wangfujing',
+        '国贸': 'guomao',
+        '三里屯': 'sanlitun',
+        '金融街': 'financial street',
+        '首都机场': 'capital airport',
+    },
+    'guangzhou': {'天河': 'tianhe', '珠江新城': 'zhujiang new town'},
+    'shenzhen': {'福田': 'futian', '南山': 'nanshan', '罗湖': 'luohu'},
+    'chengdu': {'春熙路': 'chunxi road', '太古里': 'taikoo li'},
+    'xian': {'钟楼': 'bell tower', '鼓楼': 'drum tower', '大雁塔': 'big wild goose pagoda'},
+    'sanya': {'亚龙湾': 'yalong bay', '海棠湾': 'haitang bay', '三亚湾': 'sanya bay'},
+    'xiamen': {'鼓浪屿': 'gulangyu'},
+    'suzhou': {'金鸡湖': 'jinji lake'},
+}
+
+# 城市名取 CITIES 中的中英文名（xi'an → xian），所有城市通用
+CITY_ALIASES = {
+    names['ctrip']: names['booking'].lower().replace("'", '') for names in CITIES.values()
+}
+
+# 不区分酒店的通用词
+STOPWORDS = {
+    'hotel', 'hotels', 'resort', 'resorts', 'spa', 'the', 'and', 'at', 'by', 'of', 'a', 'an', 'in',
+    'apartment', 'apartments', 'hostel', 'suites', 'suite', '大', '店',
+}
+# 中文通用后缀，在切分二元组之前整体去掉
+CJK_SUFFIXES = ['度假村', '酒店', '宾馆', '饭店', '公寓', '民宿', '客栈', '分店']
+# 纯数字词的计分权重（相对 IDF）
+NUMERIC_WEIGHT = 0.2
+
+
+def _alternation(words: Iterable[str]) -> re.Pattern:
+    return re.compile('|'.join(sorted(map(re.escape, words), key=len, reverse=True)))
+
+
+@lru_cache(maxsize=None)
+def _aliases(city: Optional[str]) -> Tuple[Dict[str, str], re.Pattern]:
+    """城市（CITIES 的键或中英文名）适用的对照表及其正则；未知城市只用通用的品牌名和城市名"""
+    try:
+        districts = DISTRICT_ALIASES.get(resolve_city(city), {}) if city else {}
+    except ValueError:
+        districts = {}
+    aliases = {**CITY_ALIASES, **districts, **NAME_ALIASES}
+    return aliases, _alternation(aliases)
+
+
+_SUFFIX_PATTERN = _alternation(CJK_SUFFIXES)
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[一-鿿]+')
+
+
+def normalize_name(name: str, city: Optional[str] = None) -> str:
+    """全半角统一、小写、品牌/地名翻译为英文（商圈名按 city 的对照表）、去掉标点"""
+    aliases, pattern = _aliases(city)
+    text = unicodedata.normalize('NFKC', name or '').lower()
+    text = pattern.sub(lambda m: f" {aliases[m.group(0)]} ", text)
+    text = _SUFFIX_PATTERN.sub(' ', text)
+    text = text.replace('&', ' ').replace("'", '')
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w一-鿿]+', ' ', text)).strip()
+
+
+def name_tokens(name: str, city: Optional[str] = None) -> List[str]:
+    """英文按单词切分，中文按二元组切分（单字保留原样）"""
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(normalize_name(name, city)):
+        if run[0] < '一':
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return [token for token in dict.fromkeys(tokens) if token not in STOPWORDS]
+
+
+class HotelMatcher:
+    """基于倒排索引分块的名称匹配"""
+
+    def __init__(self, threshold: float = 0.6, max_block_size: int = 200):
+        """
+        threshold: 最低匹配得分（0~1）
+        max_block_size: 出现次数超过该值的词不参与产生候选（如城市名）
+        """
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+
+    def match(self, left: List[Dict], right: List[Dict],
+              city: Optional[str] = None) -> List[Tuple[int, int, float]]:
+        """
+        返回一对一的匹配 [(left 下标, right 下标, 得分)]
+        city: 两边记录所在的城市，名称中的商圈名按该城市的对照表翻译
+        """
+        left_tokens = [name_tokens(hotel.get('name', ''), city) for hotel in left]
+        right_tokens = [name_tokens(hotel.get('name', ''), city) for hotel in right]
+
+        df = Counter()
+        for tokens in left_tokens + right_tokens:
+            df.update(tokens)
+        total = len(left_tokens) + len(right_tokens)
+        # 词的权重为 IDF，纯数字降权
+        weight = {
+            token: math.log(1 + total / count) * (NUMERIC_WEIGHT if token.isdigit() else 1)
+            for token, count in df.items()
+        }
+
+        index: Dict[str, List[int]] = defaultdict(list)
+        for j, tokens in enumerate(right_tokens):
+            for token in tokens:
+                if not token.isdigit():
+                    index[token].append(j)
+        right_weights = [sum(weight[t] for t in tokens) for tokens in right_tokens]
+
+        candidates = []
+        for i, tokens in enumerate(left_tokens):
+            # 候选只由非数字的名称词产生，只共享数字的两条记录不会成为候选
+            words = [t for t in tokens if not t.isdigit()]
+            if not words:
+                continue
+            blocking = [t for t in words if len(index.get(t, ())) <= self.max_block_size]
+            if not blocking:
+                # 所有词都很常见时只用最稀有的词分块
+                blocking = [min(words, key=lambda t: len(index.get(t, ())))]
+            block = {j for token in blocking for j in index.get(token, ())}
+            token_set = set(tokens)
+            left_weight = sum(weight[t] for t in tokens)
+            for j in block:
+                common = sum(weight[t] for t in right_tokens[j] if t in token_set)
+                score = 2 * common / (left_weight + right_weights[j])
+                if score >= self.threshold:
+                    candidates.append((score, i, j))
+
+        # 按得分从高到低贪心配对，保证一对一
+        matches = []
+        used_left, used_right = set(), set()
+        for score, i, j in sorted(candidates, reverse=True):
+            if i in used_left or j in used_right:
+                continue
+            used_left.add(i)
+            used_right.add(j)
+            matches.append((i, j, round(score, 3)))
+        return matches
+
+
+def _latest(*values: Optional[str]) -> Optional[str]:
+    values = [v for v in values if v]
+    return max(values, key=datetime.fromisoformat) if values else None
+
+
+def merge_records(booking: Dict, ctrip: Dict, score: float) -> HotelRecord:
+    """合并同一酒店的两条记录，保留两个平台的评分、评论数和链接"""
+    merged = {**ctrip, **booking}
+    merged['name'] = booking['name']
+    if ctrip.get('name') and ctrip['name'] != booking['name']:
+        merged['name_zh'] = ctrip['name']
+    merged['ctrip_rating'] = ctrip.get('ctrip_rating')
+    merged['ctrip_review_count'] = ctrip.get('ctrip_review_count')
+    merged['ctrip_url'] = ctrip.get('ctrip_url')
+    prices = [p for p in (booking.get('price'), ctrip.get('price')) if p]
+    merged['price'] = min(prices) if prices else None
+    merged['source'] = 'merged'
+    merged['sources'] = ['booking', 'ctrip']
+    merged['match_score'] = score
+    merged['scraped_at'] = _latest(booking.get('scraped_at'), ctrip.get('scraped_at'))
+    merged['details_scraped_at'] = _latest(booking.get('details_scraped_at'), ctrip.get('details_scraped_at'))
+    return HotelRecord.from_dict(merged)
+
+
+def _dedupe(hotels: List[Dict], url_key: str) -> List[Dict]:
+    """同一平台内按链接去重（翻页时可能重复出现），保留最后一条"""
+    by_url = {}
+    for hotel in hotels:
+        by_url[(hotel.get(url_key) or '').split('?')[0] or id(hotel)] = hotel
+    return list(by_url.values())
+
+
+def resolve_hotels(hotels: Iterable[Dict], matcher: Optional[HotelMatcher] = None) -> List[Dict]:
+    """
+    把多个平台的记录合并为每家酒店一条，未匹配上的记录原样保留
+    只在同一城市（hotel['city']）的记录之间匹配，不同城市的同名连锁酒店不会被合并
+    """
+    matcher = matcher or HotelMatcher()
+    by_city: Dict[Optional[str], Tuple[List[Dict], List[Dict]]] = defaultdict(lambda: ([], []))
+    others = []
+    for hotel in hotels:
+        source = hotel.get('source')
+        if source == 'booking':
+            by_city[hotel.get('city')][0].append(hotel)
+        elif source == 'ctrip':
+            by_city[hotel.get('city')][1].append(hotel)
+        else:
+            others.append(hotel)
+
+    resolved = []
+    for city, (booking, ctrip) in by_city.items():
+        booking = _dedupe(booking, 'booking_url')
+        ctrip = _dedupe(ctrip, 'ctrip_url')
+        matches = matcher.match(booking, ctrip, city)
+        matched_booking = {i for i, _, _ in matches}
+        matched_ctrip = {j for _, j, _ in matches}
+
+        resolved.extend(merge_records(booking[i], ctrip[j], score) for i, j, score in matches)
+        resolved.extend(h for i, h in enumerate(booking) if i not in matched_booking)
+        resolved.extend(h for j, h in enumerate(ctrip) if j not in matched_ctrip)
+    resolved.extend(others)
+    return resolved
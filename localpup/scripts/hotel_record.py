@@ -0,0 +1,136 @@
+"""
+LocalPup 酒店记录
+所有爬虫产出的酒店记录类型：用 __slots__ 存储固定字段，比逐条构造的 dict 小得多，
+多城市抓取时内存中同时持有的十万级记录不再被 dict 的键表开销主导。
+
+记录实现 MutableMapping 接口，下游代码（合并、评分聚合、图片校验、数据库写入）
+照常按 hotel['name'] / hotel.get('price') 读写；不在固定字段中的键放入 extra。
+
+- source、city 等取值很少的字符串做驻留，所有记录共用同一个对象
+- scraped_at / details_scraped_at 内部存为时间戳（float，属性访问 record.scraped_at 得到数值），
+  按键读取和序列化时仍是 ISO 字符串，与已有的 JSONL 输出和读取方一致
+"""
+
+import sys
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Dict, Iterator, Mapping
+
+# 固定字段，按输出 JSON 的键顺序排列
+FIELDS = (
+    'name', 'name_zh', 'source', 'sources', 'city',
+    'booking_rating', 'booking_review_count', 'ctrip_rating', 'ctrip_review_count',
+    'overall_rating', 'review_count', 'price',
+    'booking_url', 'ctrip_url', 'url', 'thumbnail',
+    'scraped_at', 'details_scraped_at',
+    'address', 'description', 'amenities', 'images', 'photos', 'gallery',
+    'match_score',
+)
+TIMESTAMP_FIELDS = frozenset(('scraped_at', 'details_scraped_at'))
+_FIELD_SET = frozenset(FIELDS)
+_MISSING = object()
+
+
+def _to_timestamp(value: Any) -> Any:
+    """ISO 字符串或 datetime 转为时间戳，None 原样保留"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+def _to_iso(value: Any) -> Any:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).isoformat()
+    return value
+
+
+class HotelRecord(MutableMapping):
+    """一家酒店在某个平台（或合并后）的记录；未赋值的字段不属于记录，与 dict 中不存在的键相同"""
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        self.extra = None
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> 'HotelRecord':
+        """从 JSON 读出的 dict（或另一条记录）构造"""
+        if isinstance(data, cls):
+            return data
+        return cls(**data)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            return _to_iso(value) if key in TIMESTAMP_FIELDS else value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _FIELD_SET:
+            if key in TIMESTAMP_FIELDS:
+                value = _to_timestamp(value)
+            elif key in ('source', 'city') and value:
+                value = sys.intern(value)
+            elif key == 'sources' and value:
+                value = [sys.intern(source) for source in value]
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _FIELD_SET:
+            if getattr(self, key, _MISSING) is _MISSING:
+                raise KeyError(key)
+            delattr(self, key)
+        elif self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in FIELDS:
+            if getattr(self, key, _MISSING) is not _MISSING:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    # MutableMapping 的 get / __contains__ 走 __getitem__ 的异常路径，下游大量调用，直接按字段查找
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                return default
+            return _to_iso(value) if key in TIMESTAMP_FIELDS else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __contains__(self, key: object) -> bool:
+        if key in _FIELD_SET:
+            return getattr(self, key, _MISSING) is not _MISSING
+        return bool(self.extra) and key in self.extra
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON 序列化用的 dict（时间戳转回 ISO 字符串）"""
+        data = {}
+        for key in FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                data[key] = _to_iso(value) if key in TIMESTAMP_FIELDS else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self) -> str:
+        return f"HotelRecord({self.to_dict()!r})"
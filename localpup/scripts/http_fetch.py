@@ -0,0 +1,137 @@
+"""
+LocalPup HTTP 抓取
+不经过浏览器，直接用 aiohttp 请求页面并按 SELECTORS 解析卡片
+
+服务端直出的列表页用一次 GET 即可解析，成本远低于打开一个浏览器页面；
+需要 JS 渲染或被风控拦截的页面解析不到卡片，由调用方回退到 Playwright。
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from response_cache import ResponseCache
+
+
+def _select_one(root, selectors: List[str]):
+    """按顺序尝试选择器，返回 (元素, 命中的选择器)（与 EXTRACT_CARDS_JS 中的 pick 一致）"""
+    for selector in selectors:
+        try:
+            el = root.select_one(selector)
+        except Exception:
+            continue
+        if el is not None:
+            return el, selector
+    return None, None
+
+
+def extract_cards(html: str, card_selectors: List[str], fields: Dict[str, List[str]],
+                  attributes: Dict[str, str]) -> Dict:
+    """
+    从 HTML 中提取所有卡片的原始字段，返回值与 EXTRACT_CARDS_JS 相同：
+    {'cardSelector': 命中的卡片选择器, 'cards': [{field: 文本或属性}],
+     'selectorHits': {field: {selector: 命中的卡片数}}}
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    cards, card_selector = [], None
+    for selector in card_selectors:
+        try:
+            found = soup.select(selector)
+        except Exception:
+            continue
+        if found:
+            cards, card_selector = found, selector
+            break
+
+    raw_cards = []
+    selector_hits: Dict[str, Dict[str, int]] = {}
+    for card in cards:
+        raw = {}
+        for field, selectors in fields.items():
+            el, selector = _select_one(card, selectors)
+            if selector:
+                hits = selector_hits.setdefault(field, {})
+                hits[selector] = hits.get(selector, 0) + 1
+            attr = attributes.get(field)
+            if el is None:
+                raw[field] = None
+            elif attr:
+                raw[field] = el.get(attr)
+            else:
+                raw[field] = el.get_text(' ', strip=True)
+        raw_cards.append(raw)
+    return {'cardSelector': card_selector, 'cards': raw_cards, 'selectorHits': selector_hits}
+
+
+class HttpFetcher:
+    """共享一个 keep-alive 连接池的 aiohttp 会话"""
+
+    def __init__(self, user_agent: Optional[str] = None, locale: Optional[str] = None,
+                 connections: int = 4, timeout: float = 20.0,
+                 cache: Optional[ResponseCache] = None):
+        """
+        user_agent / locale: 与浏览器 context 保持一致的请求头
+        connections: 每个域名的最大连接数
+        timeout: 单次请求的总超时（秒）
+        cache: 响应缓存，命中时不发请求；回放模式下未命中直接抛出异常
+        """
+        self.headers = {
+            'Accept': 'text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+            'Accept-Language': f"{locale},en;q=0.8" if locale else 'en',
+        }
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+        self.connections = connections
+        self.timeout = timeout
+        self.cache = cache
+        # 实际从网络下载的字节数（不含缓存命中）
+        self.bytes_received = 0
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit_per_host=self.connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def _get(self, url: str) -> Tuple[bytes, Optional[str]]:
+        """GET 原始响应 (正文, Content-Type)，经过缓存读写，非 2xx 状态抛出异常"""
+        if self.cache:
+            cached = self.cache.get(url)
+            if cached:
+                meta, body = cached
+                return body, meta.get('content_type')
+            if self.cache.replay:
+                raise LookupError(f"回放模式下缓存未命中: {url}")
+        await self.start()
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            body = await response.read()
+            self.bytes_received += len(body)
+            content_type = response.headers.get('Content-Type')
+        if self.cache:
+            self.cache.put(url, body, response.status, content_type)
+        return body, content_type
+
+    async def get_text(self, url: str) -> str:
+        """GET 页面文本，按 Content-Type 中的 charset 解码（默认 UTF-8）"""
+        body, content_type = await self._get(url)
+        charset = 'utf-8'
+        for part in (content_type or '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                charset = value.strip('"')
+        return body.decode(charset, errors='replace')
+
+    async def get_json(self, url: str):
+        """GET JSON 接口（列表页背后的 XHR）"""
+        return json.loads(await self.get_text(url))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
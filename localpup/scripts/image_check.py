@@ -0,0 +1,316 @@
+"""
+LocalPup 图片校验与去重
+合并后的酒店记录里，Booking 详情图片（hotel['images']）和携程官方照片（hotel['photos']）
+经过这一步后写入 hotel['gallery']，数据库的 HotelImage 行由 gallery 生成。
+
+- 规范化：同一张图的不同尺寸（Booking 的 max300 / max1024x768，携程的 _R_300_225 后缀）
+  归为同一个规范 URL，只保留最大的可用尺寸
+- 校验：通过连接池发 Range 请求（只取前 probe_bytes 字节），非图片、404 和过小的占位图剔除；
+  probe_bytes=0 时只发 HEAD
+- 去重：按规范 URL 和内容指纹（前 probe_bytes 字节的 content_hash + 总大小）去重，
+  同一张图只归属第一个出现它的酒店；gallery 条目的 content_hash（完整原图的 sha256，
+  对应 HotelImage.contentHash）由 image_derivatives 下载原图后写入
+- 跨运行：校验结果保存在 data/image_index.json，TTL 内不再重复请求；
+  内容相同的图片总是映射到第一次见到的 URL，HotelImage 不会因换了 CDN 域名重复插入
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+
+# Booking: /xdata/images/hotel/max300/123.jpg、/square200/、/max1024x768/
+BOOKING_SIZE = re.compile(r'/(?:max|square)(\d+)(?:x(\d+))?/')
+# Booking 详情页最大的常用尺寸，缩略图优先尝试升级到它
+BOOKING_LARGE = '/max1024x768/'
+# 携程: 0200g12000abc_R_300_225.jpg、_W_1080_808_R5_Q70.jpg、_C_500_280.jpg
+CTRIP_SIZE = re.compile(r'_[A-Z]{1,2}_(\d+)_(\d+)(?:_R\d+)?(?:_Q\d+)?(?=\.\w+$)')
+
+
+def content_hash(data: bytes) -> str:
+    """图片内容的哈希（sha256 十六进制），image_check 的内容指纹和 image_derivatives 的原图哈希共用"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _absolute(url: str) -> Optional[str]:
+    """补全协议相对地址（//dimg04.c-ctrip.com/...），非 http(s) 地址返回 None"""
+    url = url.strip()
+    if url.startswith('//'):
+        url = 'https:' + url
+    return url if url.startswith(('http://', 'https://')) else None
+
+
+def canonical_image_url(url: str) -> Optional[str]:
+    """
+    同一张图片所有尺寸、协议和查询参数变体共用的规范 URL（只用作去重键，不一定可访问）
+    非 http(s) 地址（data:、相对路径）返回 None
+    """
+    url = _absolute(url)
+    if not url:
+        return None
+    parts = urlsplit(url)
+    path = BOOKING_SIZE.sub('/{size}/', parts.path)
+    path = CTRIP_SIZE.sub('', path)
+    return urlunsplit(('https', parts.netloc.lower(), path, '', ''))
+
+
+def _declared_size(url: str) -> int:
+    """URL 中声明的尺寸（宽 × 高），没有尺寸信息的视为原图"""
+    for pattern in (BOOKING_SIZE, CTRIP_SIZE):
+        match = pattern.search(urlsplit(url).path)
+        if match:
+            width = int(match.group(1))
+            return width * int(match.group(2) or width)
+    return 1 << 30
+
+
+def candidate_urls(urls: List[str]) -> List[str]:
+    """同一规范 URL 下见到的所有变体，按尺寸从大到小；Booking 缩略图额外尝试 max1024x768"""
+    candidates = []
+    for url in urls:
+        url = _absolute(url)
+        if not url:
+            continue
+        if BOOKING_SIZE.search(url):
+            candidates.append(BOOKING_SIZE.sub(BOOKING_LARGE, url, count=1))
+        candidates.append(url)
+    candidates = list(dict.fromkeys(candidates))
+    candidates.sort(key=_declared_size, reverse=True)
+    return candidates
+
+
+class ImageIndex:
+    """
+    跨运行保存的校验结果
+    urls: {规范 URL: {'url': 可用的 URL 或 None, 'fingerprint', 'bytes', 'checked_at'}}
+    fingerprints: {内容指纹: 第一次见到的可用 URL}
+    """
+
+    def __init__(self, urls: Optional[Dict[str, Dict]] = None, fingerprints: Optional[Dict[str, str]] = None):
+        self.urls = urls or {}
+        self.fingerprints = fingerprints or {}
+
+    def fresh(self, key: str, ttl: timedelta) -> Optional[Dict]:
+        """TTL 内的校验结果"""
+        entry = self.urls.get(key)
+        if entry and datetime.now() - datetime.fromisoformat(entry['checked_at']) < ttl:
+            return entry
+        return None
+
+    def put(self, key: str, url: Optional[str], fingerprint: Optional[str] = None, size: Optional[int] = None):
+        self.urls[key] = {
+            'url': url,
+            'fingerprint': fingerprint,
+            'bytes': size,
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if url and fingerprint:
+            self.fingerprints.setdefault(fingerprint, url)
+
+    @classmethod
+    def load(cls, path: str) -> 'ImageIndex':
+        """文件不存在或损坏时从空索引开始"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            urls, fingerprints = data.get('urls') or {}, data.get('fingerprints') or {}
+        except (OSError, ValueError):
+            return cls()
+        # 旧版本的指纹用 sha1 计算，与 content_hash 不可比，丢弃后重新校验
+        stale = {fp for fp in fingerprints if len(fp.split(':')[0]) != 64}
+        urls = {key: entry for key, entry in urls.items() if entry.get('fingerprint') not in stale}
+        return cls(urls, {fp: url for fp, url in fingerprints.items() if fp not in stale})
+
+    def save(self, path: str):
+        """先写临时文件再替换"""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'urls': self.urls, 'fingerprints': self.fingerprints}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def upgrade_unvalidated(hotels: List[Dict]) -> int:
+    """
+    不校验时（回放模式、SCRAPER_VALIDATE_IMAGES=0）的退路：不发请求，Booking 缩略图直接换成
+    max1024x768 的 URL，同一规范 URL 只保留一次；返回升级的图片数
+    """
+    upgraded = 0
+    for hotel in hotels:
+        if not hotel.get('images'):
+            continue
+        images, seen = [], set()
+        for url in hotel['images']:
+            key = canonical_image_url(url)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            large = candidate_urls([url])[0]
+            upgraded += large != url
+            images.append(large)
+        hotel['images'] = images
+    return upgraded
+
+
+def _hotel_images(hotel: Dict) -> List[Dict]:
+    """Booking 图片（URL 字符串）和携程照片（字典）统一为 gallery 条目"""
+    images = [
+        {'url': url, 'caption': None, 'is_official': True, 'order': order, 'source': 'booking'}
+        for order, url in enumerate(hotel.get('images') or [])
+    ]
+    for photo in hotel.get('photos') or []:
+        images.append({
+            'url': photo['url'],
+            'caption': photo.get('caption') or None,
+            'is_official': photo.get('is_official', True),
+            'order': photo.get('order', 0),
+            'source': photo.get('source', 'ctrip'),
+        })
+    return images
+
+
+class ImageValidator:
+    """并发校验图片 URL，按规范 URL 和内容指纹去重，结果写入 hotel['gallery']"""
+
+    def __init__(self, index: Optional[ImageIndex] = None, concurrency: int = 32, connections: int = 8,
+                 timeout: float = 15.0, probe_bytes: int = 64 * 1024, min_bytes: int = 1024,
+                 ttl_hours: float = 24 * 7, user_agent: Optional[str] = None):
+        """
+        index: 跨运行的校验结果，TTL 内命中的图片不再请求
+        concurrency: 同时进行的请求数
+        connections: 每个图片域名的最大连接数
+        probe_bytes: Range 请求读取的字节数，用于计算内容指纹；为 0 时只发 HEAD，不按内容去重
+        min_bytes: 小于该大小的图片视为占位图
+        ttl_hours: 校验结果的有效期（小时）
+        """
+        self.index = index or ImageIndex()
+        self.concurrency = concurrency
+        self.connections = connections
+        self.timeout = timeout
+        self.probe_bytes = probe_bytes
+        self.min_bytes = min_bytes
+        self.ttl = timedelta(hours=ttl_hours)
+        self.headers = {'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8'}
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+        self.stats = {'images': 0, 'checked': 0, 'cached': 0, 'broken': 0, 'duplicates': 0, 'kept': 0}
+
+    async def _probe(self, session: aiohttp.ClientSession, url: str) -> Optional[Tuple[Optional[str], int]]:
+        """请求一个 URL，可用时返回 (内容指纹, 总字节数)，否则返回 None"""
+        try:
+            if not self.probe_bytes:
+                async with session.head(url, allow_redirects=True) as response:
+                    if response.status != 200 or not self._is_image(response):
+                        return None
+                    size = int(response.headers.get('Content-Length') or 0)
+                    return (None, size) if not size or size >= self.min_bytes else None
+
+            headers = {'Range': f"bytes=0-{self.probe_bytes - 1}"}
+            async with session.get(url, headers=headers) as response:
+                if response.status not in (200, 206) or not self._is_image(response):
+                    return None
+                head = await self._read(response, self.probe_bytes)
+                size = self._total_size(response, len(head))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+        if size < self.min_bytes:
+            return None
+        fingerprint = f"{content_hash(head)}:{size}"
+        return fingerprint, size
+
+    @staticmethod
+    def _is_image(response: aiohttp.ClientResponse) -> bool:
+        content_type = response.headers.get('Content-Type')
+        return not content_type or content_type.startswith('image/')
+
+    @staticmethod
+    async def _read(response: aiohttp.ClientResponse, limit: int) -> bytes:
+        """最多读 limit 字节；服务器忽略 Range 返回整张图时不读完剩余部分"""
+        chunks, remaining = [], limit
+        while remaining > 0:
+            chunk = await response.content.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    @staticmethod
+    def _total_size(response: aiohttp.ClientResponse, received: int) -> int:
+        """206 响应从 Content-Range（bytes 0-65535/123456）取总大小，200 响应取 Content-Length"""
+        content_range = response.headers.get('Content-Range', '')
+        if '/' in content_range and not content_range.endswith('/*'):
+            return int(content_range.rsplit('/', 1)[1])
+        return int(response.headers.get('Content-Length') or received)
+
+    async def _check(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                     key: str, urls: List[str]):
+        """按尺寸从大到小尝试同一张图的各个变体，第一个可用的写入索引"""
+        async with semaphore:
+            for url in candidate_urls(urls):
+                probed = await self._probe(session, url)
+                if probed:
+                    fingerprint, size = probed
+                    self.index.put(key, url, fingerprint, size)
+                    return
+            self.index.put(key, None)
+
+    async def validate(self, hotels: List[Dict]) -> Dict:
+        """校验所有酒店的图片并生成 hotel['gallery']，返回统计"""
+        variants: Dict[str, List[str]] = {}
+        for hotel in hotels:
+            for image in _hotel_images(hotel):
+                key = canonical_image_url(image['url'])
+                if key:
+                    variants.setdefault(key, []).append(image['url'])
+
+        pending = {key: urls for key, urls in variants.items() if not self.index.fresh(key, self.ttl)}
+        self.stats['checked'] += len(pending)
+        self.stats['cached'] += len(variants) - len(pending)
+        if pending:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.connections,
+                                             ttl_dns_cache=300)
+            async with aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                await asyncio.gather(*(
+                    self._check(session, semaphore, key, urls) for key, urls in pending.items()
+                ))
+
+        claimed = set()
+        for hotel in hotels:
+            hotel['gallery'] = self._gallery(hotel, claimed)
+        return self.stats
+
+    def _gallery(self, hotel: Dict, claimed: set) -> List[Dict]:
+        gallery = []
+        for image in _hotel_images(hotel):
+            self.stats['images'] += 1
+            key = canonical_image_url(image['url'])
+            entry = self.index.urls.get(key) if key else None
+            if not entry or not entry['url']:
+                self.stats['broken'] += 1
+                continue
+            # 同一内容总是用第一次见到的 URL；没有指纹（HEAD 模式）时按规范 URL 去重
+            dedupe_key = entry['fingerprint'] or key
+            if dedupe_key in claimed:
+                self.stats['duplicates'] += 1
+                continue
+            claimed.add(dedupe_key)
+            url = self.index.fingerprints.get(entry['fingerprint'], entry['url'])
+            gallery.append({**image, 'url': url, 'order': len(gallery)})
+        self.stats['kept'] += len(gallery)
+        return gallery
+
+
+async def validate_images(hotels: List[Dict], index_path: str, **options) -> Dict:
+    """读取索引、校验 hotels 的图片并写回索引，返回统计"""
+    validator = ImageValidator(ImageIndex.load(index_path), **options)
+    stats = await validator.validate(hotels)
+    validator.index.save(index_path)
+    return stats
@@ -0,0 +1,297 @@
+"""
+LocalPup 图片衍生版本
+把 hotel['gallery']（image_check 校验后的图片）的原图下载一次，在进程池中生成
+多个宽度的 WebP / AVIF 缩略图和 blurhash 占位符，写入按内容寻址的本地存储：
+
+    data/images/ab/abcdef…/source      原图（content_hash 即目录名）
+    data/images/ab/abcdef…/640.webp    衍生版本（宽度.格式）
+    data/images/ab/abcdef…/manifest.json
+
+已处理过的图片（同一内容、同一套宽度/格式/质量参数）不再下载也不再重新编码；
+参数变化时从本地原图重新生成，不再下载。缩放和编码是 CPU 密集型工作，
+放在 ProcessPoolExecutor 中运行，不阻塞爬虫的事件循环。
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+
+from image_check import content_hash
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = ('webp', 'avif')
+# AVIF 在相同质量参数下体积明显更小，质量参数可以低一些
+DERIVATIVE_QUALITY = {'webp': 80, 'avif': 60}
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value: int, length: int) -> str:
+    return ''.join(BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(values: np.ndarray) -> np.ndarray:
+    v = values / 255.0
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash_encode(pixels: np.ndarray, x_components: int = 4, y_components: int = 3) -> str:
+    """对 (高, 宽, 3) 的 sRGB 像素数组计算 blurhash（https://blurha.sh 的编码算法）"""
+    height, width = pixels.shape[:2]
+    linear = _srgb_to_linear(pixels.astype(np.float64))
+    xs = np.arange(width)
+    ys = np.arange(height)
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            basis = np.outer(np.cos(np.pi * j * ys / height), np.cos(np.pi * i * xs / width))
+            normalisation = 1.0 if i == 0 and j == 0 else 2.0
+            factors.append(normalisation * np.tensordot(basis, linear, axes=([0, 1], [0, 1])) / (width * height))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(float(np.abs(f).max()) for f in ac)
+        quantised_max = int(min(max(actual_max * 166 - 0.5, 0), 82))
+        maximum = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        maximum = 1.0
+        result += _base83(0, 1)
+
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        quantised = [
+            int(min(max(np.sign(c) * abs(c / maximum) ** 0.5 * 9 + 9.5, 0), 18))
+            for c in factor
+        ]
+        result += _base83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+    return result
+
+
+def render_derivatives(data: bytes, directory: str, widths: Tuple[int, ...], formats: Tuple[str, ...],
+                       quality: Dict[str, int]) -> Dict:
+    """
+    在工作进程中运行：生成各宽度的衍生版本和 blurhash，保存原图，返回 manifest
+    不放大图片：原图比目标宽度窄时只生成一个原宽度的版本；无法解码时抛出异常
+    """
+    import io
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        width, height = original.size
+        # EXIF 方向为旋转 90° 时宽高互换
+        if original.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+        # JPEG 在解码阶段直接按 1/2、1/4、1/8 缩小，不解码用不到的分辨率
+        original.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    os.makedirs(directory, exist_ok=True)
+    Image.init()
+    available = [fmt for fmt in formats if fmt.upper() in Image.SAVE]
+
+    targets = sorted({min(w, width) for w in widths})
+    variants = []
+    for target in targets:
+        size = (target, max(1, round(height * target / width)))
+        resized = image.resize(size, Image.LANCZOS) if size != image.size else image
+        for fmt in available:
+            name = f"{target}.{fmt}"
+            resized.save(os.path.join(directory, name), fmt.upper(), quality=quality.get(fmt, 80))
+            variants.append(name)
+
+    source_path = os.path.join(directory, 'source')
+    if not os.path.exists(source_path):
+        with open(source_path, 'wb') as f:
+            f.write(data)
+
+    thumb = image.resize((32, max(1, round(32 * height / width))), Image.BILINEAR)
+    return {
+        'width': width,
+        'height': height,
+        'variants': variants,
+        'blurhash': blurhash_encode(np.asarray(thumb)),
+    }
+
+
+class DerivativeStore:
+    """按内容寻址的本地图片存储，另存 {原图 URL: content_hash} 索引避免重复下载"""
+
+    def __init__(self, root: str = 'data/images'):
+        self.root = root
+        self.index_path = os.path.join(root, 'sources.json')
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                self.sources: Dict[str, str] = json.load(f)
+        except (OSError, ValueError):
+            self.sources = {}
+
+    def directory(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def manifest(self, digest: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory(digest), 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_manifest(self, digest: str, manifest: Dict):
+        path = os.path.join(self.directory(digest), 'manifest.json')
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    def read_source(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.directory(digest), 'source'), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{self.index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.sources, f, ensure_ascii=False)
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+
+class DerivativePipeline:
+    """下载 gallery 中的原图并在进程池中生成衍生版本，结果写回 gallery 条目"""
+
+    def __init__(self, store: Optional[DerivativeStore] = None, workers: Optional[int] = None,
+                 widths: Tuple[int, ...] = DERIVATIVE_WIDTHS, formats: Tuple[str, ...] = DERIVATIVE_FORMATS,
+                 quality: Optional[Dict[str, int]] = None, concurrency: int = 16, connections: int = 8,
+                 timeout: float = 60.0, max_bytes: int = 20 * 1024 * 1024, user_agent: Optional[str] = None):
+        """
+        store: 衍生版本存储，默认 data/images
+        workers: 编码进程数，默认为 CPU 核数
+        widths / formats / quality: 衍生版本的宽度、格式和各格式的质量参数
+        concurrency: 同时下载的原图数
+        connections: 每个图片域名的最大连接数
+        max_bytes: 超过该大小的原图跳过
+        """
+        self.store = store or DerivativeStore()
+        self.workers = workers or os.cpu_count() or 1
+        self.spec = {
+            'widths': list(widths),
+            'formats': list(formats),
+            'quality': quality or DERIVATIVE_QUALITY,
+        }
+        self.concurrency = concurrency
+        self.connections = connections
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.headers = {'Accept': 'image/*,*/*;q=0.8'}
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+        self.stats = {'images': 0, 'cached': 0, 'downloaded': 0, 'rendered': 0, 'failed': 0}
+
+    def _current(self, url: str) -> Optional[Dict]:
+        """URL 已下载过且 manifest 与当前参数一致时返回 manifest"""
+        digest = self.store.sources.get(url)
+        manifest = self.store.manifest(digest) if digest else None
+        if manifest and manifest.get('spec') == self.spec:
+            return manifest
+        return None
+
+    async def _download(self, session: aiohttp.ClientSession, url: str) -> Optional[bytes]:
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    return None
+                if int(response.headers.get('Content-Length') or 0) > self.max_bytes:
+                    return None
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    data += chunk
+                    if len(data) > self.max_bytes:
+                        return None
+                return bytes(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _process(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                       pool: ProcessPoolExecutor, url: str, rendering: Dict[str, asyncio.Future]):
+        """下载（或读取本地原图）后交给进程池编码；不同 URL 内容相同时只编码一次"""
+        loop = asyncio.get_running_loop()
+        digest = self.store.sources.get(url)
+        data = await asyncio.to_thread(self.store.read_source, digest) if digest else None
+        if data is None:
+            async with semaphore:
+                data = await self._download(session, url)
+            if data is None:
+                self.stats['failed'] += 1
+                return
+            self.stats['downloaded'] += 1
+            digest = await asyncio.to_thread(content_hash, data)
+            self.store.sources[url] = digest
+
+        manifest = self.store.manifest(digest)
+        if manifest and manifest.get('spec') == self.spec:
+            return
+        if digest not in rendering:
+            rendering[digest] = loop.run_in_executor(
+                pool, render_derivatives, data, self.store.directory(digest),
+                tuple(self.spec['widths']), tuple(self.spec['formats']), self.spec['quality'],
+            )
+            try:
+                manifest = await rendering[digest]
+            except Exception:
+                # 无法解码的文件（HTML 错误页、损坏的图片）
+                self.stats['failed'] += 1
+                self.store.sources.pop(url, None)
+                return
+            manifest['spec'] = self.spec
+            self.store.write_manifest(digest, manifest)
+            self.stats['rendered'] += 1
+        else:
+            await asyncio.gather(rendering[digest], return_exceptions=True)
+
+    async def run(self, hotels: List[Dict]) -> Dict:
+        """处理所有酒店 gallery 中的图片，返回统计"""
+        images = [image for hotel in hotels for image in hotel.get('gallery') or []]
+        urls = list(dict.fromkeys(image['url'] for image in images))
+        pending = [url for url in urls if not self._current(url)]
+        self.stats['images'] += len(urls)
+        self.stats['cached'] += len(urls) - len(pending)
+
+        if pending:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.connections)
+            rendering: Dict[str, asyncio.Future] = {}
+            # forkserver：工作进程不从带着事件循环和线程池的主进程直接 fork
+            context = multiprocessing.get_context('forkserver')
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                async with aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                    await asyncio.gather(*(
+                        self._process(session, semaphore, pool, url, rendering) for url in pending
+                    ))
+            self.store.save()
+
+        manifests = {url: self._current(url) for url in urls}
+        for image in images:
+            manifest = manifests[image['url']]
+            if manifest:
+                image['content_hash'] = self.store.sources[image['url']]
+                image['width'] = manifest['width']
+                image['height'] = manifest['height']
+                image['blurhash'] = manifest['blurhash']
+                image['variants'] = manifest['variants']
+        return self.stats
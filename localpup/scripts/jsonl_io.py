@@ -0,0 +1,115 @@
+"""
+LocalPup JSONL 读写
+爬虫结果按页追加写入 JSONL（可选 gzip），每页写完立即 flush，运行中即可 tail
+
+进程被杀时文件末尾可能是半行 JSON 或没有结束标记的 gzip 成员，直接续写会把它和后续数据粘在一起
+（gzip 整个文件都无法解压）；续写前先用 repair_jsonl 截回到最后一条完整记录。
+"""
+
+import gzip
+import json
+import os
+import zlib
+from typing import Dict, Iterator, List
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _encode_record(obj):
+    """记录类型（HotelRecord）按 to_dict 序列化"""
+    to_dict = getattr(obj, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f"无法序列化 {type(obj).__name__}")
+    return to_dict()
+
+
+# 复用同一个编码器：json.dumps 带参数调用时每次都会新建 JSONEncoder
+_encode = json.JSONEncoder(ensure_ascii=False, default=_encode_record).encode
+
+
+def repair_jsonl(path: str) -> int:
+    """
+    把被中断写入的文件改写为只含完整记录的文件（gzip 重新压缩为一个完整的成员），返回记录数
+    文件不存在时返回 0
+    """
+    if not os.path.exists(path):
+        return 0
+    # 临时文件保留原后缀，按同样的格式（gzip 或文本）写入
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".tmp-{name}")
+    count = 0
+    with _open(tmp, 'w') as f:
+        for record in read_jsonl(path):
+            f.write(_encode(record))
+            f.write('\n')
+            count += 1
+    os.replace(tmp, path)
+    return count
+
+
+class JsonlWriter:
+    """追加写入 JSONL，每次 write_page 后 flush"""
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        resume: 续写中断的运行，先修复文件末尾，count 从已有的记录数开始
+        """
+        self.path = path
+        self.count = repair_jsonl(path) if resume else 0
+        self._file = _open(path, 'a')
+
+    def write_page(self, records: List[Dict]):
+        """写入一页记录并刷新到磁盘"""
+        for record in records:
+            self._file.write(_encode(record))
+            self._file.write('\n')
+        self._file.flush()
+        self.count += len(records)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> 'JsonlWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    """逐行读取 JSONL（.gz 自动解压），跳过被中断写入的不完整末行和截断的 gzip 末尾"""
+    with _open(path, 'r') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            # gzip 成员没有写完（进程被杀），之前解压出的记录仍然有效
+            return
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """读取 .json（数组）或 .jsonl / .jsonl.gz 输出文件"""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+    else:
+        yield from read_jsonl(path)
+
+
+def point_latest(path: str, link: str):
+    """把 link（如 data/latest_hotels.jsonl）指向最新一次运行的输出文件"""
+    tmp = f"{link}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.basename(path), tmp)
+    os.replace(tmp, link)
@@ -0,0 +1,195 @@
+"""
+LocalPup 列表接口捕获
+两个站点的列表页都通过 JSON 接口（XHR / fetch）加载酒店数据，页面上的卡片只是它的渲染结果。
+
+- ListingCapture 订阅页面的 response 事件，匹配列表接口的响应到达时直接解析 JSON，
+  不再等待渲染、滚动和逐卡片读取 DOM；同时记下请求的 URL、方法、请求头和请求体作为模板
+- paginate_request 改写模板中的页码 / 偏移量参数，翻页时直接重放接口请求，不再点击"下一页"
+- dig 按点分隔的路径从接口返回中取字段，接口字段变化时像 SELECTORS 一样按顺序尝试备用路径
+"""
+
+import asyncio
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# 页码参数（第一页的值 + p）、偏移量参数（第一页的值 + p × 每页条数）和每页条数参数
+PAGE_KEYS = frozenset(('pageIndex', 'pageNo', 'pageNum', 'pageNumber', 'page'))
+OFFSET_KEYS = frozenset(('offset', 'start', 'startIndex'))
+SIZE_KEYS = ('pageSize', 'rowsPerPage', 'rows', 'limit')
+# 重放请求时不沿用的请求头：由请求上下文重新生成（cookie 取自浏览器上下文）
+REPLAY_DROP_HEADERS = frozenset(('content-length', 'cookie', 'host', 'connection', 'accept-encoding'))
+
+
+def dig(data: Any, paths: List[str]) -> Any:
+    """按顺序尝试点分隔的路径（列表下标用数字，如 roomInfo.0.price），返回第一个非空值"""
+    for path in paths:
+        value = data
+        for part in path.split('.'):
+            if isinstance(value, dict):
+                value = value.get(part)
+            elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            else:
+                value = None
+            if value is None:
+                break
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _page_size(node: Dict, per_page: int) -> int:
+    """同一层级声明了每页条数时以它为准"""
+    for key in SIZE_KEYS:
+        value = node.get(key)
+        if _is_int(value) and value > 0:
+            return value
+        if isinstance(value, str) and value.isdigit() and int(value) > 0:
+            return int(value)
+    return per_page
+
+
+def _rewrite_json(node: Any, p: int, per_page: int) -> bool:
+    """就地改写 JSON 中的页码和偏移量，返回是否改写了任何参数"""
+    changed = False
+    if isinstance(node, dict):
+        size = _page_size(node, per_page)
+        for key, value in node.items():
+            if key in PAGE_KEYS and _is_int(value):
+                node[key] = value + p
+                changed = True
+            elif key in OFFSET_KEYS and _is_int(value):
+                node[key] = value + p * size
+                changed = True
+            elif isinstance(value, (dict, list)):
+                changed = _rewrite_json(value, p, per_page) or changed
+    elif isinstance(node, list):
+        for value in node:
+            changed = _rewrite_json(value, p, per_page) or changed
+    return changed
+
+
+def _rewrite_query(query: str, p: int, per_page: int) -> Optional[str]:
+    """改写查询字符串中的页码和偏移量，没有可改写的参数时返回 None"""
+    params = parse_qsl(query, keep_blank_values=True)
+    size = _page_size(dict(params), per_page)
+    changed = False
+    for i, (key, value) in enumerate(params):
+        if not value.isdigit():
+            continue
+        if key in PAGE_KEYS:
+            params[i] = (key, str(int(value) + p))
+            changed = True
+        elif key in OFFSET_KEYS:
+            params[i] = (key, str(int(value) + p * size))
+            changed = True
+    return urlencode(params) if changed else None
+
+
+def paginate_request(url: str, post_data: Optional[str], p: int,
+                     per_page: int) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    把第一页的接口请求改写为第 p 页（从 0 开始）：JSON 请求体和查询字符串中的页码、偏移量都会改写
+    per_page: 请求中没有声明每页条数时使用的默认值
+    返回 (url, 请求体)；请求中找不到分页参数时返回 None
+    """
+    changed = False
+    if post_data:
+        try:
+            body = json.loads(post_data)
+        except ValueError:
+            body = None
+        if isinstance(body, (dict, list)) and _rewrite_json(body, p, per_page):
+            post_data = json.dumps(body, ensure_ascii=False, separators=(',', ':'))
+            changed = True
+
+    parts = urlsplit(url)
+    query = _rewrite_query(parts.query, p, per_page) if parts.query else None
+    if query is not None:
+        url = urlunsplit(parts._replace(query=query))
+        changed = True
+    return (url, post_data) if changed else None
+
+
+def replay_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """捕获到的请求头中可以原样重放的部分（去掉 HTTP/2 伪头和由请求上下文生成的头）"""
+    return {
+        name: value for name, value in headers.items()
+        if not name.startswith(':') and name.lower() not in REPLAY_DROP_HEADERS
+    }
+
+
+class ListingCapture:
+    """
+    收集页面上匹配列表接口的 JSON 响应
+
+    payloads: [{'url', 'method', 'headers', 'post_data', 'data', 'hotels'}]，
+    只保留 parse 能解析出酒店的响应，按到达顺序排列
+    """
+
+    def __init__(self, patterns: List[str], parse: Callable[[Any], List[Dict]]):
+        """
+        patterns: 列表接口 URL 的正则
+        parse: 把接口返回转换为酒店记录，解析不出酒店时返回空列表
+        """
+        self.patterns = [re.compile(p) for p in patterns]
+        self.parse = parse
+        self.payloads: List[Dict] = []
+        self._arrived = asyncio.Event()
+        self._tasks = set()
+
+    def matches(self, response) -> bool:
+        return (response.request.resource_type in ('xhr', 'fetch')
+                and any(p.search(response.url) for p in self.patterns))
+
+    def on_response(self, response):
+        """page.on('response') 的回调：事件回调不能阻塞，读取响应体放到任务中"""
+        if response.ok and self.matches(response):
+            task = asyncio.ensure_future(self._read(response))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _read(self, response):
+        request = response.request
+        try:
+            data = await response.json()
+            headers = await request.all_headers()
+        except Exception:
+            # 页面跳转后响应体不可再读，或响应不是 JSON
+            return
+        try:
+            hotels = self.parse(data)
+        except Exception:
+            return
+        if not hotels:
+            return
+        self.payloads.append({
+            'url': request.url,
+            'method': request.method,
+            'headers': headers,
+            'post_data': request.post_data,
+            'data': data,
+            'hotels': hotels,
+        })
+        self._arrived.set()
+
+    async def first(self, timeout: float) -> Optional[Dict]:
+        """第一个解析出酒店的接口响应，timeout 秒内没有到达时返回 None"""
+        if not self.payloads:
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.payloads[0]
+
+    async def close(self):
+        """取消还在读取的响应"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
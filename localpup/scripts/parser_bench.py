@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+LocalPup 解析性能基准
+把录制的 HTML 页面（fixtures/）加载到本地 Playwright 页面中（不访问网络），
+对列表卡片解析、Booking 详情提取、携程照片提取逐页计时。
+
+fixtures 目录结构（文件名任意，.html）：
+    fixtures/booking_listing/  Booking 搜索结果页
+    fixtures/booking_detail/   Booking 酒店详情页
+    fixtures/ctrip_listing/    携程列表页
+    fixtures/ctrip_photos/     携程酒店详情页（官方照片）
+
+可以从响应缓存（SCRAPER_CACHE=1 跑过一次后的 data/cache）导入真实页面：
+
+    python3 scripts/parser_bench.py import data/cache
+    python3 scripts/parser_bench.py
+"""
+
+import asyncio
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from scraper import BaseScraper, BookingScraper, BrowserManager, CtripScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 回归阈值：items_per_sec 下限，calls_per_item / ms_per_page 上限
+# 列表页的 item 为卡片，详情和照片的 item 为页面
+THRESHOLDS = {
+    'booking_listing_evaluate': {'min_items_per_sec': 200, 'max_calls_per_item': 1.0},
+    'booking_listing_dom': {'min_items_per_sec': 20, 'max_calls_per_item': 40},
+    'ctrip_listing_evaluate': {'min_items_per_sec': 200, 'max_calls_per_item': 1.0},
+    'booking_detail': {'max_ms_per_page': 1000, 'max_calls_per_item': 200},
+    'ctrip_photos': {'max_ms_per_page': 1000, 'max_calls_per_item': 200},
+}
+
+# 响应缓存中的页面按 URL 归类到 fixtures 子目录
+CACHE_URL_KINDS = [
+    ('booking.com/searchresults', 'booking_listing'),
+    ('booking.com/hotel/', 'booking_detail'),
+    ('hotels.ctrip.com/hotels/listPage', 'ctrip_listing'),
+    ('hotels.ctrip.com/hotels/', 'ctrip_photos'),
+]
+
+JS_HEAP_JS = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+class ProtocolCallCounter:
+    """统计发往浏览器驱动的协议消息数（每次 query/evaluate/get_attribute 等都是一条）"""
+
+    def __init__(self):
+        self.calls = 0
+        self.available = True
+
+    @contextmanager
+    def installed(self):
+        try:
+            from playwright._impl._connection import Connection
+            original = Connection._send_message_to_server
+        except (ImportError, AttributeError):
+            # Playwright 内部实现变化时只是不统计调用数
+            self.available = False
+            yield self
+            return
+
+        counter = self
+
+        def counting(*args, **kwargs):
+            counter.calls += 1
+            return original(*args, **kwargs)
+
+        Connection._send_message_to_server = counting
+        try:
+            yield self
+        finally:
+            Connection._send_message_to_server = original
+
+
+def fixture_url(kind: str, name: str) -> str:
+    """给每个 fixture 分配一个与线上结构一致的 URL，使选择器和页面拦截规则照常生效"""
+    if kind == 'booking_listing':
+        return f"{BookingScraper.BASE_URL}/searchresults.html?ss={name}"
+    if kind == 'booking_detail':
+        return f"{BookingScraper.BASE_URL}/hotel/cn/{name}.html"
+    if kind == 'ctrip_listing':
+        return f"{CtripScraper.BASE_URL}/hotels/listPage?city={name}"
+    return f"{CtripScraper.BASE_URL}/hotels/{name}.html"
+
+
+def load_fixtures(fixtures_dir: str, kind: str) -> Dict[str, str]:
+    """{url: html}"""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, kind, '*.html'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding='utf-8') as f:
+            pages[fixture_url(kind, name)] = f.read()
+    return pages
+
+
+def import_from_cache(cache_dir: str, fixtures_dir: str = FIXTURES_DIR) -> int:
+    """把响应缓存中的 HTML 页面按 URL 归类复制到 fixtures 目录，返回导入的页面数"""
+    imported = 0
+    for meta_path in glob.glob(os.path.join(cache_dir, '*', '*.json')):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if 'html' not in (meta.get('content_type') or ''):
+            continue
+        kind = next((k for pattern, k in CACHE_URL_KINDS if pattern in meta['url']), None)
+        if not kind:
+            continue
+        os.makedirs(os.path.join(fixtures_dir, kind), exist_ok=True)
+        key = os.path.basename(meta_path)[:-5]
+        shutil.copyfile(meta_path[:-5] + '.body', os.path.join(fixtures_dir, kind, f"{key[:16]}.html"))
+        imported += 1
+    return imported
+
+
+class ParserBenchmark:
+    """逐类 fixture 运行解析并统计耗时、调用数和内存峰值"""
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, repeat: int = 3,
+                 thresholds: Optional[Dict[str, Dict]] = None):
+        """
+        repeat: 每个页面重复解析的次数
+        thresholds: 覆盖默认的回归阈值
+        """
+        self.fixtures_dir = fixtures_dir
+        self.repeat = repeat
+        self.thresholds = thresholds or THRESHOLDS
+        self.counter = ProtocolCallCounter()
+        self.results: List[Dict] = []
+
+    async def _make_scraper(self, cls, manager: BrowserManager, pages: Dict[str, str],
+                            **options) -> BaseScraper:
+        """不限速、不拦截、不走 HTTP 的爬虫；页面请求由 fixture 应答，其余请求全部中止"""
+        scraper = cls(max_retries=1, rate_limit=0, block_resources=False, http_first=False,
+                      ready_timeout=5.0, concurrency=1, **options)
+        await scraper.init_browser(manager)
+
+        async def serve(route):
+            html = pages.get(route.request.url)
+            if html is None:
+                await route.abort()
+            else:
+                await route.fulfill(status=200, content_type='text/html; charset=utf-8', body=html)
+
+        await scraper.context.route('**/*', serve)
+        return scraper
+
+    async def _measure(self, name: str, scraper: BaseScraper, urls: List[str],
+                       run: Callable, count: Callable) -> Dict:
+        """逐页计时 run(url)，count(结果) 为该页解析出的条目数"""
+        elapsed, calls, items, js_heap = 0.0, 0, 0, 0
+        tracemalloc.start()
+        for _ in range(self.repeat):
+            for url in urls:
+                calls_before = self.counter.calls
+                started = time.perf_counter()
+                result = await run(url)
+                elapsed += time.perf_counter() - started
+                calls += self.counter.calls - calls_before
+                items += count(result)
+                async with scraper.page_pool.page() as page:
+                    js_heap = max(js_heap, await page.evaluate(JS_HEAP_JS))
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pages = len(urls) * self.repeat
+        result = {
+            'name': name,
+            'pages': pages,
+            'items': items,
+            'elapsed': round(elapsed, 4),
+            'ms_per_page': round(elapsed / pages * 1000, 2),
+            'items_per_sec': round(items / elapsed, 1) if elapsed else 0.0,
+            'calls_per_item': round(calls / items, 2) if items and self.counter.available else None,
+            'js_heap_peak_kb': js_heap // 1024,
+            'python_peak_kb': python_peak // 1024,
+            'thresholds': self.thresholds.get(name, {}),
+        }
+        result['violations'] = self._check(result)
+        result['status'] = 'PASS' if not result['violations'] else 'FAIL'
+        self.results.append(result)
+        return result
+
+    def _check(self, result: Dict) -> List[str]:
+        """返回未达到的阈值"""
+        if not result['items']:
+            return ['没有解析出任何条目']
+        violations = []
+        for key, limit in result['thresholds'].items():
+            kind, metric = key.split('_', 1)
+            value = result.get(metric)
+            if value is None:
+                continue
+            if kind == 'min' and value < limit:
+                violations.append(f"{metric}={value} < {limit}")
+            elif kind == 'max' and value > limit:
+                violations.append(f"{metric}={value} > {limit}")
+        return violations
+
+    async def _bench_listing(self, manager: BrowserManager, cls, kind: str, extract_mode: str):
+        pages = load_fixtures(self.fixtures_dir, kind)
+        if not pages:
+            return
+        scraper = await self._make_scraper(cls, manager, pages, extract_mode=extract_mode)
+
+        async def run(url):
+            async with scraper.page_pool.page() as page:
+                if not await scraper._retry_request(page, url, ready='card'):
+                    return []
+                return await scraper._extract_hotels(page, 0)
+
+        try:
+            await self._measure(f"{kind}_{extract_mode}", scraper, list(pages), run, len)
+        finally:
+            await scraper.close()
+
+    async def _bench_booking_detail(self, manager: BrowserManager):
+        pages = load_fixtures(self.fixtures_dir, 'booking_detail')
+        if not pages:
+            return
+        scraper = await self._make_scraper(BookingScraper, manager, pages)
+        try:
+            await self._measure('booking_detail', scraper, list(pages), scraper.get_hotel_details,
+                                lambda details: 0 if 'error' in details else 1)
+        finally:
+            await scraper.close()
+
+    async def _bench_ctrip_photos(self, manager: BrowserManager):
+        pages = load_fixtures(self.fixtures_dir, 'ctrip_photos')
+        if not pages:
+            return
+        scraper = await self._make_scraper(CtripScraper, manager, pages)
+        try:
+            await self._measure('ctrip_photos', scraper, list(pages), scraper.get_official_photos,
+                                lambda photos: 1 if photos else 0)
+        finally:
+            await scraper.close()
+
+    async def run(self) -> List[Dict]:
+        """运行所有有 fixture 的基准，返回结果列表"""
+        manager = BrowserManager()
+        try:
+            with self.counter.installed():
+                await self._bench_listing(manager, BookingScraper, 'booking_listing', 'evaluate')
+                await self._bench_listing(manager, BookingScraper, 'booking_listing', 'dom')
+                await self._bench_listing(manager, CtripScraper, 'ctrip_listing', 'evaluate')
+                await self._bench_booking_detail(manager)
+                await self._bench_ctrip_photos(manager)
+        finally:
+            await manager.close()
+        return self.results
+
+
+def print_results(results: List[Dict]):
+    print(f"{'基准':<28}{'页数':>6}{'条目':>7}{'ms/页':>10}{'条目/秒':>10}{'调用/条':>9}{'JS堆KB':>9}  状态")
+    for r in results:
+        calls = '-' if r['calls_per_item'] is None else r['calls_per_item']
+        print(f"{r['name']:<28}{r['pages']:>6}{r['items']:>7}{r['ms_per_page']:>10}"
+              f"{r['items_per_sec']:>10}{calls:>9}{r['js_heap_peak_kb']:>9}  {r['status']}")
+        for violation in r['violations']:
+            print(f"    ❌ {violation}")
+
+
+async def main():
+    if len(sys.argv) > 2 and sys.argv[1] == 'import':
+        count = import_from_cache(sys.argv[2])
+        print(f"已从 {sys.argv[2]} 导入 {count} 个页面到 {FIXTURES_DIR}")
+        return
+
+    results = await ParserBenchmark().run()
+    print_results(results)
+    with open('parser-bench.json', 'w', encoding='utf-8') as f:
+        json.dump({'results': results, 'generated_at': datetime.now().isoformat()},
+                  f, ensure_ascii=False, indent=2)
+    sys.exit(0 if all(r['status'] == 'PASS' for r in results) else 1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+LocalPup 价格 / 评分历史
+每次运行把各平台记录的 price、*_rating、*_review_count 追加到按日期和数据源分区的 Parquet 数据集：
+
+    data/history/date=2026-01-01/source=booking/run-20260101_020000.parquet
+    data/history/_runs.json     每次运行的日期、文件和行数（以 _ 开头，数据集扫描时忽略）
+
+- 比较两次运行只读这两次运行的文件（_runs.json 直接给出路径），按 hotel_key 连接，
+  先比较 row_hash（跟踪字段的哈希）筛出变化的行，再逐字段列出变化
+- 只比较两次运行都抓取了的 (source, city)：某个数据源出错或城市被 --min-age-hours 跳过时，
+  该分区记为"未抓取"，而不是其中所有酒店都被下架
+- 价格趋势等按时间范围的查询通过 date 分区裁剪，只读取范围内的文件
+
+用法：
+
+    python3 scripts/price_history.py diff                    # 最近两次运行
+    python3 scripts/price_history.py diff 20260101_020000 20260102_020000
+    python3 scripts/price_history.py trend https://www.booking.com/hotel/cn/xxx.html --since 2026-01-01
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+TRACKED_FIELDS = ('price', 'booking_rating', 'booking_review_count', 'ctrip_rating', 'ctrip_review_count')
+
+SCHEMA = pa.schema([
+    ('run_id', pa.string()),
+    ('scraped_at', pa.timestamp('s')),
+    ('hotel_key', pa.string()),
+    ('city', pa.string()),
+    ('name', pa.string()),
+    ('price', pa.int32()),
+    ('booking_rating', pa.float64()),
+    ('booking_review_count', pa.int32()),
+    ('ctrip_rating', pa.float64()),
+    ('ctrip_review_count', pa.int32()),
+    # 跟踪字段的哈希，比较两次运行时先按它筛出变化的行
+    ('row_hash', pa.int64()),
+])
+
+PARTITION_SCHEMA = pa.schema([('date', pa.string()), ('source', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+# 扫描数据集时使用完整的 schema：早期写入的文件没有 city 列，读出为 null
+DATASET_SCHEMA = pa.unify_schemas([SCHEMA, PARTITION_SCHEMA])
+
+
+def hotel_key(hotel: Mapping) -> Optional[str]:
+    """平台页面链接去掉查询参数，作为同一平台内酒店的稳定标识"""
+    url = hotel.get('booking_url') or hotel.get('ctrip_url')
+    return re.split(r'[?#]', url, maxsplit=1)[0].rstrip('/') if url else None
+
+
+def row_hash(values: Iterable) -> int:
+    """跟踪字段的稳定哈希（不使用进程间随机化的 hash()）"""
+    digest = hashlib.blake2b(repr(tuple(values)).encode('utf-8'), digest_size=8).digest()
+    return struct.unpack('<q', digest)[0]
+
+
+def _timestamp(value) -> Optional[datetime]:
+    """ISO 字符串或时间戳转为秒级 datetime（与 scraped_at 列的精度一致）"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value)
+    return value.replace(microsecond=0) if value else None
+
+
+class PriceHistory:
+    """按 date / source 分区的 Parquet 历史数据集"""
+
+    def __init__(self, root: str = 'data/history'):
+        self.root = root
+        self.manifest_path = os.path.join(root, '_runs.json')
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest: Dict[str, Dict] = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def runs(self) -> List[str]:
+        """所有运行的 run_id，从旧到新"""
+        return sorted(self.manifest)
+
+    def append(self, run_id: str, hotels: Iterable[Mapping], run_time: Optional[datetime] = None) -> int:
+        """
+        追加一次运行的各平台记录（合并前的 booking / ctrip 记录），返回写入的行数
+        同一 run_id 重复追加（断点续跑）时覆盖该次运行的文件
+        """
+        run_time = run_time or datetime.now()
+        run_date = run_time.date().isoformat()
+        # 翻页时同一酒店可能出现多次，保留最后一条
+        rows: Dict[str, Dict[str, Dict]] = {}
+        for hotel in hotels:
+            source, key = hotel.get('source'), hotel_key(hotel)
+            if not source or not key:
+                continue
+            values = [hotel.get(field) for field in TRACKED_FIELDS]
+            rows.setdefault(source, {})[key] = {
+                'run_id': run_id,
+                'scraped_at': _timestamp(hotel.get('scraped_at')) or _timestamp(run_time),
+                'hotel_key': key,
+                'city': hotel.get('city'),
+                'name': hotel.get('name'),
+                **dict(zip(TRACKED_FIELDS, values)),
+                'row_hash': row_hash(values),
+            }
+
+        files = {}
+        for source, by_key in rows.items():
+            directory = os.path.join(self.root, f"date={run_date}", f"source={source}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"run-{run_id}.parquet")
+            # 以 . 开头的临时文件不会被数据集扫描到
+            tmp = os.path.join(directory, f".run-{run_id}.parquet.tmp")
+            table = pa.Table.from_pylist(list(by_key.values()), schema=SCHEMA)
+            pq.write_table(table, tmp, compression='zstd')
+            os.replace(tmp, path)
+            files[source] = os.path.relpath(path, self.root)
+
+        count = sum(len(by_key) for by_key in rows.values())
+        self.manifest[run_id] = {'date': run_date, 'files': files, 'rows': count}
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+        return count
+
+    def load_run(self, run_id: str, source: Optional[str] = None,
+                 columns: Optional[List[str]] = None) -> pa.Table:
+        """读取一次运行的记录（只读该次运行的文件），附加 source 列"""
+        tables = []
+        for run_source, path in self.manifest[run_id]['files'].items():
+            if source and run_source != source:
+                continue
+            # 直接读单个文件，不从 date=/source= 目录推断分区列
+            parquet = pq.ParquetFile(os.path.join(self.root, path))
+            names = columns or SCHEMA.names
+            present = set(parquet.schema_arrow.names)
+            table = parquet.read(columns=[name for name in names if name in present])
+            # 早期写入的文件缺少的列（city）补为 null
+            for index, name in enumerate(names):
+                if name not in present:
+                    field = SCHEMA.field(name)
+                    table = table.add_column(index, field, pa.nulls(table.num_rows, field.type))
+            tables.append(table.append_column('source', pa.array([run_source] * table.num_rows, pa.string())))
+        if not tables:
+            names = columns or SCHEMA.names
+            return pa.Table.from_pylist([], schema=pa.schema(
+                [SCHEMA.field(name) for name in names] + [pa.field('source', pa.string())]))
+        return pa.concat_tables(tables)
+
+    @staticmethod
+    def _partition_keys(table: pa.Table) -> pa.Array:
+        """每行的 (source, city) 分区键"""
+        return pc.binary_join_element_wise(table['source'], pc.fill_null(table['city'], ''), '/')
+
+    @classmethod
+    def _partitions(cls, table: pa.Table) -> set:
+        return set(cls._partition_keys(table).unique().to_pylist())
+
+    def coverage(self, old_run: str, new_run: str, source: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """
+        两次运行抓取范围的差异：
+        {'not_scraped': 上一次有、这一次没有抓取的 [{'source', 'city'}],
+         'newly_scraped': 这一次新增抓取的 [{'source', 'city'}]}
+        """
+        columns = ['city']
+        old = self._partitions(self.load_run(old_run, source, columns))
+        new = self._partitions(self.load_run(new_run, source, columns))
+
+        def split(keys):
+            pairs = (key.split('/', 1) for key in sorted(keys))
+            return [{'source': source, 'city': city or None} for source, city in pairs]
+        return {'not_scraped': split(old - new), 'newly_scraped': split(new - old)}
+
+    def diff(self, old_run: str, new_run: str, source: Optional[str] = None) -> List[Dict]:
+        """
+        两次运行之间变化的酒店（只比较两次都抓取了的 (source, city)，其余见 coverage）：
+        [{'source', 'hotel_key', 'city', 'name', 'change': 'added' | 'removed' | 'changed',
+          'fields': {field: [旧值, 新值]}}]
+        """
+        columns = ['hotel_key', 'city', 'name', *TRACKED_FIELDS, 'row_hash']
+        old = self.load_run(old_run, source, columns)
+        new = self.load_run(new_run, source, columns)
+        shared = pa.array(sorted(self._partitions(old) & self._partitions(new)), pa.string())
+        old = old.filter(pc.is_in(self._partition_keys(old), value_set=shared))
+        new = new.filter(pc.is_in(self._partition_keys(new), value_set=shared))
+        joined = new.join(old, keys=['source', 'hotel_key'], join_type='full outer', right_suffix='_old')
+        unchanged = pc.equal(joined['row_hash'], joined['row_hash_old'])
+        changed = joined.filter(pc.invert(pc.fill_null(unchanged, False)))
+
+        changes = []
+        for row in changed.to_pylist():
+            if row['row_hash'] is None:
+                change = 'removed'
+            elif row['row_hash_old'] is None:
+                change = 'added'
+            else:
+                change = 'changed'
+            fields = {
+                field: [row[f'{field}_old'], row[field]]
+                for field in TRACKED_FIELDS
+                if row[f'{field}_old'] != row[field]
+            }
+            changes.append({
+                'source': row['source'],
+                'hotel_key': row['hotel_key'],
+                'city': row['city'] or row['city_old'],
+                'name': row['name'] or row['name_old'],
+                'change': change,
+                'fields': fields,
+            })
+        return changes
+
+    def scan(self, since: Optional[date] = None, until: Optional[date] = None, source: Optional[str] = None,
+             hotel_keys: Optional[List[str]] = None, columns: Optional[List[str]] = None) -> pa.Table:
+        """按日期范围（含两端）查询历史，日期和数据源条件只打开对应分区的文件"""
+        if not os.path.isdir(self.root):
+            return pa.Table.from_pylist([], schema=DATASET_SCHEMA)
+        dataset = ds.dataset(self.root, format='parquet', partitioning=PARTITIONING, schema=DATASET_SCHEMA)
+        condition = None
+        for expression in (
+            ds.field('date') >= since.isoformat() if since else None,
+            ds.field('date') <= until.isoformat() if until else None,
+            ds.field('source') == source if source else None,
+            ds.field('hotel_key').isin(hotel_keys) if hotel_keys else None,
+        ):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def trend(self, key: str, since: Optional[date] = None, until: Optional[date] = None) -> List[Dict]:
+        """一家酒店在时间范围内每次运行的价格和评分，按抓取时间排序"""
+        table = self.scan(since, until, hotel_keys=[key],
+                          columns=['run_id', 'scraped_at', 'source', *TRACKED_FIELDS])
+        return table.sort_by('scraped_at').to_pylist()
+
+
+def summarize(changes: List[Dict]) -> Dict[str, int]:
+    """{'added': n, 'removed': n, 'changed': n, 'price': n, ...}：各类变化和各字段变化的酒店数"""
+    summary = {'added': 0, 'removed': 0, 'changed': 0}
+    for change in changes:
+        summary[change['change']] += 1
+        if change['change'] == 'changed':
+            for field in change['fields']:
+                summary[field] = summary.get(field, 0) + 1
+    return summary
+
+
+def main():
+    history = PriceHistory(os.environ.get('SCRAPER_HISTORY_DIR', 'data/history'))
+    command = sys.argv[1] if len(sys.argv) > 1 else 'diff'
+
+    if command == 'diff':
+        runs = sys.argv[2:4] if len(sys.argv) > 3 else history.runs()[-2:]
+        if len(runs) < 2:
+            print("历史中少于两次运行，无法比较")
+            return
+        changes = history.diff(runs[0], runs[1])
+        print(f"{runs[0]} → {runs[1]}: {summarize(changes)}")
+        for partition in history.coverage(runs[0], runs[1])['not_scraped']:
+            print(f"  [not scraped] {partition['source']} {partition['city'] or '-'}")
+        for change in changes:
+            fields = ', '.join(f"{field} {old} → {new}" for field, (old, new) in change['fields'].items())
+            print(f"  [{change['change']}] {change['source']} {change['name']}: {fields}")
+    elif command == 'trend' and len(sys.argv) > 2:
+        since = None
+        if '--since' in sys.argv:
+            since = date.fromisoformat(sys.argv[sys.argv.index('--since') + 1])
+        for row in history.trend(sys.argv[2], since=since):
+            values = ', '.join(f"{field}={row[field]}" for field in TRACKED_FIELDS if row[field] is not None)
+            print(f"{row['scraped_at']} {row['source']} {values}")
+    else:
+        print(__doc__)
+
+
+if __name__ == '__main__':
+    main()
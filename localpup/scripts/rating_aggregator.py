@@ -0,0 +1,128 @@
+"""
+LocalPup 综合评分计算（Python 版）
+与 src/lib/rating-converter.ts 的 calculateWeightedScore / getRatingStats 语义一致，
+用 NumPy 对整批酒店一次性计算，在写入数据库前填充 overallRating / reviewCount。
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+
+# 平台权重配置（与 PLATFORM_WEIGHTS 保持一致）
+PLATFORM_WEIGHTS = {
+    'booking': 1.2,
+    'agoda': 1.0,
+    'hotelscom': 0.95,
+    'airbnb': 0.85,
+    'ctrip': 1.1,
+    'fliggy': 1.0,
+}
+
+# 5分制平台的额外调整（convert5To10 中的 platformAdjustment）
+PLATFORM_ADJUSTMENTS = {'ctrip': 0.2, 'fliggy': 0.1, 'airbnb': 0.0}
+
+
+def _to_fixed_1(values: np.ndarray) -> np.ndarray:
+    """等价于 parseFloat(x.toFixed(1))（正数四舍五入，而不是银行家舍入）"""
+    return np.floor(values * 10 + 0.5) / 10
+
+
+def confidence_factor(review_counts: np.ndarray) -> np.ndarray:
+    """置信度因子：基于评论数量，对应 getConfidenceFactor"""
+    counts = np.asarray(review_counts, dtype=float)
+    return np.select(
+        [counts <= 0, counts < 100, counts < 500, counts < 1000],
+        [0.5, 0.7, 0.8, 0.9],
+        default=1.0,
+    )
+
+
+def convert_5_to_10(ratings: np.ndarray, platform: str, review_counts: np.ndarray) -> np.ndarray:
+    """5分制 → 10分制（非线性分段），对应 convert5To10"""
+    clamped = np.clip(np.asarray(ratings, dtype=float), 1, 5)
+    adjusted = np.select(
+        [clamped >= 4.5, clamped >= 4.0, clamped >= 3.5],
+        [
+            9.0 + (clamped - 4.5) / 0.5,
+            8.0 + (clamped - 4.0) / 0.5,
+            7.0 + (clamped - 3.5) / 0.5,
+        ],
+        default=6.0 + (clamped - 3.0) / 0.5,
+    )
+    adjusted += PLATFORM_ADJUSTMENTS[platform] + confidence_factor(review_counts) * 0.15
+    return _to_fixed_1(np.clip(adjusted, 6.0, 10.0))
+
+
+def _columns(hotels: List[Dict]) -> Dict[str, np.ndarray]:
+    """把记录列表转换为每个平台的评分/评论数数组，缺失值为 0"""
+    columns = {}
+    for platform in PLATFORM_WEIGHTS:
+        columns[f'{platform}_rating'] = np.array(
+            [hotel.get(f'{platform}_rating') or 0 for hotel in hotels], dtype=float)
+        columns[f'{platform}_review_count'] = np.array(
+            [hotel.get(f'{platform}_review_count') or 0 for hotel in hotels], dtype=float)
+    return columns
+
+
+def weighted_scores(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """批量计算综合评分，对应 calculateWeightedScore"""
+    n = len(columns['booking_rating'])
+
+    # 1. 国内5分制平台（携程+飞猪）：评分和 / 2 / 4 * 2.5 * 10
+    domestic_total = np.zeros(n)
+    domestic_weight = np.zeros(n)
+    for platform in ('ctrip', 'fliggy'):
+        rating = columns[f'{platform}_rating']
+        counts = columns[f'{platform}_review_count']
+        present = rating > 0
+        domestic_total += np.where(present, convert_5_to_10(rating, platform, counts), 0)
+        domestic_weight += np.where(present, PLATFORM_WEIGHTS[platform] * confidence_factor(counts), 0)
+    domestic_average = np.where(domestic_weight > 0, domestic_total / 2, 0)
+    domestic_final = domestic_average / 4 * 2.5 * 10
+
+    # 2. 国际平台加权平均（Airbnb 先转换为10分制）
+    weighted_sum = np.zeros(n)
+    total_weight = np.zeros(n)
+    for platform in ('booking', 'agoda', 'hotelscom', 'airbnb'):
+        rating = columns[f'{platform}_rating']
+        counts = columns[f'{platform}_review_count']
+        present = rating > 0
+        score = convert_5_to_10(rating, platform, counts) if platform == 'airbnb' else rating
+        weight = np.where(present, PLATFORM_WEIGHTS[platform] * confidence_factor(counts), 0)
+        weighted_sum += np.where(present, score * weight, 0)
+        total_weight += weight
+    with np.errstate(invalid='ignore', divide='ignore'):
+        international_final = np.where(total_weight > 0, weighted_sum / total_weight, 0)
+
+    # 3. 综合：双平台 40% 国内 + 60% 国际，否则取有数据的一方，都没有时为 8.5
+    final = np.select(
+        [(domestic_final > 0) & (international_final > 0), international_final > 0, domestic_final > 0],
+        [domestic_final * 0.4 + international_final * 0.6, international_final, domestic_final],
+        default=8.5,
+    )
+
+    # 4. 与 Booking 评分相差超过 0.3 时拉回到 ±0.2 范围
+    booking_score = np.where(columns['booking_rating'] > 0, columns['booking_rating'], 8.8)
+    pulled = booking_score + np.where(final > booking_score, -0.2, 0.2)
+    final = np.where(np.abs(final - booking_score) > 0.3, pulled, final)
+
+    return _to_fixed_1(np.clip(final, 7.0, 9.8))
+
+
+def total_reviews(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """所有平台评论数之和，对应 getRatingStats().totalReviews"""
+    return sum(columns[f'{platform}_review_count'] for platform in PLATFORM_WEIGHTS).astype(int)
+
+
+def aggregate_ratings(hotels: List[Dict]) -> List[Dict]:
+    """为每条记录填充 overall_rating 和 review_count（原地修改并返回）"""
+    if not hotels:
+        return hotels
+    columns = _columns(hotels)
+    scores = weighted_scores(columns)
+    reviews = total_reviews(columns)
+    for hotel, score, count in zip(hotels, scores.tolist(), reviews.tolist()):
+        hotel['overall_rating'] = score
+        hotel['review_count'] = count
+    return hotels
@@ -0,0 +1,148 @@
+"""
+LocalPup 响应缓存
+把抓到的页面/接口响应按 URL 存到磁盘，带过期时间和按总大小的 LRU 淘汰
+
+调试选择器时打开回放模式（replay），所有请求只从缓存读取、不访问网络，
+重新解析一次缓存过的运行只需几秒，也可以离线跑解析测试。
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+
+# 只影响统计/会话、不影响页面内容的查询参数，不参与缓存键
+IGNORED_QUERY_PARAMS = {
+    'aid', 'label', 'sid', 'srpvid', 'sb', 'src', 'src_elem', 'ts',
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+}
+
+
+def cache_key(url: str, method: str = 'GET', ignored: Iterable[str] = IGNORED_QUERY_PARAMS) -> str:
+    """去掉无关参数并排序后的 URL 哈希"""
+    parts = urlparse(url)
+    ignored = set(ignored)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ignored)
+    normalized = urlunparse(parts._replace(query=urlencode(query), fragment=''))
+    return hashlib.sha256(f"{method.upper()} {normalized}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """磁盘响应缓存：<directory>/<key 前两位>/<key>.body + <key>.json（元数据）"""
+
+    def __init__(self, directory: str = 'data/cache', ttl_hours: float = 24.0,
+                 max_bytes: int = 512 * 1024 * 1024, replay: bool = False):
+        """
+        directory: 缓存目录
+        ttl_hours: 过期时间，回放模式下忽略
+        max_bytes: 缓存总大小上限，超过时淘汰最久未使用的条目
+        replay: 回放模式，只读缓存，未命中的请求直接失败
+        """
+        self.directory = directory
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        # key -> (大小, 最近使用时间)，启动时扫描目录建立
+        self._entries: Dict[str, Tuple[int, float]] = {}
+        self._total = 0
+        self._scan()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key[:2], key)
+        return f"{base}.body", f"{base}.json"
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.body'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                self._entries[name[:-5]] = (stat.st_size, stat.st_mtime)
+                self._total += stat.st_size
+
+    def _load_meta(self, key: str) -> Optional[Dict]:
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_valid(self, meta: Optional[Dict]) -> bool:
+        return meta is not None and (self.replay or time.time() - meta['stored_at'] <= self.ttl)
+
+    def contains(self, url: str, method: str = 'GET') -> bool:
+        """缓存中是否有未过期的响应（不读取正文，不计入命中统计）"""
+        key = cache_key(url, method)
+        return key in self._entries and self._is_valid(self._load_meta(key))
+
+    def get(self, url: str, method: str = 'GET') -> Optional[Tuple[Dict, bytes]]:
+        """返回 (元数据, 正文)，未命中或已过期时返回 None"""
+        key = cache_key(url, method)
+        meta = self._load_meta(key) if key in self._entries else None
+        if not self._is_valid(meta):
+            self.misses += 1
+            return None
+        body_path, _ = self._paths(key)
+        try:
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            self._forget(key)
+            self.misses += 1
+            return None
+        now = time.time()
+        os.utime(body_path, (now, now))
+        self._entries[key] = (len(body), now)
+        self.hits += 1
+        return meta, body
+
+    def put(self, url: str, body: bytes, status: int = 200,
+            content_type: Optional[str] = None, method: str = 'GET'):
+        """写入一条响应，超过总大小上限时淘汰最久未使用的条目"""
+        if self.replay:
+            return
+        key = cache_key(url, method)
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        # 先写临时文件再替换，避免中断时留下半个响应
+        with open(f"{body_path}.tmp", 'wb') as f:
+            f.write(body)
+        os.replace(f"{body_path}.tmp", body_path)
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'status': status, 'content_type': content_type,
+                       'stored_at': time.time()}, f, ensure_ascii=False)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+        old_size, _ = self._entries.get(key, (0, 0))
+        self._entries[key] = (len(body), time.time())
+        self._total += len(body) - old_size
+        self._evict()
+
+    def _forget(self, key: str):
+        size, _ = self._entries.pop(key, (0, 0))
+        self._total -= size
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            self._forget(key)
+            if self._total <= self.max_bytes:
+                break
+
+    def __len__(self) -> int:
+        return len(self._entries)
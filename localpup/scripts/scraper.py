@@ -5,17 +5,37 @@ LocalPup 爬虫系统
 增强版：更好的错误处理、备用选择器、详细的日志记录
 """
 
+import argparse
 import asyncio
 import json
 import os
+import random
 import re
+import sys
+import time
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from urllib.parse import urljoin, quote
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional, Tuple, Union, Callable, Awaitable, AsyncIterator
+from urllib.parse import urljoin, quote, urlparse
 
+import aiohttp
 from playwright.async_api import async_playwright, Page, Playwright
 
+from checkpoint import RunJournal
+from crawl_schedule import CITIES, CrawlState, plan_jobs, resolve_city
+from hotel_matcher import resolve_hotels
+from hotel_record import HotelRecord
+from image_check import upgrade_unvalidated, validate_images
+from image_derivatives import DerivativePipeline, DerivativeStore
+from http_fetch import HttpFetcher, extract_cards
+from rating_aggregator import aggregate_ratings
+from jsonl_io import JsonlWriter, read_records, point_latest
+from listing_api import ListingCapture, dig, paginate_request, replay_headers
+from response_cache import ResponseCache
+from selector_stats import SelectorStats
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -24,70 +44,1380 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class BaseScraper:
+# 在页面内一次性提取所有卡片字段，避免逐字段的 CDP 往返
+EXTRACT_CARDS_JS = """
+({cardSelectors, fields, attributes}) => {
+    // selectorHits: {field: {selector: 命中的卡片数}}，用于统计备用选择器
+    const selectorHits = {};
+    const pick = (root, field, selectors) => {
+        for (const sel of selectors) {
+            try {
+                const el = root.querySelector(sel);
+                if (el) {
+                    const hits = selectorHits[field] = selectorHits[field] || {};
+                    hits[sel] = (hits[sel] || 0) + 1;
+                    return el;
+                }
+            } catch (e) {}
+        }
+        return null;
+    };
+    let cards = [];
+    let cardSelector = null;
+    for (const sel of cardSelectors) {
+        let found;
+        try { found = document.querySelectorAll(sel); } catch (e) { continue; }
+        if (found.length) {
+            cards = Array.from(found);
+            cardSelector = sel;
+            break;
+        }
+    }
+    const raw = cards.map(card => {
+        const out = {};
+        for (const [field, selectors] of Object.entries(fields)) {
+            const el = pick(card, field, selectors);
+            const attr = attributes[field];
+            out[field] = el ? (attr ? el.getAttribute(attr) : el.innerText) : null;
+        }
+        return out;
+    });
+    return {cardSelector, cards: raw, selectorHits};
+}
+"""
+
+# 点击"下一页"后第一张卡片的内容变化，说明新的一页已经渲染
+CARD_CHANGED_JS = """
+([selector, before]) => {
+    const el = document.querySelector(selector);
+    return !!el && el.innerText !== before;
+}
+"""
+
+# 滚动后卡片数增加，说明懒加载的卡片已经渲染
+CARD_COUNT_GREATER_JS = """
+([selector, count]) => document.querySelectorAll(selector).length > count
+"""
+
+
+# 常见的统计/广告脚本域名，任何页面都不需要
+TRACKER_URL_PATTERNS = [
+    r'google-analytics\.com',
+    r'googletagmanager\.com',
+    r'doubleclick\.net',
+    r'googlesyndication\.com',
+    r'facebook\.(net|com)/tr',
+    r'connect\.facebook\.net',
+    r'hotjar\.com',
+    r'criteo\.(com|net)',
+    r'bat\.bing\.com',
+    r'cnzz\.com',
+    r'hm\.baidu\.com',
+]
+
+
+class ResourcePolicy:
+    """请求拦截策略：按资源类型和 URL 模式决定放行或拦截"""
+
+    def __init__(self, block_types: Optional[List[str]] = None,
+                 block_patterns: Optional[List[str]] = None,
+                 allow_patterns: Optional[List[str]] = None,
+                 page_patterns: Optional[List[str]] = None):
+        """
+        block_types: 拦截的资源类型（image/font/media/stylesheet 等）
+        block_patterns: 无论资源类型都拦截的 URL 正则
+        allow_patterns: 始终放行的 URL 正则，优先级最高
+        page_patterns: 资源类型拦截只在这些页面上生效，为空表示所有页面
+        """
+        self.block_types = set(block_types or [])
+        self.block_patterns = [re.compile(p) for p in (block_patterns or [])]
+        self.allow_patterns = [re.compile(p) for p in (allow_patterns or [])]
+        self.page_patterns = [re.compile(p) for p in (page_patterns or [])]
+        self.blocked = 0
+
+    def should_block(self, resource_type: str, url: str, page_url: str = '') -> bool:
+        """判断请求是否应被拦截"""
+        if any(p.search(url) for p in self.allow_patterns):
+            return False
+        if any(p.search(url) for p in self.block_patterns):
+            return True
+        if resource_type not in self.block_types:
+            return False
+        return not self.page_patterns or any(p.search(page_url) for p in self.page_patterns)
+
+
+# 阶段耗时直方图的桶上限（秒）
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class ScrapeMetrics:
+    """
+    运行指标：各阶段耗时直方图（navigate/wait/query/parse/http/detail/write/merge）和计数器
+    （重试、备用选择器命中、传输字节数等），结束时导出为 Prometheus 文本或 JSON 摘要
+    """
+
+    def __init__(self, prefix: str = 'localpup_scraper', buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        # (stage, source) -> {'counts': 每个桶的计数, 'count', 'sum', 'max'}
+        self.histograms: Dict[Tuple[str, str], Dict] = {}
+        # (name, 排序后的标签) -> 值
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.started = time.time()
+
+    def observe(self, stage: str, seconds: float, source: str = ''):
+        """记录一次阶段耗时"""
+        hist = self.histograms.get((stage, source))
+        if hist is None:
+            hist = {'counts': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            self.histograms[(stage, source)] = hist
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                hist['counts'][i] += 1
+                break
+        hist['count'] += 1
+        hist['sum'] += seconds
+        hist['max'] = max(hist['max'], seconds)
+
+    @contextmanager
+    def timer(self, stage: str, source: str = ''):
+        """计时 with 块（块内可以 await）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, source)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """计数器加 value"""
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _quantile(self, hist: Dict, q: float) -> float:
+        """按桶估计分位数（取所在桶的上限，超出最大桶时取最大值）"""
+        rank = q * hist['count']
+        seen = 0
+        for bound, count in zip(self.buckets, hist['counts']):
+            seen += count
+            if seen >= rank:
+                return min(bound, hist['max'])
+        return hist['max']
+
+    def summary(self) -> Dict:
+        """JSON 摘要"""
+        stages = []
+        for (stage, source), hist in sorted(self.histograms.items()):
+            stages.append({
+                'stage': stage,
+                'source': source,
+                'count': hist['count'],
+                'total': round(hist['sum'], 3),
+                'avg': round(hist['sum'] / hist['count'], 4) if hist['count'] else 0.0,
+                'p50': self._quantile(hist, 0.5),
+                'p95': self._quantile(hist, 0.95),
+                'max': round(hist['max'], 4),
+            })
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())]
+        return {
+            'started_at': datetime.fromtimestamp(self.started).isoformat(),
+            'elapsed': round(time.time() - self.started, 2),
+            'stages': stages,
+            'counters': counters,
+        }
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> str:
+        if not labels:
+            return ''
+        pairs = []
+        for key, value in labels.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{key}="{value}"')
+        return '{' + ','.join(pairs) + '}'
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式（可交给 node_exporter 的 textfile collector）"""
+        lines = []
+        name = f"{self.prefix}_stage_seconds"
+        lines.append(f"# HELP {name} 各阶段耗时")
+        lines.append(f"# TYPE {name} histogram")
+        for (stage, source), hist in sorted(self.histograms.items()):
+            labels = {'stage': stage, 'source': source}
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels({**labels, 'le': str(bound)})} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels({**labels, 'le': '+Inf'})} {hist['count']}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist['sum']:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist['count']}")
+
+        for counter in sorted({name for name, _ in self.counters}):
+            full_name = f"{self.prefix}_{counter}"
+            lines.append(f"# TYPE {full_name} counter")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name == counter:
+                    lines.append(f"{full_name}{self._labels(dict(labels))} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """按扩展名写入 .prom（Prometheus 文本）或 .json（摘要），先写临时文件再替换"""
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.summary(), ensure_ascii=False, indent=2)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def log_summary(self):
+        for stage in self.summary()['stages']:
+            logger.info(
+                f"[指标] {stage['source'] or '-'}/{stage['stage']}: {stage['count']} 次，"
+                f"共 {stage['total']}s，平均 {stage['avg']}s，p95≈{stage['p95']}s，max {stage['max']}s"
+            )
+
+
+# 表示被限流或被拦截的状态码
+THROTTLE_STATUSES = (403, 429)
+
+
+class _HostBucket:
+    """单个域名的令牌桶状态"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.lock = asyncio.Lock()
+
+
+class AdaptiveRateLimiter:
+    """
+    按域名的令牌桶限速，所有页面和爬虫共用
+
+    速率按 AIMD 调整：每次正常响应加 increase（不超过 max_rate）；
+    遇到 429/403/验证码时速率乘以 decrease，并暂停该域名一段时间，
+    连续被拦截时暂停时间指数增长（带随机抖动），服务端给出 Retry-After 时取较大者。
+    """
+
+    def __init__(self, rate: float = 0.5, burst: float = 1.0, min_rate: float = 0.05,
+                 max_rate: Optional[float] = None, increase: float = 0.05, decrease: float = 0.5,
+                 base_backoff: float = 5.0, max_backoff: float = 300.0):
+        """
+        rate: 每个域名的初始速率（次/秒），不大于 0 表示不限速
+        burst: 令牌桶容量，允许的突发请求数
+        min_rate / max_rate: 速率调整范围，max_rate 默认为 rate 的 4 倍
+        increase: 每次正常响应增加的速率
+        decrease: 被限流时速率的乘数
+        base_backoff / max_backoff: 被限流后暂停时间的初始值和上限（秒）
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0.0
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._buckets: Dict[str, _HostBucket] = {}
+
+    def _bucket(self, url: str) -> _HostBucket:
+        host = urlparse(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _HostBucket(self.rate, self.burst)
+        return bucket
+
+    async def acquire(self, url: str):
+        """等待直到该域名有可用令牌（暂停期间一直等待）"""
+        if self.rate <= 0:
+            return
+        bucket = self._bucket(url)
+        async with bucket.lock:
+            while True:
+                now = time.monotonic()
+                if now < bucket.blocked_until:
+                    await asyncio.sleep(bucket.blocked_until - now)
+                    continue
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+                bucket.updated = now
+                if bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+
+    def record_success(self, url: str):
+        """正常响应：加性增加速率"""
+        if self.rate <= 0:
+            return
+        bucket = self._bucket(url)
+        bucket.strikes = 0
+        bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def record_throttle(self, url: str, retry_after: Optional[float] = None) -> float:
+        """被限流或拦截：乘性降低速率并暂停该域名，返回暂停秒数"""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._bucket(url)
+        bucket.strikes += 1
+        bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+        bucket.tokens = 0.0
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (bucket.strikes - 1))
+        delay += random.uniform(0, delay / 2)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + delay)
+        logger.warning(f"[限速] {urlparse(url).netloc} 被限流，速率降至 {bucket.rate:.2f}/s，暂停 {delay:.1f}s")
+        return delay
+
+    def rates(self) -> Dict[str, float]:
+        """各域名当前的速率"""
+        return {host: round(bucket.rate, 3) for host, bucket in self._buckets.items()}
+
+
+def _retry_after(headers) -> Optional[float]:
+    """解析 Retry-After（秒数形式），无法解析时返回 None"""
+    value = (headers or {}).get('Retry-After') or (headers or {}).get('retry-after')
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class PagePool:
+    """页面池：最多同时打开 size 个页面，用完归还复用"""
+
+    def __init__(self, context, size: int):
+        self.context = context
+        self.size = size
+        self._semaphore = asyncio.Semaphore(size)
+        self._idle: List[Page] = []
+        self._pages: List[Page] = []
+
+    @asynccontextmanager
+    async def page(self):
+        """借用一个页面，退出时自动归还"""
+        async with self._semaphore:
+            page = self._idle.pop() if self._idle else await self._new_page()
+            try:
+                yield page
+            finally:
+                if page.is_closed():
+                    self._pages.remove(page)
+                else:
+                    self._idle.append(page)
+
+    @asynccontextmanager
+    async def dedicated(self):
+        """
+        在池外单独打开一个页面，退出时关闭
+
+        用于跨 yield 长时间持有的页面（携程列表页）：它不占用池中名额，
+        持有期间消费方抓取详情时仍能借到池中页面，concurrency=1 时也不会互相等待
+        """
+        page = await self.context.new_page()
+        try:
+            yield page
+        finally:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    async def _new_page(self) -> Page:
+        page = await self.context.new_page()
+        self._pages.append(page)
+        return page
+
+    async def close(self):
+        """关闭池中所有页面"""
+        for page in self._pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._pages.clear()
+        self._idle.clear()
+
+
+class BrowserManager:
+    """
+    共享浏览器管理器
+
+    多个爬虫从同一个 Chromium 借用各自独立的 context，避免重复冷启动。
+    设置 ws_endpoint（browser_type.launch_server 导出的地址）或 cdp_url
+    （--remote-debugging-port 暴露的地址）时连接常驻浏览器，关闭时只断开连接。
+    """
+
+    LAUNCH_ARGS = [
+        '--no-sandbox',
+        '--disable-dev-shm-usage',
+        '--disable-gpu',
+        '--disable-web-security',
+        '--disable-features=IsolateOrigins,SitePerProcess'
+    ]
+
+    def __init__(self, ws_endpoint: Optional[str] = None, cdp_url: Optional[str] = None,
+                 headless: bool = True, remote_debugging_port: Optional[int] = None):
+        """
+        ws_endpoint / cdp_url: 常驻浏览器地址，默认读取环境变量
+            SCRAPER_BROWSER_WS / SCRAPER_BROWSER_CDP
+        remote_debugging_port: 本地启动时开放调试端口，供其他进程通过 CDP 复用
+        """
+        self.ws_endpoint = ws_endpoint or os.environ.get('SCRAPER_BROWSER_WS')
+        self.cdp_url = cdp_url or os.environ.get('SCRAPER_BROWSER_CDP')
+        self.headless = headless
+        self.remote_debugging_port = remote_debugging_port
+        self.playwright: Optional[Playwright] = None
+        self.browser = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_remote(self) -> bool:
+        return bool(self.ws_endpoint or self.cdp_url)
+
+    async def start(self):
+        """启动或连接浏览器，重复调用只生效一次"""
+        async with self._lock:
+            if self.browser and self.browser.is_connected():
+                return
+            started = time.monotonic()
+            if not self.playwright:
+                self.playwright = await async_playwright().start()
+            if self.ws_endpoint:
+                self.browser = await self.playwright.chromium.connect(self.ws_endpoint)
+            elif self.cdp_url:
+                self.browser = await self.playwright.chromium.connect_over_cdp(self.cdp_url)
+            else:
+                args = list(self.LAUNCH_ARGS)
+                if self.remote_debugging_port:
+                    args.append(f'--remote-debugging-port={self.remote_debugging_port}')
+                self.browser = await self.playwright.chromium.launch(headless=self.headless, args=args)
+            mode = '连接' if self.is_remote else '启动'
+            logger.info(f"[Browser] {mode}浏览器耗时 {time.monotonic() - started:.2f}s")
+
+    async def new_context(self, **options):
+        """借用一个新的浏览器上下文"""
+        await self.start()
+        return await self.browser.new_context(**options)
+
+    async def close(self):
+        """关闭本地浏览器；远程浏览器只断开连接，保持常驻"""
+        if self.browser:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+class DetailFetcher:
+    """
+    详情抓取阶段
+
+    URL 放入 asyncio.Queue，由固定数量的 worker 消费；单个 URL 失败时按指数退避
+    （带随机抖动）重试，结束后可通过 summary() 获取吞吐量和延迟统计。
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable], workers: int = 4, retries: int = 2,
+                 backoff: float = 1.0, is_failure: Optional[Callable[[any], bool]] = None,
+                 tag: str = 'Detail', metrics: Optional[ScrapeMetrics] = None,
+                 on_success: Optional[Callable[[str, any], None]] = None):
+        """
+        fetch: 抓取单个 URL 的协程函数，抛出异常或 is_failure 为真都视为失败
+        retries: 每个 URL 首次失败后的最多重试次数
+        backoff: 第一次重试前的等待秒数，之后每次翻倍
+        metrics: 记录每次抓取耗时（detail 阶段）和重试次数
+        on_success: 每个 URL 抓取成功后立即调用 (url, 结果)，用于写入运行日志
+        """
+        self.fetch = fetch
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.is_failure = is_failure or (lambda result: False)
+        self.tag = tag
+        self.metrics = metrics
+        self.on_success = on_success
+        self.latencies: List[float] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.elapsed = 0.0
+
+    async def run(self, urls: List[str]) -> Dict[str, any]:
+        """抓取所有 URL，返回 {url: 结果}；最终失败的 URL 保留最后一次的结果"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for url in urls:
+            queue.put_nowait(url)
+        results: Dict[str, any] = {}
+
+        started = time.monotonic()
+        workers = [asyncio.create_task(self._worker(queue, results))
+                   for _ in range(min(self.workers, len(urls)))]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self.elapsed = time.monotonic() - started
+
+        self._log_summary()
+        return results
+
+    async def _worker(self, queue: asyncio.Queue, results: Dict[str, any]):
+        while True:
+            url = await queue.get()
+            try:
+                results[url] = await self._fetch_with_retry(url)
+            except Exception as e:
+                # worker 退出后剩余的 URL 无人消费，queue.join() 会一直等待
+                logger.error(f"[{self.tag}] 处理 {url} 出错: {e}")
+            finally:
+                queue.task_done()
+
+    async def _fetch_with_retry(self, url: str):
+        result = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                if self.metrics:
+                    self.metrics.inc('retries_total', source=self.tag.lower(), stage='detail')
+                delay = self.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            started = time.monotonic()
+            try:
+                result = await self.fetch(url)
+                failed = self.is_failure(result)
+            except Exception as e:
+                logger.warning(f"[{self.tag}] 抓取失败 {url}: {e}")
+                failed = True
+            self.latencies.append(time.monotonic() - started)
+            if self.metrics:
+                self.metrics.observe('detail', self.latencies[-1], self.tag.lower())
+            if not failed:
+                self.succeeded += 1
+                if self.on_success:
+                    try:
+                        self.on_success(url, result)
+                    except Exception as e:
+                        logger.error(f"[{self.tag}] 记录抓取结果失败 {url}: {e}")
+                return result
+        self.failed += 1
+        logger.error(f"[{self.tag}] 重试 {self.retries} 次后仍失败: {url}")
+        return result
+
+    def summary(self) -> Dict:
+        """吞吐量与延迟统计"""
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        total = self.succeeded + self.failed
+        return {
+            'total': total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'retried': self.retried,
+            'elapsed': round(self.elapsed, 2),
+            'throughput': round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            'latency_p50': round(percentile(0.5), 2),
+            'latency_p95': round(percentile(0.95), 2),
+            'latency_max': round(latencies[-1], 2) if latencies else 0.0,
+        }
+
+    def _log_summary(self):
+        stats = self.summary()
+        logger.info(
+            f"[{self.tag}] 详情抓取完成: {stats['succeeded']}/{stats['total']} 成功，"
+            f"重试 {stats['retried']} 次，用时 {stats['elapsed']}s，"
+            f"{stats['throughput']} 个/秒，延迟 p50={stats['latency_p50']}s "
+            f"p95={stats['latency_p95']}s max={stats['latency_max']}s"
+        )
+
+
+def normalize_url(url: str) -> str:
+    """去掉查询参数和锚点，作为酒店页面的稳定标识"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}{parsed.path}".rstrip('/')
+
+
+# 最近一次运行的输出（main() 维护的软链接），以及旧版本的合并 JSON
+LATEST_OUTPUTS = ('data/latest_hotels.jsonl', 'data/latest_hotels.jsonl.gz', 'data/all_hotels.json')
+
+
+# 详情页抓取的字段：跳过详情的酒店从已知索引中补回，输出文件和数据库中不会丢失
+DETAIL_FIELDS = ('address', 'description', 'amenities', 'images', 'photos')
+
+
+class KnownHotels:
+    """已知酒店索引：记录每个酒店页面（bookingUrl / ctripUrl）上次抓取详情的时间和详情字段"""
+
+    def __init__(self, last_scraped: Optional[Dict[str, datetime]] = None,
+                 details: Optional[Dict[str, Dict]] = None):
+        self.last_scraped = last_scraped or {}
+        self.details = details or {}
+
+    def __len__(self) -> int:
+        return len(self.last_scraped)
+
+    def add(self, url: Optional[str], scraped_at: Optional[datetime], details: Optional[Dict] = None):
+        if not url or not scraped_at:
+            return
+        key = normalize_url(url)
+        if key not in self.last_scraped or self.last_scraped[key] < scraped_at:
+            self.last_scraped[key] = scraped_at
+            if details:
+                self.details[key] = details
+
+    def restore(self, hotel: Dict, url: str):
+        """
+        把上次抓取详情的时间和详情字段补回跳过详情的记录：
+        否则输出文件中没有 details_scraped_at，下一次运行从文件加载时会把它们全部重新抓取
+        """
+        key = normalize_url(url)
+        scraped_at = self.last_scraped.get(key)
+        if scraped_at is None:
+            return
+        hotel['details_scraped_at'] = scraped_at.isoformat()
+        for field, value in self.details.get(key, {}).items():
+            if not hotel.get(field):
+                hotel[field] = value
+
+    def is_fresh(self, url: str, ttl: timedelta) -> bool:
+        """详情在 ttl 内抓取过则无需重新抓取"""
+        scraped_at = self.last_scraped.get(normalize_url(url))
+        return scraped_at is not None and datetime.now() - scraped_at < ttl
+
+    @classmethod
+    def from_database(cls, database_url: str) -> 'KnownHotels':
+        """从 Hotel 表读取 lastScrapedAt"""
+        import psycopg2
+
+        known = cls()
+        conn = psycopg2.connect(database_url)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    'SELECT "bookingUrl", "ctripUrl", "lastScrapedAt", "address", "description", "amenities" '
+                    'FROM "Hotel" WHERE "lastScrapedAt" IS NOT NULL'
+                )
+                for booking_url, ctrip_url, scraped_at, address, description, amenities in cur:
+                    # Prisma 以 UTC 存储不带时区的时间，转换为本地时间与 datetime.now() 比较
+                    scraped_at = scraped_at.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+                    # 图片已在 HotelImage 中，不需要补回
+                    details = {'address': address, 'description': description, 'amenities': amenities}
+                    details = {field: value for field, value in details.items() if value}
+                    known.add(booking_url, scraped_at, details)
+                    known.add(ctrip_url, scraped_at, details)
+        finally:
+            conn.close()
+        return known
+
+    @classmethod
+    def from_file(cls, path: str) -> 'KnownHotels':
+        """从上一次的输出文件（JSON 或 JSONL）读取 details_scraped_at"""
+        known = cls()
+        for hotel in read_records(path):
+            scraped_at = hotel.get('details_scraped_at')
+            if not scraped_at:
+                continue
+            scraped_at = datetime.fromisoformat(scraped_at)
+            details = {field: hotel[field] for field in DETAIL_FIELDS if hotel.get(field)}
+            known.add(hotel.get('booking_url'), scraped_at, details)
+            known.add(hotel.get('ctrip_url'), scraped_at, details)
+        return known
+
+    @classmethod
+    def load(cls, database_url: Optional[str] = None,
+             fallback_files: Tuple[str, ...] = LATEST_OUTPUTS) -> 'KnownHotels':
+        """优先读数据库，失败时退回上一次的输出文件，都不可用时返回空索引"""
+        database_url = database_url or os.environ.get('DATABASE_URL')
+        if database_url:
+            try:
+                known = cls.from_database(database_url)
+                logger.info(f"[增量] 从数据库加载 {len(known)} 个已知酒店页面")
+                return known
+            except Exception as e:
+                logger.warning(f"[增量] 读取数据库失败: {e}")
+        for path in fallback_files:
+            if not os.path.exists(path):
+                continue
+            try:
+                known = cls.from_file(path)
+                logger.info(f"[增量] 从 {path} 加载 {len(known)} 个已知酒店页面")
+                return known
+            except Exception as e:
+                logger.warning(f"[增量] 读取 {path} 失败: {e}")
+        return cls()
+
+
+# 就绪条件：SELECTORS 键名或 CSS 选择器（单个或列表，任一出现即就绪），或接收 page 的异步谓词
+ReadyCondition = Union[str, List[str], Callable[[Page], Awaitable[bool]], None]
+
+
+class BaseScraper(ABC):
     """基础爬虫类"""
 
-    def __init__(self, max_retries: int = 3, request_delay: float = 2.0):
+    LOG_TAG = 'Base'
+    SELECTORS: Dict[str, List[str]] = {}
+    # 列表卡片需要提取的字段
+    CARD_FIELDS: List[str] = []
+    # 取属性而不是文本的字段
+    FIELD_ATTRIBUTES: Dict[str, str] = {}
+    # 默认拦截策略：只读文本和 src 属性，不需要下载图片/字体/媒体
+    BLOCKED_RESOURCE_TYPES: List[str] = ['image', 'font', 'media']
+    BLOCKED_URL_PATTERNS: List[str] = TRACKER_URL_PATTERNS
+    ALLOWED_URL_PATTERNS: List[str] = []
+    # 资源类型拦截生效的页面（如搜索结果页），为空表示所有页面
+    BLOCK_ON_PAGES: List[str] = []
+    # 验证码/拦截页的特征：URL 正则和页面元素，出现时视为被限流
+    BLOCK_PAGE_URL_PATTERNS: List[str] = [r'captcha', r'/verify', r'challenge']
+    BLOCK_PAGE_MARKERS: List[str] = [
+        '#px-captcha',
+        'iframe[src*="captcha"]',
+        '[class*="captcha"]',
+        '[id*="captcha"]',
+    ]
+    # 启用响应缓存时经过缓存读写的资源类型，其余类型在回放模式下直接中止
+    CACHED_RESOURCE_TYPES: List[str] = ['document', 'xhr', 'fetch', 'script']
+    # 列表页背后的 JSON 接口：URL 正则、接口返回中酒店列表的路径，以及各字段的路径（按优先级排序，
+    # 取到的值转为字符串后与卡片原始字段一样交给 _build_hotel）
+    LISTING_API_PATTERNS: List[str] = []
+    LISTING_API_ITEMS: List[str] = []
+    API_FIELDS: Dict[str, List[str]] = {}
+    # 页面内容就绪后再等待列表接口响应的时间（秒），首屏由服务端直出、没有接口请求时回退到 DOM
+    LISTING_CAPTURE_GRACE = 1.0
+    CONTEXT_OPTIONS = {
+        'viewport': {'width': 1920, 'height': 1080},
+        'user_agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'locale': 'zh-CN',
+        'timezone_id': 'Asia/Shanghai',
+    }
+
+    def __init__(self, max_retries: int = 3, request_delay: float = 2.0,
+                 concurrency: int = 4, rate_limit: Optional[float] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 extract_mode: str = 'evaluate',
+                 resource_policy: Optional[ResourcePolicy] = None,
+                 block_resources: bool = True,
+                 ready_timeout: float = 15.0, politeness_delay: float = 0.0,
+                 known_hotels: Optional[KnownHotels] = None, detail_ttl_hours: float = 24 * 7,
+                 http_first: bool = True, response_cache: Optional[ResponseCache] = None,
+                 metrics: Optional[ScrapeMetrics] = None,
+                 selector_stats: Optional[SelectorStats] = None,
+                 checkpoint: Optional[RunJournal] = None,
+                 capture_api: bool = True):
+        """
+        concurrency: 同时打开的页面数（页面池大小）
+        rate_limit: 每个域名的初始请求速率（次/秒），默认 1 / request_delay，0 表示不限速
+        rate_limiter: 共用的自适应限速器，传入时忽略 rate_limit
+        extract_mode: 'evaluate' 在页面内一次提取全部卡片；'dom' 逐元素查询
+        resource_policy: 自定义请求拦截策略，默认按类属性构造
+        block_resources: 为 False 时不安装任何拦截
+        ready_timeout: 等待页面内容就绪的超时（秒）
+        politeness_delay: 每个页面处理完后的固定礼貌性停顿（秒），默认不停顿
+        known_hotels: 增量模式下的已知酒店索引，为空时总是抓取详情
+        detail_ttl_hours: 详情在该时长内抓取过则跳过，列表页的价格/评分仍会刷新
+        http_first: 列表页先用 aiohttp 直接请求，解析不到卡片时才打开浏览器页面
+        response_cache: 磁盘响应缓存，浏览器和 HTTP 请求都经过它读写；回放模式下不访问网络
+        metrics: 运行指标，多个爬虫可共用一个实例，按 source 标签区分
+        selector_stats: 选择器命中统计，查找时跳过已失效的选择器，为空时按 SELECTORS 声明顺序
+        checkpoint: 断点续跑日志，跳过已完成的列表页和详情
+        capture_api: 浏览器列表页优先解析页面发出的 JSON 接口响应（LISTING_API_PATTERNS），
+                     翻页时重放该接口请求；回放模式下重放请求不经过缓存，因此不启用
+        """
+        if extract_mode not in ('evaluate', 'dom'):
+            raise ValueError(f"未知的提取模式: {extract_mode}")
+        self.extract_mode = extract_mode
+        self.source = self.LOG_TAG.lower()
+        self.metrics = metrics or ScrapeMetrics()
+        self.selector_stats = selector_stats
+        self.checkpoint = checkpoint
         self.results = []
         self.max_retries = max_retries
         self.request_delay = request_delay
-        self.playwright: Optional[Playwright] = None
-        self.browser = None
+        self.ready_timeout = ready_timeout
+        self.politeness_delay = politeness_delay
+        self.known_hotels = known_hotels
+        self.detail_ttl = timedelta(hours=detail_ttl_hours)
+        self.concurrency = max(1, concurrency)
+        if rate_limit is None:
+            rate_limit = 1.0 / request_delay if request_delay > 0 else 0
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(rate=rate_limit)
+        self.browser_manager: Optional[BrowserManager] = None
+        self._owns_manager = False
         self.context = None
-
-    async def init_browser(self):
-        """初始化浏览器"""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
-            headless=True,
-            args=[
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-gpu',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,SitePerProcess'
-            ]
-        )
-        self.context = await self.browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            locale='zh-CN',
-            timezone_id='Asia/Shanghai'
+        self.page_pool: Optional[PagePool] = None
+        self.cache = response_cache
+        self.http: Optional[HttpFetcher] = None
+        if http_first:
+            self.http = HttpFetcher(
+                user_agent=self.CONTEXT_OPTIONS.get('user_agent'),
+                locale=self.CONTEXT_OPTIONS.get('locale'),
+                connections=self.concurrency,
+                cache=response_cache,
+            )
+        self.capture_api = capture_api and bool(self.LISTING_API_PATTERNS) \
+            and not (response_cache and response_cache.replay)
+        # 列表页的抓取方式统计：HTTP 直接解析成功 / 浏览器中捕获接口响应或重放接口 / 浏览器 DOM
+        self.listing_fetches = {'http': 0, 'api': 0, 'browser': 0}
+        if resource_policy is None and block_resources:
+            resource_policy = ResourcePolicy(
+                block_types=self.BLOCKED_RESOURCE_TYPES,
+                block_patterns=self.BLOCKED_URL_PATTERNS,
+                allow_patterns=self.ALLOWED_URL_PATTERNS,
+                page_patterns=self.BLOCK_ON_PAGES,
+            )
+        self.resource_policy = resource_policy if block_resources else None
+
+    def _stale_targets(self, hotels: List[Dict], url_key: str) -> Dict[str, Dict]:
+        """需要抓取详情的酒店 {url: hotel}，增量模式下跳过 TTL 内抓取过的"""
+        targets = {hotel[url_key]: hotel for hotel in hotels if hotel.get(url_key)}
+        if self.known_hotels:
+            total = len(targets)
+            fresh = {url for url in targets if self.known_hotels.is_fresh(url, self.detail_ttl)}
+            for url in fresh:
+                self.known_hotels.restore(targets[url], url)
+            targets = {url: hotel for url, hotel in targets.items() if url not in fresh}
+            logger.info(f"[{self.LOG_TAG}] 增量模式：{total - len(targets)}/{total} 家酒店详情仍在有效期内，跳过")
+        return targets
+
+    def _page_done(self, city: str, p: int) -> bool:
+        return bool(self.checkpoint) and self.checkpoint.page_done(self.source, city, p)
+
+    def _record_page(self, city: str, p: int, hotels: List[Dict]):
+        """列表页已被消费方处理完（详情、写文件）后记入运行日志；空页不记录，下次重试"""
+        if self.checkpoint and hotels:
+            self.checkpoint.record_page(self.source, city, p, len(hotels))
+
+    async def _fetch_details(self, fetch: Callable[[str], Awaitable], targets: Dict[str, Dict],
+                             is_failure: Callable[[any], bool],
+                             workers: Optional[int] = None) -> Tuple[Dict[str, any], DetailFetcher]:
+        """用 DetailFetcher 抓取 targets 的详情；断点续跑时直接取运行日志中已成功的结果"""
+        results = {}
+        if self.checkpoint:
+            for url in targets:
+                result = self.checkpoint.detail(self.source, url)
+                if result is not None:
+                    results[url] = result
+            if results:
+                logger.info(f"[{self.LOG_TAG}] 断点续跑：{len(results)} 个详情取自运行日志")
+        # 详情和照片页的导航已经在 _retry_request 中按 max_retries 重试并退避，
+        # worker 再重试会让一个坏 URL 导航 max_retries² 次，这里每个 URL 只调用一次
+        fetcher = DetailFetcher(
+            fetch,
+            workers=workers or self.concurrency,
+            retries=0,
+            backoff=self.request_delay,
+            is_failure=is_failure,
+            tag=self.LOG_TAG,
+            metrics=self.metrics,
+            on_success=(lambda url, result: self.checkpoint.record_detail(self.source, url, result))
+            if self.checkpoint else None,
         )
+        results.update(await fetcher.run([url for url in targets if url not in results]))
+        return results, fetcher
+
+    async def init_browser(self, manager: Optional[BrowserManager] = None):
+        """初始化浏览器上下文；传入 manager 时从共享浏览器借用，否则独占一个浏览器"""
+        self._owns_manager = manager is None
+        self.browser_manager = manager or BrowserManager()
+        self.context = await self.browser_manager.new_context(**self.CONTEXT_OPTIONS)
+        self.context.on('response', self._on_response)
+        if self.resource_policy or self.cache:
+            await self.context.route('**/*', self._route_request)
+        self.page_pool = PagePool(self.context, self.concurrency)
+
+    def _on_response(self, response):
+        """按 Content-Length 统计浏览器收到的字节数（没有该响应头的不计）"""
+        length = response.headers.get('content-length')
+        if length and length.isdigit():
+            self.metrics.inc('bytes_total', int(length), source=self.source, transport='browser')
+
+    async def _route_request(self, route):
+        """按拦截策略放行或中止请求，启用缓存时由缓存应答"""
+        request = route.request
+        try:
+            page_url = request.frame.url
+        except Exception:
+            page_url = ''
+        if self.resource_policy and self.resource_policy.should_block(request.resource_type, request.url, page_url):
+            self.resource_policy.blocked += 1
+            await route.abort()
+        elif self.cache and request.method == 'GET' and request.resource_type in self.CACHED_RESOURCE_TYPES:
+            await self._fulfill_from_cache(route)
+        elif self.cache and self.cache.replay:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _fulfill_from_cache(self, route):
+        """缓存命中时直接应答；未命中时实际请求并写入缓存，回放模式下未命中则中止"""
+        url = route.request.url
+        cached = self.cache.get(url)
+        if cached:
+            meta, body = cached
+            headers = {'content-type': meta['content_type']} if meta.get('content_type') else {}
+            await route.fulfill(status=meta['status'], headers=headers, body=body)
+            return
+        if self.cache.replay:
+            await route.abort()
+            return
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            await route.abort()
+            return
+        if response.ok:
+            self.cache.put(url, body, response.status, response.headers.get('content-type'))
+        await route.fulfill(response=response, body=body)
+
+    def _from_cache(self, url: str) -> bool:
+        """请求会直接由缓存应答（回放模式或缓存命中），不需要限速"""
+        return bool(self.cache) and (self.cache.replay or self.cache.contains(url))
 
     async def close(self):
         """关闭浏览器"""
+        if self.resource_policy and self.resource_policy.blocked:
+            logger.info(f"[{self.LOG_TAG}] 共拦截 {self.resource_policy.blocked} 个请求")
+        if any(self.listing_fetches.values()):
+            logger.info(f"[{self.LOG_TAG}] 列表页 HTTP 直接解析 {self.listing_fetches['http']} 页，"
+                        f"接口 {self.listing_fetches['api']} 页，浏览器 {self.listing_fetches['browser']} 页")
+        if self.http:
+            self.metrics.inc('bytes_total', self.http.bytes_received, source=self.source, transport='http')
+            await self.http.close()
+        if self.page_pool:
+            await self.page_pool.close()
         if self.context:
             await self.context.close()
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+            self.context = None
+        if self.browser_manager and self._owns_manager:
+            await self.browser_manager.close()
 
-    async def _retry_request(self, page: Page, url: str, max_retries: int = None) -> bool:
-        """带重试的页面请求"""
+    async def _retry_request(self, page: Page, url: str, max_retries: int = None,
+                             ready: ReadyCondition = None) -> bool:
+        """带重试的页面请求，ready 为就绪条件，见 wait_until_ready"""
         max_retries = max_retries or self.max_retries
+        offline = self._from_cache(url)
+        if self.cache and self.cache.replay:
+            # 回放模式下重试不会得到不同的结果
+            max_retries = 1
 
         for attempt in range(max_retries):
             try:
-                await page.goto(url, wait_until='domcontentloaded', timeout=30000)
-                # 等待页面基本加载
-                await page.wait_for_load_state('networkidle', timeout=15000)
+                if not offline:
+                    await self.rate_limiter.acquire(url)
+                with self.metrics.timer('navigate', self.source):
+                    response = await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+                status = response.status if response else 0
+                if status in THROTTLE_STATUSES or self._is_block_url(page.url):
+                    self._report_throttle(url, f"HTTP {status}", _retry_after(response.headers if response else None))
+                    raise RuntimeError(f"被限流或拦截: HTTP {status} {page.url}")
+                try:
+                    with self.metrics.timer('wait', self.source):
+                        await self.wait_until_ready(page, ready)
+                except Exception:
+                    # 就绪超时可能是停在了验证码页
+                    if await self._has_block_marker(page):
+                        self._report_throttle(url, '验证码')
+                    raise
+                if not offline:
+                    self.rate_limiter.record_success(url)
                 return True
             except Exception as e:
                 logger.warning(f"[{self.__class__.__name__}] 第{attempt + 1}次尝试失败: {e}")
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(self.request_delay * (attempt + 1))
+                    self.metrics.inc('retries_total', source=self.source, stage='navigate')
+                    # 指数退避加随机抖动；被限流时 acquire 还会等到该域名暂停结束
+                    delay = self.request_delay * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
                 else:
+                    self.metrics.inc('request_failures_total', source=self.source)
                     logger.error(f"[{self.__class__.__name__}] 所有重试次数已用尽")
                     return False
         return False
 
+    def _is_block_url(self, url: str) -> bool:
+        return any(re.search(pattern, url, re.IGNORECASE) for pattern in self.BLOCK_PAGE_URL_PATTERNS)
+
+    async def _has_block_marker(self, page: Page) -> bool:
+        """页面上是否有验证码/拦截页元素"""
+        try:
+            return await page.query_selector(', '.join(self.BLOCK_PAGE_MARKERS)) is not None
+        except Exception:
+            return False
+
+    def _report_throttle(self, url: str, reason: str, retry_after: Optional[float] = None):
+        self.metrics.inc('throttled_total', source=self.source, reason=reason)
+        self.rate_limiter.record_throttle(url, retry_after)
+
+    def _expand_selectors(self, names: Union[str, List[str]]) -> List[str]:
+        """把 SELECTORS 键名展开为选择器列表，不是键名的按 CSS 选择器原样保留"""
+        if isinstance(names, str):
+            names = [names]
+        selectors = []
+        for name in names:
+            selectors.extend(self.SELECTORS.get(name, [name]))
+        return selectors
+
+    async def wait_until_ready(self, page: Page, ready: ReadyCondition = None,
+                               timeout: Optional[float] = None):
+        """
+        等待页面内容就绪，超时抛出异常
+
+        ready 为 SELECTORS 键名或 CSS 选择器时，任一选择器出现即返回；
+        为异步谓词时轮询直到返回 True；为空时退回等待 networkidle
+        """
+        timeout = self.ready_timeout if timeout is None else timeout
+        if ready is None:
+            await page.wait_for_load_state('networkidle', timeout=timeout * 1000)
+        elif callable(ready):
+            deadline = time.monotonic() + timeout
+            while not await ready(page):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待页面就绪超时: {page.url}")
+                await asyncio.sleep(0.1)
+        else:
+            selector = ', '.join(self._expand_selectors(ready))
+            await page.wait_for_selector(selector, state='attached', timeout=timeout * 1000)
+
+    async def polite_pause(self):
+        """可选的礼貌性停顿，回放模式下不停顿"""
+        if self.politeness_delay > 0 and not (self.cache and self.cache.replay):
+            await asyncio.sleep(self.politeness_delay)
+
+    def _selectors(self, field: str) -> List[str]:
+        """field 的选择器列表，有命中统计时已失效的排到后面"""
+        selectors = self.SELECTORS.get(field, [])
+        if self.selector_stats:
+            return self.selector_stats.order(self.LOG_TAG, field, selectors)
+        return selectors
+
+    def _record_selector_hit(self, field: str, selector: str, count: int = 1,
+                             tried: Optional[List[str]] = None):
+        """
+        记录命中的选择器；不是 SELECTORS 中声明的第一个时计入备用选择器命中
+        tried: 本次查找使用的选择器顺序，排在 selector 前面的记为尝试过但没命中
+        """
+        if self.selector_stats:
+            missed = tried[:tried.index(selector)] if tried and selector in tried else []
+            self.selector_stats.record(self.LOG_TAG, field, selector, count, missed)
+        declared = self.SELECTORS.get(field)
+        if declared and selector != declared[0]:
+            self.metrics.inc('selector_fallback_total', count, source=self.source, field=field)
+
+    async def _try_selectors(self, element, selector_names: List[str]) -> Tuple[bool, any]:
+        """尝试多个选择器"""
+        for selector_type in selector_names:
+            selectors = self._selectors(selector_type)
+            for selector in selectors:
+                try:
+                    el = await element.query_selector(selector)
+                    if el:
+                        self._record_selector_hit(selector_type, selector, tried=selectors)
+                        return True, el
+                except Exception:
+                    continue
+        return False, None
+
+    async def _extract_hotels(self, page: Page, p: int) -> List[Dict]:
+        """提取当前结果页上的所有酒店"""
+        if self.extract_mode == 'evaluate':
+            try:
+                return await self._extract_hotels_in_page(page, p)
+            except Exception as e:
+                logger.warning(f"[{self.LOG_TAG}] 页内批量提取失败，回退到逐元素解析: {e}")
+
+        hotel_cards = []
+        card_selectors = self._selectors('card')
+        with self.metrics.timer('query', self.source):
+            for selector in card_selectors:
+                hotel_cards = await page.query_selector_all(selector)
+                if hotel_cards:
+                    if selector != self.SELECTORS['card'][0]:
+                        logger.info(f"[{self.LOG_TAG}] 使用备用选择器: {selector}")
+                    self._record_selector_hit('card', selector, tried=card_selectors)
+                    break
+
+        if not hotel_cards:
+            logger.warning(f"[{self.LOG_TAG}] 页面 {p + 1} 未找到酒店卡片")
+            return []
+
+        logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} 找到 {len(hotel_cards)} 个酒店")
+
+        hotels = []
+        for card in hotel_cards:
+            try:
+                hotel = await self._parse_hotel_card(card)
+                if hotel:
+                    hotels.append(hotel)
+            except Exception as e:
+                logger.error(f"[{self.LOG_TAG}] 解析酒店卡片失败: {e}")
+                continue
+        return hotels
+
+    async def _extract_hotels_in_page(self, page: Page, p: int) -> List[Dict]:
+        """把 SELECTORS 发送到页面内，一次 evaluate 取回所有卡片的原始字段"""
+        card_selectors, fields = self._selectors('card'), self._card_field_selectors()
+        with self.metrics.timer('query', self.source):
+            result = await page.evaluate(EXTRACT_CARDS_JS, {
+                'cardSelectors': card_selectors,
+                'fields': fields,
+                'attributes': self.FIELD_ATTRIBUTES,
+            })
+        return self._build_hotels(result, p, {'card': card_selectors, **fields})
+
+    def _card_field_selectors(self) -> Dict[str, List[str]]:
+        return {field: self._selectors(field) for field in self.CARD_FIELDS}
+
+    def _build_hotels(self, result: Dict, p: int, tried: Dict[str, List[str]]) -> List[Dict]:
+        """
+        把 EXTRACT_CARDS_JS / extract_cards 的结果转换为酒店记录
+        tried: 提取时各字段（含 card）使用的选择器顺序，用于记录没命中的选择器
+        """
+        raw_cards = result['cards']
+        if not raw_cards:
+            logger.warning(f"[{self.LOG_TAG}] 页面 {p + 1} 未找到酒店卡片")
+            return []
+
+        if result['cardSelector'] != self.SELECTORS['card'][0]:
+            logger.info(f"[{self.LOG_TAG}] 使用备用选择器: {result['cardSelector']}")
+        self._record_selector_hit('card', result['cardSelector'], tried=tried.get('card'))
+        for field, hits in (result.get('selectorHits') or {}).items():
+            for selector, count in hits.items():
+                self._record_selector_hit(field, selector, count, tried.get(field))
+        logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} 找到 {len(raw_cards)} 个酒店")
+
+        hotels = []
+        with self.metrics.timer('parse', self.source):
+            for raw in raw_cards:
+                try:
+                    hotel = self._build_hotel(raw)
+                    if hotel:
+                        hotels.append(hotel)
+                except Exception as e:
+                    logger.error(f"[{self.LOG_TAG}] 解析酒店卡片失败: {e}")
+        return hotels
+
+    def _parse_listing_api(self, data) -> List[Dict]:
+        """按 LISTING_API_ITEMS / API_FIELDS 把 JSON 接口返回的酒店列表转换为酒店记录"""
+        items = dig(data, self.LISTING_API_ITEMS)
+        if not isinstance(items, list):
+            return []
+        hotels = []
+        with self.metrics.timer('parse', self.source):
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    hotel = self._build_hotel(self._api_raw(item))
+                    if hotel:
+                        hotels.append(hotel)
+                except Exception as e:
+                    logger.error(f"[{self.LOG_TAG}] 解析接口酒店数据失败: {e}")
+        return hotels
+
+    def _api_raw(self, item: Dict) -> Dict[str, Optional[str]]:
+        """接口中一家酒店的原始字段，格式与卡片提取结果相同"""
+        raw = {}
+        for field, paths in self.API_FIELDS.items():
+            value = dig(item, paths)
+            raw[field] = None if value is None else str(value)
+        return raw
+
+    @asynccontextmanager
+    async def _capture_listing(self, page: Page):
+        """在 page 上捕获列表接口响应；未启用时产出 None"""
+        if not self.capture_api:
+            yield None
+            return
+        capture = ListingCapture(self.LISTING_API_PATTERNS, self._parse_listing_api)
+        page.on('response', capture.on_response)
+        try:
+            yield capture
+        finally:
+            # 池中的页面会被复用，离开时取消订阅
+            page.remove_listener('response', capture.on_response)
+            await capture.close()
+
+    def _listing_ready(self, capture: Optional[ListingCapture]) -> ReadyCondition:
+        """列表页就绪条件：卡片出现，或已经捕获到列表接口响应（不依赖 DOM 选择器）"""
+        if capture is None:
+            return 'card'
+        selector = ', '.join(self._expand_selectors('card'))
+
+        async def ready(page: Page) -> bool:
+            return bool(capture.payloads) or await page.query_selector(selector) is not None
+        return ready
+
+    async def _captured_listing(self, capture: Optional[ListingCapture], p: int) -> Optional[Dict]:
+        """页面就绪后取捕获到的列表接口响应，没有时返回 None 由调用方从 DOM 提取"""
+        if capture is None:
+            return None
+        payload = await capture.first(self.LISTING_CAPTURE_GRACE)
+        if payload:
+            logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} 从接口响应解析到 {len(payload['hotels'])} 个酒店")
+            self.listing_fetches['api'] += 1
+            self.metrics.inc('listing_pages_total', source=self.source, tier='api')
+        return payload
+
+    async def _replay_listing(self, template: Dict, p: int) -> Optional[List[Dict]]:
+        """
+        在浏览器上下文中重放捕获到的列表接口请求，改写为第 p 页（共用页面的 cookie）
+
+        返回该页的酒店（超出结果范围时为空列表）；请求中没有分页参数或重试用尽时返回 None
+        """
+        items = dig(template['data'], self.LISTING_API_ITEMS) or template['hotels']
+        request = paginate_request(template['url'], template['post_data'], p, len(items))
+        if request is None:
+            logger.warning(f"[{self.LOG_TAG}] 接口请求中没有分页参数，无法重放: {template['url']}")
+            return None
+        url, body = request
+        headers = replay_headers(template['headers'])
+
+        for attempt in range(self.max_retries):
+            try:
+                await self.rate_limiter.acquire(url)
+                with self.metrics.timer('api', self.source):
+                    response = await self.context.request.fetch(
+                        url, method=template['method'], headers=headers, data=body, timeout=30000)
+                if response.status in THROTTLE_STATUSES:
+                    self._report_throttle(url, f"HTTP {response.status}", _retry_after(response.headers))
+                    raise RuntimeError(f"被限流或拦截: HTTP {response.status}")
+                if not response.ok:
+                    raise RuntimeError(f"HTTP {response.status}")
+                content = await response.body()
+                self.metrics.inc('bytes_total', len(content), source=self.source, transport='api')
+                data = json.loads(content)
+                self.rate_limiter.record_success(url)
+                hotels = self._parse_listing_api(data)
+                logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} 重放接口解析到 {len(hotels)} 个酒店")
+                self.listing_fetches['api'] += 1
+                self.metrics.inc('listing_pages_total', source=self.source, tier='api')
+                return hotels
+            except Exception as e:
+                logger.warning(f"[{self.LOG_TAG}] 页面 {p + 1} 第{attempt + 1}次重放接口失败: {e}")
+                if attempt < self.max_retries - 1:
+                    self.metrics.inc('retries_total', source=self.source, stage='api')
+                    delay = self.request_delay * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        self.metrics.inc('request_failures_total', source=self.source)
+        return None
+
+    async def _fetch_listing_http(self, url: str, p: int) -> Optional[List[Dict]]:
+        """
+        不经过浏览器抓取列表页：GET 页面 HTML 按 SELECTORS 解析
+        （列表的 JSON 接口需要页面生成的签名和 cookie，由浏览器捕获后重放，见 _capture_listing）
+
+        请求失败或解析不到酒店时返回 None，由调用方回退到浏览器
+        """
+        if not self.http:
+            return None
+        offline = self._from_cache(url)
+        try:
+            if not offline:
+                await self.rate_limiter.acquire(url)
+            with self.metrics.timer('http', self.source):
+                html = await self.http.get_text(url)
+            card_selectors, fields = self._selectors('card'), self._card_field_selectors()
+            result = extract_cards(html, card_selectors, fields, self.FIELD_ATTRIBUTES)
+            hotels = self._build_hotels(result, p, {'card': card_selectors, **fields}) if result['cards'] else []
+        except aiohttp.ClientResponseError as e:
+            if e.status in THROTTLE_STATUSES:
+                self._report_throttle(url, f"HTTP {e.status}", _retry_after(e.headers))
+            logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} HTTP 抓取失败，回退到浏览器: {e}")
+            return None
+        except Exception as e:
+            logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} HTTP 抓取失败，回退到浏览器: {e}")
+            return None
+        if hotels and not offline:
+            self.rate_limiter.record_success(url)
+        if not hotels:
+            logger.info(f"[{self.LOG_TAG}] 页面 {p + 1} HTTP 响应中没有酒店，回退到浏览器")
+            return None
+        self.listing_fetches['http'] += 1
+        self.metrics.inc('listing_pages_total', source=self.source, tier='http')
+        return hotels
+
+    async def _parse_hotel_card(self, card) -> Optional[Dict]:
+        """逐字段查询解析单个酒店卡片"""
+        try:
+            raw = {}
+            with self.metrics.timer('query', self.source):
+                for field in self.CARD_FIELDS:
+                    found, el = await self._try_selectors(card, [field])
+                    if not found:
+                        raw[field] = None
+                        continue
+                    attr = self.FIELD_ATTRIBUTES.get(field)
+                    raw[field] = await el.get_attribute(attr) if attr else await el.inner_text()
+            with self.metrics.timer('parse', self.source):
+                return self._build_hotel(raw)
+        except Exception as e:
+            logger.error(f"[{self.LOG_TAG}] 解析失败: {e}")
+        return None
+
+    @abstractmethod
+    def _build_hotel(self, raw: Dict[str, Optional[str]]) -> Optional[HotelRecord]:
+        """把卡片原始字段转换为酒店记录（HotelRecord），由子类实现"""
+
+    @abstractmethod
+    def iter_pages(self, city: str, pages: int = 3) -> AsyncIterator[List[Dict]]:
+        """逐页产出解析好的酒店列表（异步生成器），由子类实现"""
+
+    async def stream_hotels(self, city: str, pages: int = 3) -> AsyncIterator[Dict]:
+        """逐个产出酒店"""
+        async for page_hotels in self.iter_pages(city, pages):
+            for hotel in page_hotels:
+                yield hotel
+
+    async def search_hotels(self, city: str, pages: int = 3) -> List[Dict]:
+        """搜索酒店列表，一次性返回所有结果"""
+        hotels = []
+        async for page_hotels in self.iter_pages(city, pages):
+            hotels.extend(page_hotels)
+        logger.info(f"[{self.LOG_TAG}] 共抓取 {len(hotels)} 家酒店")
+        return hotels
+
 
 class BookingScraper(BaseScraper):
     """Booking.com 爬虫"""
 
     BASE_URL = "https://www.booking.com"
+    LOG_TAG = 'Booking'
+    CARD_FIELDS = ['name', 'rating', 'review_count', 'price', 'link', 'image']
+    FIELD_ATTRIBUTES = {'link': 'href', 'image': 'src'}
+    BLOCK_ON_PAGES = [r'/searchresults']
+    IMAGE_BASE_URL = "https://cf.bstatic.com"
+
+    # 结果页的翻页、筛选通过 GraphQL 接口加载
+    LISTING_API_PATTERNS = [r'/dml/graphql']
+    LISTING_API_ITEMS = ['data.searchQueries.search.results']
+    API_FIELDS = {
+        'name': ['displayName.text', 'basicPropertyData.name'],
+        'rating': ['basicPropertyData.reviewScore.score', 'basicPropertyData.reviews.totalScore'],
+        'review_count': ['basicPropertyData.reviewScore.reviewCount', 'basicPropertyData.reviews.reviewsCount'],
+        'price': [
+            'priceDisplayInfoIrene.displayPrice.amountPerStay.amount',
+            'blocks.0.finalPrice.amount',
+        ],
+        'link': ['basicPropertyData.url'],
+        'image': [
+            'basicPropertyData.photos.main.highResUrl.relativeUrl',
+            'basicPropertyData.photos.main.lowResUrl.relativeUrl',
+        ],
+        'page_name': ['basicPropertyData.pageName'],
+        'country': ['basicPropertyData.location.countryCode'],
+    }
 
     # 备用选择器列表（按优先级排序）
     SELECTORS = {
@@ -141,177 +1471,197 @@ class BookingScraper(BaseScraper):
         ],
     }
 
-    def _try_selectors(self, element, selector_names: List[str]) -> Tuple[bool, any]:
-        """尝试多个选择器"""
-        for selector_type in selector_names:
-            selectors = self.SELECTORS.get(selector_type, [])
-            for selector in selectors:
-                try:
-                    el = element.query_selector(selector)
-                    if el:
-                        return True, el
-                except Exception:
-                    continue
-        return False, None
-
-    async def search_hotels(self, city: str = "Hangzhou", pages: int = 3) -> List[Dict]:
-        """搜索酒店列表"""
-        hotels = []
+    async def iter_pages(self, city: str = "Hangzhou", pages: int = 3) -> AsyncIterator[List[Dict]]:
+        """各结果页在页面池中并发抓取，按完成顺序逐页产出；断点续跑时跳过已完成的页"""
         search_url = f"{self.BASE_URL}/searchresults.html?ss={quote(city)}&checkin=&checkout="
 
-        page = await self.context.new_page()
-        try:
-            for p in range(pages):
-                url = f"{search_url}&offset={p * 25}"
-                logger.info(f"[Booking] 正在抓取页面 {p + 1}: {url}")
-
-                # 带重试的请求
-                if not await self._retry_request(page, url):
-                    logger.warning(f"[Booking] 跳过页面 {p + 1}")
-                    continue
-
-                await asyncio.sleep(self.request_delay)
-
-                # 提取酒店数据
-                hotel_cards = await page.query_selector_all(self.SELECTORS['card'][0])
-                if not hotel_cards:
-                    # 尝试备用选择器
-                    for selector in self.SELECTORS['card'][1:]:
-                        hotel_cards = await page.query_selector_all(selector)
-                        if hotel_cards:
-                            logger.info(f"[Booking] 使用备用选择器: {selector}")
-                            break
-
-                if not hotel_cards:
-                    logger.warning(f"[Booking] 页面 {p + 1} 未找到酒店卡片")
-                    continue
+        pending = [p for p in range(pages) if not self._page_done(city, p)]
+        if len(pending) < pages:
+            logger.info(f"[Booking] 断点续跑：跳过已完成的 {pages - len(pending)} 页")
 
-                logger.info(f"[Booking] 页面 {p + 1} 找到 {len(hotel_cards)} 个酒店")
+        async def scrape(p: int) -> Tuple[int, List[Dict]]:
+            return p, await self._scrape_search_page(f"{search_url}&offset={p * 25}", p)
 
-                for card in hotel_cards:
-                    try:
-                        hotel = await self._parse_hotel_card(card)
-                        if hotel:
-                            hotels.append(hotel)
-                    except Exception as e:
-                        logger.error(f"[Booking] 解析酒店卡片失败: {e}")
-                        continue
+        tasks = [asyncio.create_task(scrape(p)) for p in pending]
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                p, hotels = await next_page
+                yield hotels
+                # 消费方处理完这一页才会回到这里
+                self._record_page(city, p, hotels)
+        finally:
+            # 消费方提前退出时取消尚未完成的页面
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _scrape_search_page(self, url: str, p: int) -> List[Dict]:
+        """抓取单个结果页，优先 HTTP 直接解析，不行再占用池中页面"""
+        hotels = await self._fetch_listing_http(url, p)
+        if hotels is not None:
+            await self.polite_pause()
+            return hotels
+
+        async with self.page_pool.page() as page, self._capture_listing(page) as capture:
+            logger.info(f"[Booking] 正在抓取页面 {p + 1}: {url}")
+
+            # 带重试的请求
+            if not await self._retry_request(page, url, ready=self._listing_ready(capture)):
+                logger.warning(f"[Booking] 跳过页面 {p + 1}")
+                return []
 
-                await asyncio.sleep(self.request_delay)
+            # 页面发出了结果接口请求时直接用接口数据，否则从 DOM 提取
+            payload = await self._captured_listing(capture, p)
+            if payload:
+                hotels = payload['hotels']
+            else:
+                self.listing_fetches['browser'] += 1
+                self.metrics.inc('listing_pages_total', source=self.source, tier='browser')
+                hotels = await self._extract_hotels(page, p)
 
-        finally:
-            await page.close()
+            await self.polite_pause()
 
-        logger.info(f"[Booking] 共抓取 {len(hotels)} 家酒店")
         return hotels
 
-    async def _parse_hotel_card(self, card) -> Optional[Dict]:
-        """解析单个酒店卡片"""
-        try:
-            # 名称
-            found, name_el = self._try_selectors(card, ['name'])
-            name = await name_el.inner_text() if found else None
-
-            # 评分
-            found, rating_el = self._try_selectors(card, ['rating'])
-            rating_text = await rating_el.inner_text() if found else "0"
-            rating = float(re.search(r'(\d+\.?\d*)', rating_text).group(1)) if rating_text else None
-
-            # 评论数
-            found, review_el = self._try_selectors(card, ['review_count'])
-            review_text = await review_el.inner_text() if found else "0"
-            review_count = int(re.search(r'(\d+)', review_text.replace(',', '')).group(1)) if review_text else 0
-
-            # 价格
-            found, price_el = self._try_selectors(card, ['price'])
-            price_text = await price_el.inner_text() if found else None
-            price = None
-            if price_text:
-                price_match = re.search(r'(\d+[,\d]*)', price_text.replace(',', ''))
-                if price_match:
-                    price = int(price_match.group(1).replace(',', ''))
-
-            # 链接
-            found, link_el = self._try_selectors(card, ['link'])
-            href = await link_el.get_attribute('href') if found else None
-            url = urljoin(self.BASE_URL, href) if href else None
-
-            # 图片
-            found, img_el = self._try_selectors(card, ['image'])
-            image_url = await img_el.get_attribute('src') if found else None
-
-            if name and url:
-                return {
-                    'name': name.strip(),
-                    'booking_rating': rating,
-                    'booking_review_count': review_count,
-                    'price': price,
-                    'booking_url': url,
-                    'thumbnail': image_url,
-                    'source': 'booking',
-                    'scraped_at': datetime.now().isoformat(),
-                }
-        except Exception as e:
-            logger.error(f"[Booking] 解析失败: {e}")
+    def _api_raw(self, item: Dict) -> Dict[str, Optional[str]]:
+        """接口结果没有完整链接时由 pageName 和国家代码拼出酒店页，图片为 CDN 相对路径"""
+        raw = super()._api_raw(item)
+        if not raw['link'] and raw['page_name'] and raw['country']:
+            raw['link'] = f"/hotel/{raw['country']}/{raw['page_name']}.html"
+        if raw['image']:
+            raw['image'] = urljoin(self.IMAGE_BASE_URL, raw['image'])
+        return raw
 
+    def _build_hotel(self, raw: Dict[str, Optional[str]]) -> Optional[HotelRecord]:
+        """解析单个酒店卡片"""
+        name = raw.get('name')
+
+        # 评分
+        rating_match = re.search(r'(\d+\.?\d*)', raw.get('rating') or "0")
+        rating = float(rating_match.group(1)) if rating_match else None
+
+        # 评论数
+        review_match = re.search(r'(\d+)', (raw.get('review_count') or "0").replace(',', ''))
+        review_count = int(review_match.group(1)) if review_match else 0
+
+        # 价格
+        price_text = raw.get('price')
+        price = None
+        if price_text:
+            price_match = re.search(r'(\d+[,\d]*)', price_text.replace(',', ''))
+            if price_match:
+                price = int(price_match.group(1).replace(',', ''))
+
+        # 链接
+        href = raw.get('link')
+        url = urljoin(self.BASE_URL, href) if href else None
+
+        if name and url:
+            return HotelRecord(
+                name=name.strip(),
+                booking_rating=rating,
+                booking_review_count=review_count,
+                price=price,
+                booking_url=url,
+                thumbnail=raw.get('image'),
+                source='booking',
+                scraped_at=time.time(),
+            )
         return None
 
     async def get_hotel_details(self, url: str) -> Dict:
-        """获取酒店详情"""
-        page = await self.context.new_page()
-        try:
-            logger.info(f"[Booking] 获取详情: {url}")
-
-            if not await self._retry_request(page, url):
-                return {'source': 'booking', 'url': url, 'error': 'Failed to load page'}
+        """获取酒店详情（使用页面池中的页面）"""
+        async with self.page_pool.page() as page:
+            try:
+                logger.info(f"[Booking] 获取详情: {url}")
 
-            await asyncio.sleep(self.request_delay * 2)
+                if not await self._retry_request(page, url, ready=['address', 'description']):
+                    return {'source': 'booking', 'url': url, 'error': 'Failed to load page'}
 
-            details = {'source': 'booking', 'url': url}
+                details = {'source': 'booking', 'url': url}
 
-            # 地址
-            found, addr_el = self._try_selectors(page, ['address'])
-            details['address'] = await addr_el.inner_text() if found else None
+                # 地址
+                found, addr_el = await self._try_selectors(page, ['address'])
+                details['address'] = await addr_el.inner_text() if found else None
 
-            # 描述
-            found, desc_el = self._try_selectors(page, ['description'])
-            details['description'] = await desc_el.inner_text() if found else None
+                # 描述
+                found, desc_el = await self._try_selectors(page, ['description'])
+                details['description'] = await desc_el.inner_text() if found else None
 
-            # 设施 - 使用更通用的选择器
-            try:
-                facility_els = await page.query_selector_all('[class*="facility"], [class*="amenity"]')
-                details['amenities'] = []
-                for el in facility_els[:20]:
-                    text = await el.inner_text()
-                    if text and len(text) < 50:  # 过滤太长的文本
-                        details['amenities'].append(text.strip())
-            except Exception:
-                details['amenities'] = []
+                # 设施 - 使用更通用的选择器
+                try:
+                    facility_els = await page.query_selector_all('[class*="facility"], [class*="amenity"]')
+                    details['amenities'] = []
+                    for el in facility_els[:20]:
+                        text = await el.inner_text()
+                        if text and len(text) < 50:  # 过滤太长的文本
+                            details['amenities'].append(text.strip())
+                except Exception:
+                    details['amenities'] = []
 
-            # 图片
-            try:
-                image_els = await page.query_selector_all('img[src*="max"], img[src*="photo"]')
-                details['images'] = []
-                for img in image_els[:30]:
-                    src = await img.get_attribute('src')
-                    if src and 'max' in src:
-                        high_res = src.replace('max300', 'max1024')
-                        details['images'].append(high_res)
-            except Exception:
-                details['images'] = []
+                # 图片
+                try:
+                    image_els = await page.query_selector_all('img[src*="max"], img[src*="photo"]')
+                    details['images'] = []
+                    for img in image_els[:30]:
+                        src = await img.get_attribute('src')
+                        # 保留原始尺寸：图片校验（image_check）确认可用后换成大图，不校验时由 upgrade_unvalidated 直接替换
+                        if src and 'max' in src:
+                            details['images'].append(src)
+                except Exception:
+                    details['images'] = []
 
-            return details
-        except Exception as e:
-            logger.error(f"[Booking] 获取详情失败: {e}")
-            return {'source': 'booking', 'url': url, 'error': str(e)}
-        finally:
-            await page.close()
+                return details
+            except Exception as e:
+                logger.error(f"[Booking] 获取详情失败: {e}")
+                return {'source': 'booking', 'url': url, 'error': str(e)}
+
+    async def enrich_hotels(self, hotels: List[Dict], workers: Optional[int] = None) -> Dict:
+        """并发抓取所有酒店详情并合并到记录中，返回吞吐/延迟统计"""
+        targets = self._stale_targets(hotels, 'booking_url')
+        details_by_url, fetcher = await self._fetch_details(
+            self.get_hotel_details, targets,
+            is_failure=lambda details: 'error' in details,
+            workers=workers,
+        )
+        for url, details in details_by_url.items():
+            targets[url].update(details)
+            if 'error' not in details:
+                targets[url]['details_scraped_at'] = datetime.now().isoformat()
+        return fetcher.summary()
 
 
 class CtripScraper(BaseScraper):
     """携程爬虫"""
 
     BASE_URL = "https://hotels.ctrip.com"
+    LOG_TAG = 'Ctrip'
+    CARD_FIELDS = ['name', 'rating', 'review_count', 'price', 'link']
+    FIELD_ATTRIBUTES = {'link': 'href'}
+    BLOCK_ON_PAGES = [r'/hotels/listPage']
+
+    # 列表页通过 restapi 的酒店列表接口加载，页码在 JSON 请求体中
+    LISTING_API_PATTERNS = [r'/restapi/soa2/\d+/\w*[Hh]otel[Ll]ist']
+    LISTING_API_ITEMS = ['data.hotelList', 'Response.hotelList', 'hotelList', 'data.hotels']
+    API_FIELDS = {
+        'name': ['hotelInfo.nameInfo.name', 'hotelName', 'name'],
+        'rating': ['hotelInfo.commentInfo.commentScore', 'commentInfo.commentScore', 'score'],
+        'review_count': [
+            'hotelInfo.commentInfo.commenterNumber',
+            'commentInfo.commentCount',
+            'commentCount',
+        ],
+        'price': ['roomInfo.0.priceInfo.price', 'minPriceInfo.price', 'price'],
+        'link': ['hotelInfo.hotelUrl', 'hotelUrl'],
+        'hotel_id': ['hotelInfo.summary.hotelId', 'hotelId', 'id'],
+    }
+
+    # 列表页按城市 ID 查询
+    CITY_IDS = {
+        '北京': 1, '上海': 2, '天津': 3, '重庆': 4, '青岛': 7, '西安': 10, '南京': 12,
+        '苏州': 14, '杭州': 17, '厦门': 25, '成都': 28, '深圳': 30, '广州': 32,
+        '桂林': 33, '昆明': 34, '丽江': 37, '三亚': 43,
+    }
 
     # 备用选择器
     SELECTORS = {
@@ -341,177 +1691,465 @@ class CtripScraper(BaseScraper):
             '[class*="price"]',
             '.hotel-price',
         ],
+        'link': [
+            'a[href*="/hotel"]',
+        ],
+        'next': [
+            '.next',
+            '.next-page',
+            '[class*="next"]',
+        ],
+        'gallery': [
+            '.hotel-pic-gallery',
+            '[class*="gallery"]',
+        ],
+        'photo': [
+            'img[src*="ctrip"]',
+            'img[src*="pic"]',
+        ],
     }
 
-    def _try_selectors(self, element, selector_names: List[str]) -> Tuple[bool, any]:
-        """尝试多个选择器"""
-        for selector_type in selector_names:
-            selectors = self.SELECTORS.get(selector_type, [])
-            for selector in selectors:
-                try:
-                    el = element.query_selector(selector)
-                    if el:
-                        return True, el
-                except Exception:
-                    continue
-        return False, None
-
-    async def search_hotels(self, city: str = "杭州", pages: int = 3) -> List[Dict]:
-        """搜索酒店列表"""
-        hotels = []
-        search_url = f"{self.BASE_URL}/hotels/listPage?city=17&checkIn=&checkOut="
-
-        page = await self.context.new_page()
-        try:
-            for p in range(pages):
-                logger.info(f"[Ctrip] 正在抓取页面 {p + 1}")
-
-                if not await self._retry_request(page, search_url):
-                    logger.warning(f"[Ctrip] 跳过页面 {p + 1}")
-                    continue
-
-                await asyncio.sleep(self.request_delay * 2)
-
-                # 滚动加载
-                for _ in range(3):
-                    await page.evaluate('window.scrollBy(0, 800)')
-                    await asyncio.sleep(0.5)
-
-                # 提取酒店数据
-                hotel_cards = await page.query_selector_all(self.SELECTORS['card'][0])
-                if not hotel_cards:
-                    for selector in self.SELECTORS['card'][1:]:
-                        hotel_cards = await page.query_selector_all(selector)
-                        if hotel_cards:
-                            logger.info(f"[Ctrip] 使用备用选择器: {selector}")
-                            break
-
-                if not hotel_cards:
-                    logger.warning(f"[Ctrip] 页面 {p + 1} 未找到酒店卡片")
-                    continue
-
-                logger.info(f"[Ctrip] 页面 {p + 1} 找到 {len(hotel_cards)} 个酒店")
-
-                for card in hotel_cards:
-                    try:
-                        hotel = await self._parse_hotel_card(card)
-                        if hotel:
-                            hotels.append(hotel)
-                    except Exception as e:
-                        logger.error(f"[Ctrip] 解析酒店卡片失败: {e}")
+    async def iter_pages(self, city: str = "杭州", pages: int = 3) -> AsyncIterator[List[Dict]]:
+        """
+        逐页抓取并产出酒店列表
+
+        列表页只打开一次：捕获到列表接口响应时，第一页直接取自接口，后续页改写页码重放接口请求；
+        没有可重放的接口响应时从 DOM 提取，停留在同一页面上点击"下一页"翻页
+        """
+        if city not in self.CITY_IDS:
+            raise ValueError(f"携程城市 ID 未知: {city}")
+        search_url = f"{self.BASE_URL}/hotels/listPage?city={self.CITY_IDS[city]}&checkIn=&checkOut="
+
+        pending = [p for p in range(pages) if not self._page_done(city, p)]
+        if len(pending) < pages:
+            logger.info(f"[Ctrip] 断点续跑：跳过已完成的 {pages - len(pending)} 页")
+        if not pending:
+            return
+
+        # 列表页在 DOM 模式下要跨 yield 持有，不从页面池借用：消费方 fetch_photos 需要池中页面
+        async with self.page_pool.dedicated() as page:
+            async with self._capture_listing(page) as capture:
+                logger.info(f"[Ctrip] 正在打开列表页: {search_url}")
+                if not await self._retry_request(page, search_url, ready=self._listing_ready(capture)):
+                    logger.warning(f"[Ctrip] 列表页加载失败，跳过 {city}")
+                    return
+                template = await self._captured_listing(capture, 0)
+
+            if not template or paginate_request(template['url'], template['post_data'], 1, 1) is None:
+                if template:
+                    logger.info("[Ctrip] 接口请求中没有分页参数，后续页从 DOM 提取")
+                # 携程靠点击"下一页"翻页，页面之间有状态依赖，只能在同一个页面上顺序抓取
+                for p in range(pages):
+                    if p > 0 and not await self._next_page(page, p):
+                        break
+                    # 断点续跑：已完成的页只翻页，不再提取和抓取照片
+                    if p not in pending:
                         continue
-
-                # 点击下一页
-                try:
-                    next_btn = await page.query_selector('.next, .next-page, [class*="next"]')
-                    if next_btn:
-                        await next_btn.click()
-                        await asyncio.sleep(self.request_delay * 2)
+                    if p == 0 and template:
+                        hotels = template['hotels']
                     else:
-                        break
-                except Exception:
+                        self.listing_fetches['browser'] += 1
+                        self.metrics.inc('listing_pages_total', source=self.source, tier='browser')
+                        await self._scroll_to_load(page)
+                        hotels = await self._extract_hotels(page, p)
+                    yield hotels
+                    self._record_page(city, p, hotels)
+                return
+
+        # 接口模式：后续页直接重放接口请求，列表页已关闭
+        for p in pending:
+            if p == 0:
+                hotels = template['hotels']
+            else:
+                hotels = await self._replay_listing(template, p)
+                if hotels is None:
+                    logger.warning(f"[Ctrip] 跳过页面 {p + 1}")
+                    continue
+                if not hotels:
+                    logger.info(f"[Ctrip] 页面 {p + 1} 没有更多酒店，停止翻页")
                     break
+                await self.polite_pause()
+            yield hotels
+            self._record_page(city, p, hotels)
 
-        finally:
-            await page.close()
-
-        logger.info(f"[Ctrip] 共抓取 {len(hotels)} 家酒店")
-        return hotels
-
-    async def _parse_hotel_card(self, card) -> Optional[Dict]:
-        """解析单个酒店卡片"""
+    async def _next_page(self, page: Page, p: int) -> bool:
+        """点击"下一页"，等到第一张卡片的内容变化（不重新导航）；没有下一页或翻页失败时返回 False"""
+        card_selector = ', '.join(self._expand_selectors('card'))
         try:
-            # 名称
-            found, name_el = self._try_selectors(card, ['name'])
-            name = await name_el.inner_text() if found else None
-
-            # 评分
-            found, rating_el = self._try_selectors(card, ['rating'])
-            rating_text = await rating_el.inner_text() if found else "0"
-            rating = float(rating_text) if rating_text and rating_text.replace('.', '').isdigit() else None
-
-            # 评论数
-            found, review_el = self._try_selectors(card, ['review_count'])
-            review_text = await review_el.inner_text() if found else "0"
-            review_count = int(re.search(r'(\d+)', review_text).group(1)) if review_text else 0
-
-            # 价格
-            found, price_el = self._try_selectors(card, ['price'])
-            price_text = await price_el.inner_text() if found else None
-            price = int(re.search(r'(\d+)', price_text).group(1)) if price_text else None
-
-            # 链接
+            next_btn = await page.query_selector(', '.join(self._expand_selectors('next')))
+            if not next_btn:
+                return False
+            first_card = await page.eval_on_selector(card_selector, 'el => el.innerText')
+            logger.info(f"[Ctrip] 正在翻到页面 {p + 1}")
+            await next_btn.click()
+            with self.metrics.timer('wait', self.source):
+                await page.wait_for_function(CARD_CHANGED_JS, arg=[card_selector, first_card],
+                                             timeout=self.ready_timeout * 1000)
+        except Exception as e:
+            logger.warning(f"[Ctrip] 翻到页面 {p + 1} 失败: {e}")
+            return False
+        await self.polite_pause()
+        return True
+
+    async def _scroll_to_load(self, page: Page, rounds: int = 3, timeout: float = 1.0):
+        """滚动到底部触发懒加载的卡片，卡片数不再增加时停止，不做固定时长的等待"""
+        card_selector = ', '.join(self._expand_selectors('card'))
+        count = await page.eval_on_selector_all(card_selector, 'els => els.length')
+        for _ in range(rounds):
+            await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
             try:
-                link_el = await card.query_selector('a[href*="/hotel"]')
-                href = await link_el.get_attribute('href') if link_el else None
+                await page.wait_for_function(CARD_COUNT_GREATER_JS, arg=[card_selector, count],
+                                             timeout=timeout * 1000)
             except Exception:
-                href = None
-
-            if name and href:
-                return {
-                    'name': name.strip(),
-                    'ctrip_rating': rating,
-                    'ctrip_review_count': review_count,
-                    'price': price,
-                    'ctrip_url': urljoin(self.BASE_URL, href),
-                    'source': 'ctrip',
-                    'scraped_at': datetime.now().isoformat(),
-                }
-        except Exception as e:
-            logger.error(f"[Ctrip] 解析失败: {e}")
+                break
+            count = await page.eval_on_selector_all(card_selector, 'els => els.length')
 
+    def _build_hotel(self, raw: Dict[str, Optional[str]]) -> Optional[HotelRecord]:
+        """解析单个酒店卡片"""
+        name = raw.get('name')
+
+        # 评分
+        rating_text = (raw.get('rating') or "0").strip()
+        rating = float(rating_text) if rating_text and rating_text.replace('.', '').isdigit() else None
+
+        # 评论数
+        review_match = re.search(r'(\d+)', raw.get('review_count') or "0")
+        review_count = int(review_match.group(1)) if review_match else 0
+
+        # 价格
+        price_match = re.search(r'(\d+)', raw.get('price') or "")
+        price = int(price_match.group(1)) if price_match else None
+
+        # 链接
+        href = raw.get('link')
+
+        if name and href:
+            return HotelRecord(
+                name=name.strip(),
+                ctrip_rating=rating,
+                ctrip_review_count=review_count,
+                price=price,
+                ctrip_url=urljoin(self.BASE_URL, href),
+                source='ctrip',
+                scraped_at=time.time(),
+            )
         return None
 
-    async def get_official_photos(self, url: str) -> List[Dict]:
-        """获取携程官方照片"""
-        page = await self.context.new_page()
+    def _api_raw(self, item: Dict) -> Dict[str, Optional[str]]:
+        """接口结果没有详情页链接时按酒店 ID 拼出"""
+        raw = super()._api_raw(item)
+        if not raw['link'] and raw['hotel_id']:
+            raw['link'] = f"/hotels/{raw['hotel_id']}.html"
+        return raw
+
+    async def get_official_photos(self, url: str) -> Optional[List[Dict]]:
+        """
+        获取携程官方照片（使用页面池中的页面）
+
+        页面加载失败时返回 None；页面正常但酒店没有官方照片时返回空列表，视为抓取成功
+        """
         photos = []
 
-        try:
-            logger.info(f"[Ctrip] 获取官方照片: {url}")
+        async with self.page_pool.page() as page:
+            try:
+                logger.info(f"[Ctrip] 获取官方照片: {url}")
 
-            if not await self._retry_request(page, url):
-                return []
+                if not await self._retry_request(page, url, ready='photo'):
+                    return None
 
-            await asyncio.sleep(self.request_delay * 2)
+                # 尝试点击相册按钮
+                try:
+                    gallery_btn = await page.query_selector(', '.join(self.SELECTORS['gallery']))
+                    if gallery_btn:
+                        await gallery_btn.click()
+                        await self.wait_until_ready(page, 'photo')
+                except Exception:
+                    pass
 
-            # 尝试点击相册按钮
-            try:
-                gallery_btn = await page.query_selector('.hotel-pic-gallery, [class*="gallery"]')
-                if gallery_btn:
-                    await gallery_btn.click()
-                    await asyncio.sleep(2)
-            except Exception:
-                pass
+                # 获取图片
+                try:
+                    image_els = await page.query_selector_all(', '.join(self.SELECTORS['photo']))
+                    for idx, img in enumerate(image_els[:50]):
+                        src = await img.get_attribute('src')
+                        if src:
+                            photos.append({
+                                'url': src,
+                                'caption': '',
+                                'order': idx,
+                                'is_official': True,
+                                'source': 'ctrip'
+                            })
+                except Exception as e:
+                    logger.warning(f"[Ctrip] 获取图片失败: {e}")
+
+                logger.info(f"[Ctrip] 获取 {len(photos)} 张照片")
 
-            # 获取图片
-            try:
-                image_els = await page.query_selector_all('img[src*="ctrip"], img[src*="pic"]')
-                for idx, img in enumerate(image_els[:50]):
-                    src = await img.get_attribute('src')
-                    if src:
-                        photos.append({
-                            'url': src,
-                            'caption': '',
-                            'order': idx,
-                            'is_official': True,
-                            'source': 'ctrip'
-                        })
             except Exception as e:
-                logger.warning(f"[Ctrip] 获取图片失败: {e}")
+                logger.error(f"[Ctrip] 获取照片失败: {e}")
+                return None
 
-            logger.info(f"[Ctrip] 获取 {len(photos)} 张照片")
+        return photos
 
-        except Exception as e:
-            logger.error(f"[Ctrip] 获取照片失败: {e}")
-        finally:
-            await page.close()
+    async def fetch_photos(self, hotels: List[Dict], workers: Optional[int] = None) -> Dict:
+        """并发抓取所有酒店的官方照片，写入 hotel['photos']，返回吞吐/延迟统计"""
+        targets = self._stale_targets(hotels, 'ctrip_url')
+        photos_by_url, fetcher = await self._fetch_details(
+            self.get_official_photos, targets,
+            # 只有页面加载失败（None）算失败；没有官方照片的酒店返回空列表，不再反复重抓
+            is_failure=lambda photos: photos is None,
+            workers=workers,
+        )
+        for url, photos in photos_by_url.items():
+            if photos is None:
+                continue
+            # 页面加载成功即记录抓取时间，没有官方照片的酒店同样在 TTL 内跳过
+            targets[url]['photos'] = photos
+            targets[url]['details_scraped_at'] = datetime.now().isoformat()
+        return fetcher.summary()
+
+
+# 每页结果的处理函数：(source, hotels) -> awaitable
+PageHandler = Callable[[str, List[Dict]], Awaitable[None]]
+
+
+class ScrapeOrchestrator:
+    """并发运行多个爬虫任务，每个任务独立统计结果和错误；可限制总并发数和每个数据源的并发数"""
+
+    def __init__(self, browser_manager: Optional[BrowserManager] = None,
+                 page_handlers: Optional[List[PageHandler]] = None,
+                 concurrency: Optional[int] = None,
+                 source_concurrency: Optional[Dict[str, int]] = None):
+        """
+        page_handlers: 每产出一页结果就依次调用，用于流式写文件/数据库
+        concurrency: 同时运行的任务数上限，默认不限
+        source_concurrency: 每个数据源同时运行的任务数上限 {source: n}，未列出的数据源不限
+        """
+        self.browser_manager = browser_manager or BrowserManager()
+        self.page_handlers = page_handlers or []
+        self.concurrency = concurrency
+        self.source_concurrency = source_concurrency or {}
+        # name -> (source, scraper, job)，按注册顺序启动
+        self.jobs: Dict[str, Tuple[str, BaseScraper, Callable[[BaseScraper], AsyncIterator[List[Dict]]]]] = {}
+
+    def add(self, source: str, scraper: BaseScraper,
+            job: Callable[[BaseScraper], AsyncIterator[List[Dict]]], name: Optional[str] = None):
+        """
+        注册一个任务，job 接收已初始化的爬虫，逐页产出酒店列表
+        name: 任务名，默认为 source；同一数据源有多个任务（如多个城市）时用于区分
+        """
+        self.jobs[name or source] = (source, scraper, job)
+
+    @asynccontextmanager
+    async def _slot(self, source: str, limits: Dict[str, asyncio.Semaphore]):
+        """先占数据源的名额再占总名额，等待中的任务不占用其他数据源可用的总名额"""
+        async with AsyncExitStack() as stack:
+            for key in (source, None):
+                if key in limits:
+                    await stack.enter_async_context(limits[key])
+            yield
+
+    async def _run_source(self, name: str, source: str, scraper: BaseScraper, job,
+                          limits: Dict[str, asyncio.Semaphore]) -> Dict:
+        async with self._slot(source, limits):
+            started = time.monotonic()
+            result = {'name': name, 'source': source, 'count': 0, 'error': None}
+            try:
+                await scraper.init_browser(self.browser_manager)
+                async for hotels in job(scraper):
+                    result['count'] += len(hotels)
+                    for handler in self.page_handlers:
+                        await handler(source, hotels)
+            except Exception as e:
+                logger.error(f"[{scraper.LOG_TAG}] {name} 爬取过程出错: {e}")
+                result['error'] = str(e)
+            finally:
+                await scraper.close()
+            result['elapsed'] = time.monotonic() - started
+        logger.info(f"[{scraper.LOG_TAG}] {name} 完成，用时 {result['elapsed']:.1f}s，{result['count']} 家酒店")
+        return result
+
+    async def run(self) -> Dict[str, Dict]:
+        """运行所有任务，返回 {name: {'source', 'count', 'error', 'elapsed'}}"""
+        # None 为总名额
+        limits = {source: asyncio.Semaphore(n) for source, n in self.source_concurrency.items()}
+        if self.concurrency:
+            limits[None] = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(
+            self._run_source(name, source, scraper, job, limits)
+            for name, (source, scraper, job) in self.jobs.items()
+        ))
+        return {result['name']: result for result in results}
+
+
+class JsonlPageWriter:
+    """把每页结果追加到 JSONL 文件并立即 flush"""
+
+    def __init__(self, path: str, metrics: Optional[ScrapeMetrics] = None, resume: bool = False):
+        self.writer = JsonlWriter(path, resume=resume)
+        self.metrics = metrics or ScrapeMetrics()
+
+    async def __call__(self, source: str, hotels: List[Dict]):
+        # 单页数据量小，直接在事件循环中同步写入
+        with self.metrics.timer('write', source):
+            self.writer.write_page(hotels)
+
+    def close(self):
+        self.writer.close()
+
+
+def write_to_database(hotels: List[Dict], results: Dict[str, Dict], database_url: str,
+                      metrics: Optional[ScrapeMetrics] = None):
+    """把合并后的酒店写入 Hotel / HotelImage，并为每个数据源记录一条 ScrapingLog"""
+    from db_sink import HotelSink
+
+    metrics = metrics or ScrapeMetrics()
+    sink = HotelSink(database_url)
+    try:
+        with metrics.timer('write', 'database'):
+            written = sink.write_hotels(hotels)
+        logger.info(f"[数据库] 已写入 {written} 家酒店")
+        for name, result in results.items():
+            if not result['error']:
+                status = 'success'
+            else:
+                status = 'partial' if result['count'] else 'error'
+            message = f"{name}: {result['error']}" if result['error'] else name
+            sink.write_log(result['source'], status, items_scraped=result['count'], message=message)
+    finally:
+        sink.close()
+
+
+def _stamp_city(hotels: List[Dict], city: str):
+    """记录所属的城市（CITIES 中的英文名，与 Hotel.city 一致），跨平台合并只在同一城市内进行"""
+    name = CITIES[city]['booking']
+    for hotel in hotels:
+        hotel['city'] = name
+
+
+def booking_job(city: str, pages: int = 2) -> Callable[[BookingScraper], AsyncIterator[List[Dict]]]:
+    """Booking 任务：逐页抓取列表，补充该页所有酒店的详情后产出；city 为 CITIES 的键"""
+    async def job(booking: BookingScraper) -> AsyncIterator[List[Dict]]:
+        async for page_hotels in booking.iter_pages(city=CITIES[city]['booking'], pages=pages):
+            _stamp_city(page_hotels, city)
+            await booking.enrich_hotels(page_hotels)
+            yield page_hotels
+    return job
+
+
+def ctrip_job(city: str, pages: int = 2) -> Callable[[CtripScraper], AsyncIterator[List[Dict]]]:
+    """携程任务：逐页抓取列表，获取该页所有酒店的官方照片后产出；city 为 CITIES 的键"""
+    async def job(ctrip: CtripScraper) -> AsyncIterator[List[Dict]]:
+        async for page_hotels in ctrip.iter_pages(city=CITIES[city]['ctrip'], pages=pages):
+            _stamp_city(page_hotels, city)
+            await ctrip.fetch_photos(page_hotels)
+            yield page_hotels
+    return job
+
+
+# 数据源 -> (爬虫类, 任务工厂 (城市键, 页数) -> job)
+SOURCES = {
+    'booking': (BookingScraper, booking_job),
+    'ctrip': (CtripScraper, ctrip_job),
+}
+
+
+SELECTOR_STATS_PATH = 'data/selector_stats.json'
+JOURNAL_PATH = 'data/run_journal.jsonl'
+CRAWL_STATE_PATH = 'data/crawl_state.json'
+IMAGE_INDEX_PATH = 'data/image_index.json'
+
+
+def record_history(output_path: str, timestamp: str, history_dir: str = 'data/history') -> Optional[Dict]:
+    """
+    把本次运行的各平台记录追加到价格 / 评分历史（price_history），返回与上一次运行相比的变化
+    {'previous', 'summary', 'changes', 'not_scraped'}，没有上一次运行时返回 None；
+    not_scraped 为上一次抓取了、这一次没有抓取的 (source, city)，其中的酒店不计为下架
+    """
+    from price_history import PriceHistory, summarize
+
+    history = PriceHistory(history_dir)
+    previous = [run_id for run_id in history.runs() if run_id < timestamp]
+    rows = history.append(timestamp, read_records(output_path), datetime.strptime(timestamp, '%Y%m%d_%H%M%S'))
+    logger.info(f"[历史] 已追加 {rows} 条价格/评分记录到 {history_dir}")
+    if not previous:
+        return None
+    changes = history.diff(previous[-1], timestamp)
+    not_scraped = history.coverage(previous[-1], timestamp)['not_scraped']
+    return {'previous': previous[-1], 'summary': summarize(changes), 'changes': changes,
+            'not_scraped': not_scraped}
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """环境变量是否为 1 / true / yes，未设置时返回 default"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def parse_source_concurrency(value: str, sources: List[str]) -> Dict[str, int]:
+    """'2' 对所有数据源生效，'booking=2,ctrip=1' 分别指定（未指定的为 1）"""
+    if '=' not in value:
+        return {source: int(value) for source in sources}
+    limits = {source: 1 for source in sources}
+    for item in value.split(','):
+        source, _, n = item.partition('=')
+        limits[source.strip()] = int(n)
+    return limits
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    scraper.py crawl --cities hangzhou,shanghai --sources booking,ctrip --pages 2 --concurrency 2
+    不带参数时等同于 crawl，城市、数据源和页数也可以用 SCRAPER_CITIES / SCRAPER_SOURCES / SCRAPER_PAGES 指定
+    """
+    parser = argparse.ArgumentParser(prog='scraper.py', description='LocalPup 酒店数据爬虫')
+    commands = parser.add_subparsers(dest='command')
+    crawl = commands.add_parser('crawl', help='按 城市 × 数据源 抓取（默认命令）')
+    crawl.add_argument('--cities', default=os.environ.get('SCRAPER_CITIES', 'hangzhou'),
+                       help='逗号分隔的城市，城市键、英文名或中文名均可（默认 hangzhou）')
+    crawl.add_argument('--sources', default=os.environ.get('SCRAPER_SOURCES', ','.join(SOURCES)),
+                       help=f"逗号分隔的数据源（默认 {','.join(SOURCES)}）")
+    crawl.add_argument('--pages', type=int, default=int(os.environ.get('SCRAPER_PAGES', 2)),
+                       help='每个城市抓取的列表页数（默认 2）')
+    crawl.add_argument('--concurrency', type=int, default=None,
+                       help='同时运行的任务数上限（默认为数据源个数）')
+    crawl.add_argument('--per-source', default='1',
+                       help="每个数据源同时运行的任务数上限，如 2 或 booking=2,ctrip=1（默认 1）")
+    crawl.add_argument('--min-age-hours', type=float, default=0,
+                       help='跳过距上次成功抓取不足该小时数的 城市 × 数据源（默认 0，不跳过）')
+    commands.add_parser('cities', help='列出支持的城市')
+
+    argv = sys.argv[1:] if argv is None else argv
+    args = parser.parse_args(argv or ['crawl'])
+    if args.command != 'crawl':
+        return args
 
-        return photos
+    try:
+        args.cities = list(dict.fromkeys(resolve_city(city) for city in args.cities.split(',') if city.strip()))
+    except ValueError as e:
+        parser.error(str(e))
+    args.sources = [source.strip() for source in args.sources.split(',') if source.strip()]
+    unknown = [source for source in args.sources if source not in SOURCES]
+    if unknown or not args.sources or not args.cities:
+        parser.error(f"数据源未知或为空: {','.join(unknown)}（可选: {', '.join(SOURCES)}）")
+    try:
+        args.per_source = parse_source_concurrency(args.per_source, args.sources)
+    except ValueError:
+        parser.error(f"--per-source 格式错误: {args.per_source}")
+    if args.concurrency is None:
+        args.concurrency = len(args.sources)
+    return args
 
 
-async def main():
+async def main(argv: Optional[List[str]] = None):
     """主函数"""
+    args = parse_args(argv)
+    if args.command == 'cities':
+        for key, names in CITIES.items():
+            print(f"{key:<12}{names['booking']:<12}{names['ctrip']}")
+        return
+
     logger.info("=" * 50)
     logger.info("LocalPup 爬虫系统启动")
     logger.info("=" * 50)
@@ -522,56 +2160,194 @@ async def main():
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    # Booking 爬虫
-    booking = BookingScraper(max_retries=3, request_delay=2.0)
-    await booking.init_browser()
-
-    try:
-        booking_hotels = await booking.search_hotels(city="Hangzhou", pages=2)
-
-        # 保存结果
-        with open(f'data/booking_hotels_{timestamp}.json', 'w', encoding='utf-8') as f:
-            json.dump(booking_hotels, f, ensure_ascii=False, indent=2)
-
-        logger.info(f"[主程序] Booking 数据已保存: {len(booking_hotels)} 家酒店")
-
-        # 获取前3家酒店的详情
-        for hotel in booking_hotels[:3]:
-            if hotel.get('booking_url'):
-                details = await booking.get_hotel_details(hotel['booking_url'])
-                hotel.update(details)
-                await asyncio.sleep(2)
-
-    except Exception as e:
-        logger.error(f"[Booking] 爬取过程出错: {e}")
-    finally:
-        await booking.close()
+    # 城市 × 数据源 展开为任务，从未抓取过和最久没抓取的先跑
+    crawl_state = CrawlState.load(CRAWL_STATE_PATH)
+    jobs = plan_jobs(args.cities, args.sources, crawl_state, args.min_age_hours)
+    if not jobs:
+        logger.info(f"[主程序] 所有城市在 {args.min_age_hours} 小时内都已抓取过，没有需要运行的任务")
+        return
+    logger.info(f"[主程序] 计划 {len(jobs)} 个任务（每城市 {args.pages} 页，总并发 {args.concurrency}，"
+                f"各数据源并发 {args.per_source}）: {', '.join(f'{s}:{c}' for s, c in jobs)}")
+
+    # 增量模式：详情在 TTL 内抓取过的酒店只刷新列表页数据
+    known_hotels = None
+    if env_flag('SCRAPER_INCREMENTAL'):
+        known_hotels = KnownHotels.load()
+    detail_ttl_hours = float(os.environ.get('SCRAPER_DETAIL_TTL_HOURS', 24 * 7))
+    rate_limiter = AdaptiveRateLimiter(rate=0.5)
+    scraper_options = {
+        'max_retries': 3,
+        'request_delay': 2.0,
+        # 所有爬虫共用一个限速器，从每个域名 0.5 次/秒起按响应情况自适应
+        'rate_limiter': rate_limiter,
+        'known_hotels': known_hotels,
+        'detail_ttl_hours': detail_ttl_hours,
+        # 列表页优先解析页面的 JSON 接口响应并重放接口翻页，SCRAPER_CAPTURE_API=0 时只从 DOM 提取
+        'capture_api': env_flag('SCRAPER_CAPTURE_API', default=True),
+    }
 
-    # 携程爬虫
-    ctrip = CtripScraper(max_retries=3, request_delay=2.0)
-    await ctrip.init_browser()
+    # 响应缓存：SCRAPER_CACHE=1 时读写 data/cache；SCRAPER_REPLAY=1 时只从缓存回放，不访问网络
+    response_cache = None
+    replay = env_flag('SCRAPER_REPLAY')
+    if replay or env_flag('SCRAPER_CACHE'):
+        response_cache = ResponseCache(
+            os.environ.get('SCRAPER_CACHE_DIR', 'data/cache'),
+            ttl_hours=float(os.environ.get('SCRAPER_CACHE_TTL_HOURS', 24)),
+            replay=replay,
+        )
+        logger.info(f"[主程序] 响应缓存: {response_cache.directory}（{len(response_cache)} 条）"
+                    f"{'，回放模式' if replay else ''}")
+    scraper_options['response_cache'] = response_cache
+
+    # 运行指标：结束时写 logs/metrics_<时间>.json 和 Prometheus 文本（SCRAPER_METRICS_PROM）
+    metrics = ScrapeMetrics()
+    scraper_options['metrics'] = metrics
+
+    # 选择器命中统计跨运行保存，查找时命中多的选择器先试
+    selector_stats = SelectorStats.load(SELECTOR_STATS_PATH)
+    scraper_options['selector_stats'] = selector_stats
+
+    # 结果按页流式写入 JSONL，运行中即可 tail；SCRAPER_GZIP=1 时写 .jsonl.gz
+    suffix = '.jsonl.gz' if env_flag('SCRAPER_GZIP') else '.jsonl'
+    output_path = f'data/hotels_{timestamp}{suffix}'
+
+    # 断点续跑：上一次运行中途退出时沿用它的时间戳和输出文件，跳过已完成的任务、页面和详情；
+    # 超过 SCRAPER_RESUME_MAX_AGE_HOURS 的运行不再恢复，SCRAPER_RESUME=0 时忽略未完成的运行，重新开始
+    journal = RunJournal(JOURNAL_PATH, resume=env_flag('SCRAPER_RESUME', default=True),
+                         max_age_hours=float(os.environ.get('SCRAPER_RESUME_MAX_AGE_HOURS', 12)))
+    if journal.resumed:
+        timestamp = journal.meta['timestamp']
+        output_path = journal.meta['output']
+        suffix = '.jsonl.gz' if output_path.endswith('.gz') else '.jsonl'
+        logger.info(f"[主程序] 断点续跑 {timestamp} 的运行：已完成 {len(journal.jobs)} 个任务、"
+                    f"{len(journal.pages)} 页、{len(journal.details)} 个详情")
+    else:
+        if journal.expired:
+            logger.info(f"[主程序] 未完成的运行 {journal.meta.get('timestamp')} 已超过恢复期限，重新开始")
+        journal.start(timestamp=timestamp, output=output_path)
+    scraper_options['checkpoint'] = journal
+
+    jsonl_writer = JsonlPageWriter(output_path, metrics, resume=journal.resumed)
+
+    # 所有任务共用一个浏览器，每个任务使用独立的 context；同一域名的请求速率由共享限速器控制
+    browser_manager = BrowserManager()
+    orchestrator = ScrapeOrchestrator(browser_manager, [jsonl_writer], concurrency=args.concurrency,
+                                      source_concurrency=args.per_source)
+    planned = {}
+    for source, city in jobs:
+        scraper_cls, make_job = SOURCES[source]
+        name = f"{source}:{city}"
+        planned[name] = (source, city)
+        # 恢复的运行中已完成的任务，结果已在输出文件中
+        if journal.job_done(name):
+            logger.info(f"[主程序] 断点续跑：任务 {name} 已完成，跳过")
+            continue
+        orchestrator.add(source, scraper_cls(**scraper_options), make_job(city, args.pages),
+                         name=name)
 
     try:
-        ctrip_hotels = await ctrip.search_hotels(city="杭州", pages=2)
-
-        with open(f'data/ctrip_hotels_{timestamp}.json', 'w', encoding='utf-8') as f:
-            json.dump(ctrip_hotels, f, ensure_ascii=False, indent=2)
-
-        logger.info(f"[主程序] 携程数据已保存: {len(ctrip_hotels)} 家酒店")
-
-    except Exception as e:
-        logger.error(f"[Ctrip] 爬取过程出错: {e}")
+        results = await orchestrator.run()
     finally:
-        await ctrip.close()
+        await browser_manager.close()
+        jsonl_writer.close()
+
+    logger.info(f"[主程序] 各域名结束时的请求速率（次/秒）: {rate_limiter.rates()}")
+    if response_cache:
+        logger.info(f"[主程序] 响应缓存命中 {response_cache.hits} 次，未命中 {response_cache.misses} 次")
+
+    for name, result in results.items():
+        if result['error']:
+            logger.warning(f"[主程序] {name} 出错: {result['error']}")
+        else:
+            crawl_state.mark(*planned[name])
+            journal.record_job(name)
+        logger.info(f"[主程序] {name} 数据已保存: {result['count']} 家酒店")
+    crawl_state.save(CRAWL_STATE_PATH)
+
+    point_latest(output_path, f'data/latest_hotels{suffix}')
+    logger.info(f"[主程序] 数据已保存到 {output_path}: {jsonl_writer.writer.count} 家酒店")
+
+    # 跨平台合并：同一酒店的 Booking 和携程记录合并为一条
+    with metrics.timer('merge'):
+        merged_hotels = aggregate_ratings(resolve_hotels(map(HotelRecord.from_dict, read_records(output_path))))
+
+    # 图片校验：剔除失效链接，同一张图的不同尺寸和重复图片只保留一张，写入 hotel['gallery']；
+    # 回放模式不访问网络，SCRAPER_VALIDATE_IMAGES=0 时跳过，此时 Booking 缩略图不经校验直接换成大图 URL
+    if replay or not env_flag('SCRAPER_VALIDATE_IMAGES', default=True):
+        upgraded = upgrade_unvalidated(merged_hotels)
+        logger.info(f"[图片] 未校验图片，{upgraded} 张 Booking 缩略图直接换成大图 URL")
+    else:
+        with metrics.timer('images'):
+            image_stats = await validate_images(
+                merged_hotels, IMAGE_INDEX_PATH,
+                user_agent=BaseScraper.CONTEXT_OPTIONS.get('user_agent'),
+            )
+        for status in ('kept', 'broken', 'duplicates'):
+            metrics.inc('images_total', image_stats[status], status=status)
+        logger.info(f"[图片] 共 {image_stats['images']} 张，请求校验 {image_stats['checked']} 张"
+                    f"（{image_stats['cached']} 张沿用上次结果），失效 {image_stats['broken']} 张，"
+                    f"重复 {image_stats['duplicates']} 张，保留 {image_stats['kept']} 张")
+
+        # 衍生版本：WebP/AVIF 缩略图和 blurhash 在进程池中生成，写入按内容寻址的存储（SCRAPER_IMAGE_STORE）；
+        # 已处理过的图片不再下载和编码，SCRAPER_DERIVATIVES=0 时跳过
+        if env_flag('SCRAPER_DERIVATIVES', default=True):
+            pipeline = DerivativePipeline(
+                DerivativeStore(os.environ.get('SCRAPER_IMAGE_STORE', 'data/images')),
+                user_agent=BaseScraper.CONTEXT_OPTIONS.get('user_agent'),
+            )
+            with metrics.timer('derivatives'):
+                derivative_stats = await pipeline.run(merged_hotels)
+            metrics.inc('image_derivatives_total', derivative_stats['rendered'], status='rendered')
+            metrics.inc('image_derivatives_total', derivative_stats['failed'], status='failed')
+            logger.info(f"[图片] 衍生版本：{derivative_stats['images']} 张图片，{derivative_stats['cached']} 张已是最新，"
+                        f"下载 {derivative_stats['downloaded']} 张，生成 {derivative_stats['rendered']} 张，"
+                        f"失败 {derivative_stats['failed']} 张")
+    merged_path = f'data/merged_hotels_{timestamp}{suffix}'
+    with JsonlWriter(merged_path) as writer:
+        writer.write_page(merged_hotels)
+    point_latest(merged_path, f'data/latest_merged{suffix}')
+    merged_count = sum(1 for hotel in merged_hotels if hotel['source'] == 'merged')
+    logger.info(f"[主程序] 合并数据已保存: {len(merged_hotels)} 家酒店，其中 {merged_count} 家跨平台合并")
+
+    # 价格 / 评分历史：追加到按日期和数据源分区的 Parquet 数据集，并与上一次运行比较（SCRAPER_HISTORY=0 时跳过）
+    if env_flag('SCRAPER_HISTORY', default=True):
+        try:
+            with metrics.timer('history'):
+                report = await asyncio.to_thread(record_history, output_path, timestamp,
+                                                 os.environ.get('SCRAPER_HISTORY_DIR', 'data/history'))
+            if report:
+                logger.info(f"[历史] 与 {report['previous']} 相比: {report['summary']}")
+                if report['not_scraped']:
+                    logger.info("[历史] 本次未抓取（不计入变化）: " + ', '.join(
+                        f"{p['source']}:{p['city'] or '-'}" for p in report['not_scraped']))
+                with open(f'logs/changes_{timestamp}.json', 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"[历史] 写入失败: {e}")
 
-    # 合并结果
-    try:
-        all_hotels = booking_hotels + ctrip_hotels
-        with open('data/all_hotels.json', 'w', encoding='utf-8') as f:
-            json.dump(all_hotels, f, ensure_ascii=False, indent=2)
-        logger.info(f"[主程序] 合并数据已保存: {len(all_hotels)} 家酒店")
-    except Exception:
-        pass
+    # 设置 DATABASE_URL 时写入数据库（在线程中执行，不阻塞事件循环）
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url:
+        try:
+            await asyncio.to_thread(write_to_database, merged_hotels, results, database_url, metrics)
+        except Exception as e:
+            logger.error(f"[数据库] 写入失败: {e}")
+
+    selector_stats.save(SELECTOR_STATS_PATH)
+    for scraper_cls in (BookingScraper, CtripScraper):
+        for field, selector in selector_stats.promoted(scraper_cls.LOG_TAG, scraper_cls.SELECTORS).items():
+            logger.info(f"[选择器] {scraper_cls.LOG_TAG}.{field} 首选已调整为 {selector}")
+    metrics.log_summary()
+    metrics.write(f'logs/metrics_{timestamp}.json')
+    metrics.write(os.environ.get('SCRAPER_METRICS_PROM', 'logs/scraper.prom'))
+
+    unfinished = [name for name in planned if not journal.job_done(name)]
+    if unfinished:
+        logger.warning(f"[主程序] 任务 {', '.join(unfinished)} 未完成，保留运行日志，"
+                       f"{journal.max_age.total_seconds() / 3600:g} 小时内再次运行将只继续这些任务")
+    else:
+        journal.finish()
+    journal.close()
 
     logger.info("=" * 50)
     logger.info("爬虫任务完成")
@@ -0,0 +1,110 @@
+"""
+LocalPup 选择器命中统计
+记录每个字段的各个选择器是否命中，并在多次运行之间持久化
+
+每个选择器有一个 0~1 的得分（指数滑动平均，只反映最近的表现）：命中时向 1 靠拢；
+排在命中者前面、被尝试过却没命中的选择器向 0 靠拢。查找时得分低于 threshold 的选择器视为失效，
+排到后面，其余保持 SELECTORS 的声明顺序：网站改版后失效的主选择器不再每张卡片白跑一遍，
+而宽泛的备用选择器也不会因为"排在前面所以命中多"一直占据首位。
+
+- 以 explore 的概率按声明顺序查找，被降级的主选择器仍会被尝试，页面恢复后得分回升、重新排回首位
+- 得分按经过的时间向 1 回归（半衰期 half_life_days），很久没有观测到的选择器重新按声明顺序尝试
+"""
+
+import json
+import os
+import random
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+
+class SelectorStats:
+    """{scraper: {field: {selector: 得分}}}，没有记录的选择器视为可用（得分 1）"""
+
+    def __init__(self, scores: Dict[str, Dict[str, Dict[str, float]]] = None, alpha: float = 0.2,
+                 threshold: float = 0.5, explore: float = 0.05, rng: Optional[random.Random] = None):
+        """
+        scores: 已有的得分
+        alpha: 每次观测的权重（滑动平均的平滑系数）
+        threshold: 得分低于该值的选择器视为失效，排到可用的选择器之后
+        explore: 按声明顺序查找（不做排序）的概率
+        rng: 随机数生成器，测试时可传入固定种子的实例
+        """
+        self.scores = scores or {}
+        self.alpha = alpha
+        self.threshold = threshold
+        self.explore = explore
+        self._rng = rng or random.Random()
+
+    def record(self, scraper: str, field: str, selector: str, count: float = 1,
+               missed: Iterable[str] = ()):
+        """记录 selector 为 field 命中了 count 次；missed 是排在它前面、同样尝试了 count 次但没命中的选择器"""
+        selectors = self.scores.setdefault(scraper, {}).setdefault(field, {})
+        self._update(selectors, selector, 1.0, count)
+        for other in missed:
+            self._update(selectors, other, 0.0, count)
+
+    def _update(self, selectors: Dict[str, float], selector: str, outcome: float, count: float):
+        """count 次相同结果的滑动平均"""
+        keep = (1 - self.alpha) ** count
+        selectors[selector] = outcome + (selectors.get(selector, 1.0) - outcome) * keep
+
+    def order(self, scraper: str, field: str, selectors: List[str]) -> List[str]:
+        """查找顺序：失效的选择器排到后面；以 explore 的概率原样返回声明顺序"""
+        if self.explore and self._rng.random() < self.explore:
+            return selectors
+        return self.ranked(scraper, field, selectors)
+
+    def ranked(self, scraper: str, field: str, selectors: List[str]) -> List[str]:
+        """不含随机探索的排序：可用的选择器在前，各自保持声明顺序"""
+        scores = self.scores.get(scraper, {}).get(field)
+        if not scores or len(selectors) < 2:
+            return selectors
+        return sorted(selectors, key=lambda selector: scores.get(selector, 1.0) < self.threshold)
+
+    @classmethod
+    def load(cls, path: str, half_life_days: float = 7, **options) -> 'SelectorStats':
+        """读取上次保存的得分，按经过的时间向 1 回归；文件不存在、损坏或是旧格式时从空统计开始"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            scores = data['scores']
+            saved_at = datetime.fromisoformat(data['saved_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls(**options)
+        elapsed_days = max(0.0, (datetime.now() - saved_at).total_seconds() / 86400)
+        factor = 0.5 ** (elapsed_days / half_life_days)
+        for fields in scores.values():
+            for selectors in fields.values():
+                for selector in list(selectors):
+                    selectors[selector] = 1 - (1 - selectors[selector]) * factor
+                    if selectors[selector] > 0.99:
+                        # 与没有记录等价
+                        del selectors[selector]
+        return cls(scores, **options)
+
+    def save(self, path: str):
+        """先写临时文件再替换"""
+        data = {
+            'saved_at': datetime.now().isoformat(timespec='seconds'),
+            'scores': {
+                scraper: {
+                    field: {selector: round(score, 4) for selector, score in selectors.items()}
+                    for field, selectors in fields.items()
+                }
+                for scraper, fields in self.scores.items()
+            },
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def promoted(self, scraper: str, declared: Dict[str, List[str]]) -> Dict[str, str]:
+        """声明顺序第一个选择器已失效的字段 {field: 当前首选}"""
+        result = {}
+        for field, selectors in declared.items():
+            ordered = self.ranked(scraper, field, selectors)
+            if ordered and ordered[0] != selectors[0]:
+                result[field] = ordered[0]
+        return result
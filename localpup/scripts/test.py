@@ -9,11 +9,79 @@ import json
 import sys
 from datetime import datetime
 
+
+class FakeResponse:
+    def __init__(self, status=200):
+        self.status = status
+        self.headers = {}
+
+
+class FakePage:
+    """不启动浏览器的页面替身：只支持页面池、接口捕获和详情页导航用到的方法"""
+
+    def __init__(self, context=None):
+        self.context = context
+        self.closed = False
+        self.url = "about:blank"
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def on(self, event, handler):
+        pass
+
+    def remove_listener(self, event, handler):
+        pass
+
+    async def goto(self, url, **kwargs):
+        """记录导航；context.broken 中的 URL 模拟加载失败"""
+        self.context.visits.append(url)
+        if url in self.context.broken:
+            raise RuntimeError(f"加载失败: {url}")
+        self.url = url
+        return FakeResponse()
+
+    async def wait_for_selector(self, selector, **kwargs):
+        pass
+
+    async def query_selector(self, selector):
+        return None
+
+    async def query_selector_all(self, selector):
+        return []
+
+
+class FakeContext:
+    def __init__(self, broken=()):
+        self.pages = []
+        self.visits = []
+        self.broken = set(broken)
+
+    async def new_page(self):
+        self.pages.append(FakePage(self))
+        return self.pages[-1]
+
+
+def offline_scraper(cls, broken=(), **options):
+    """不连接网络和浏览器的爬虫实例，页面池由 FakeContext 提供页面；broken 中的 URL 导航失败"""
+    from scraper import PagePool
+    options.setdefault("http_first", False)
+    options.setdefault("capture_api", False)
+    scraper = cls(request_delay=0, **options)
+    scraper.context = FakeContext(broken)
+    scraper.page_pool = PagePool(scraper.context, scraper.concurrency)
+    return scraper
+
+
 class LocalPupTester:
     def __init__(self):
         self.results = []
         self.passed = 0
         self.failed = 0
+        self.benchmarks = []
         
     def log(self, test_name, status, message=""):
         """记录测试结果"""
@@ -39,7 +107,644 @@ class LocalPupTester:
             self.log("Database Connection", "PASS")
         except Exception as e:
             self.log("Database Connection", "FAIL", str(e))
-    
+
+    async def test_db_sink(self):
+        """测试数据库写入：时间按 UTC 写入；设置 DATABASE_URL 时在回滚的事务中实际写入并读回"""
+        import os
+        from datetime import timezone
+        try:
+            from db_sink import _parse_time, hotel_rows, image_rows, merge_batch
+            local = datetime(2026, 1, 1, 10, 0)
+            expected = local.astimezone(timezone.utc).replace(tzinfo=None)
+            if _parse_time(local.isoformat()) != expected:
+                raise AssertionError(f"lastScrapedAt 未转为 UTC: {_parse_time(local.isoformat())}")
+            merged = {"name": "Merged", "booking_url": "https://www.booking.com/hotel/cn/m.html?aid=1",
+                      "ctrip_url": "https://hotels.ctrip.com/hotels/9.html", "images": ["a.jpg"],
+                      "photos": [{"url": "b.jpg"}]}
+            keys = {row[0] for row in image_rows([merged])}
+            if keys != {hotel_rows([merged])[0][0]}:
+                raise AssertionError(f"图片行与酒店行的标识不一致: {keys}")
+            self.log("DB: lastScrapedAt 按 UTC 写入", "PASS")
+        except Exception as e:
+            self.log("DB: lastScrapedAt 按 UTC 写入", "FAIL", str(e))
+            return
+
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            print("⏭️  DB: 未设置 DATABASE_URL，跳过本地 Postgres 写入测试")
+            return
+        try:
+            import psycopg2
+            url = "https://www.booking.com/hotel/cn/localpup-sink-test.html"
+            booking_a = "https://www.booking.com/hotel/cn/localpup-sink-a.html"
+            booking_b = "https://www.booking.com/hotel/cn/localpup-sink-b.html"
+            ctrip_b = "https://hotels.ctrip.com/hotels/localpup-sink-b.html"
+            conn = psycopg2.connect(database_url)
+
+            def merge(cur, hotels):
+                merge_batch(cur, hotel_rows(hotels), image_rows(hotels))
+                # 同一事务中多次合并：临时表要到提交时才删除
+                cur.execute("DROP TABLE hotel_staging; DROP TABLE IF EXISTS image_staging")
+
+            try:
+                with conn.cursor() as cur:
+                    for price in (800, 500, 900):
+                        merge(cur, [{"name": "LocalPup Sink Test", "city": "Shanghai", "price": price,
+                                     "booking_url": url, "details_scraped_at": local.isoformat()}])
+                    cur.execute('SELECT "city", "priceRangeMin", "priceRangeMax", "lastScrapedAt" '
+                                'FROM "Hotel" WHERE "bookingUrl" = %s', (url,))
+                    row = cur.fetchone()
+
+                    # 已有两家酒店分别按 Booking / 携程链接匹配到同一条合并记录
+                    merge(cur, [{"name": "LocalPup Sink A", "booking_url": booking_a},
+                                {"name": "LocalPup Sink B", "booking_url": booking_b, "ctrip_url": ctrip_b}])
+                    merge(cur, [{"name": "LocalPup Sink A", "booking_url": booking_a, "ctrip_url": ctrip_b,
+                                 "images": ["https://cf.bstatic.com/localpup-sink.jpg"]}])
+                    cur.execute('SELECT h."bookingUrl", h."ctripUrl", COUNT(i.id) FROM "Hotel" h '
+                                'LEFT JOIN "HotelImage" i ON i."hotelId" = h.id '
+                                'WHERE h.name LIKE %s GROUP BY h.id ORDER BY h.name', ("LocalPup Sink _",))
+                    pair = cur.fetchall()
+            finally:
+                # 不留下测试数据
+                conn.rollback()
+                conn.close()
+            if row != ("Shanghai", 500, 900, expected):
+                raise AssertionError(f"读回的数据不符: {row}")
+            if pair != [(booking_a, None, 1), (booking_b, ctrip_b, 0)]:
+                raise AssertionError(f"链接被改写或图片挂到多家酒店: {pair}")
+            self.log("DB: 本地 Postgres 写入与读回（城市、价格区间、UTC 时间、链接与图片归属）", "PASS")
+        except Exception as e:
+            self.log("DB: 本地 Postgres 写入与读回（城市、价格区间、UTC 时间、链接与图片归属）", "FAIL", str(e))
+
+    async def test_run_journal(self):
+        """测试断点续跑：日志回放、按任务跳过、过期不恢复、截断的 JSONL 修复后续写"""
+        import gzip
+        import os
+        import tempfile
+        from datetime import timedelta
+        try:
+            from checkpoint import RunJournal
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "journal.jsonl")
+                journal = RunJournal(path)
+                journal.start(output="out.jsonl")
+                journal.record_page("booking", "杭州", 0, 25)
+                journal.record_detail("booking", "https://example.com/h1", {"address": "西湖区"})
+                journal.record_job("booking:hangzhou")
+                journal.close()
+                # 被中断写入的末行
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write('{"event": "page", "sou')
+
+                journal = RunJournal(path)
+                journal.close()
+                if not journal.resumed or journal.meta.get("output") != "out.jsonl":
+                    raise AssertionError("未完成的运行没有被恢复")
+                if not journal.page_done("booking", "杭州", 0) or journal.page_done("booking", "杭州", 1):
+                    raise AssertionError(f"已完成页面回放错误: {journal.pages}")
+                if journal.detail("booking", "https://example.com/h1") != {"address": "西湖区"}:
+                    raise AssertionError("详情结果未回放")
+                if not journal.job_done("booking:hangzhou") or journal.job_done("ctrip:hangzhou"):
+                    raise AssertionError(f"任务完成状态回放错误: {journal.jobs}")
+
+                journal = RunJournal(path, resume=False)
+                journal.close()
+                if journal.resumed or journal.pages or journal.jobs:
+                    raise AssertionError("resume=False 时仍恢复了旧进度")
+            self.log("Journal: 日志回放与按任务续跑", "PASS")
+        except Exception as e:
+            self.log("Journal: 日志回放与按任务续跑", "FAIL", str(e))
+
+        try:
+            from checkpoint import RunJournal
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "journal.jsonl")
+                started = (datetime.now() - timedelta(hours=13)).isoformat(timespec="seconds")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"event": "start", "started_at": started}) + "\n")
+                    f.write(json.dumps({"event": "job", "job": "booking:hangzhou"}) + "\n")
+                journal = RunJournal(path, max_age_hours=12)
+                journal.close()
+                if journal.resumed or not journal.expired or journal.jobs:
+                    raise AssertionError("超过 max_age_hours 的运行仍被恢复")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"event": "start", "started_at": started}) + "\n")
+                    f.write(json.dumps({"event": "finish"}) + "\n")
+                journal = RunJournal(path, max_age_hours=24)
+                journal.close()
+                if journal.resumed:
+                    raise AssertionError("已 finish 的运行被恢复")
+            self.log("Journal: 过期或已完成的运行不恢复", "PASS")
+        except Exception as e:
+            self.log("Journal: 过期或已完成的运行不恢复", "FAIL", str(e))
+
+        try:
+            from jsonl_io import JsonlWriter, read_jsonl
+            with tempfile.TemporaryDirectory() as tmp:
+                for name in ("hotels.jsonl", "hotels.jsonl.gz"):
+                    path = os.path.join(tmp, name)
+                    with JsonlWriter(path) as writer:
+                        writer.write_page([{"name": f"Hotel {i}"} for i in range(50)])
+                    # 模拟进程被杀：截掉文件末尾（半行 JSON / 没有写完的 gzip 成员）
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    with open(path, "wb") as f:
+                        f.write(data[:-7])
+                    survived = list(read_jsonl(path))
+                    # gzip 只截掉了尾部的校验和时记录仍然完整，但文件已不能直接续写
+                    if not survived or (name == "hotels.jsonl" and len(survived) == 50):
+                        raise AssertionError(f"{name}: 截断后读出 {len(survived)} 条")
+
+                    with JsonlWriter(path, resume=True) as writer:
+                        if writer.count != len(survived):
+                            raise AssertionError(f"{name}: 续写计数 {writer.count} != {len(survived)}")
+                        writer.write_page([{"name": "Resumed"}])
+                    records = list(read_jsonl(path))
+                    if records != survived + [{"name": "Resumed"}]:
+                        raise AssertionError(f"{name}: 续写后读出 {len(records)} 条")
+                    if name.endswith(".gz"):
+                        with gzip.open(path, "rt", encoding="utf-8") as f:
+                            f.read()
+            self.log("Journal: 截断的 JSONL / gzip 修复后续写", "PASS")
+        except Exception as e:
+            self.log("Journal: 截断的 JSONL / gzip 修复后续写", "FAIL", str(e))
+
+    async def test_hotel_matcher(self):
+        """测试跨平台酒店匹配：同一酒店的中英文名能匹配，只共享数字或城市名的不同酒店不匹配"""
+        try:
+            from hotel_matcher import HotelMatcher
+            matcher = HotelMatcher()
+            same = [
+                ("Hilton Shanghai", "上海希尔顿酒店", "Shanghai"),
+                ("Four Seasons Hotel Hangzhou at West Lake", "杭州西子湖四季酒店", "Hangzhou"),
+                ("Hanting Hotel Hangzhou Wulin 2", "汉庭酒店杭州武林店", "Hangzhou"),
+            ]
+            for english, chinese, city in same:
+                if not matcher.match([{"name": english}], [{"name": chinese}], city):
+                    raise AssertionError(f"未匹配: {english} / {chinese}")
+            different = [
+                ("Shanghai Inn 99", "北京宾馆99号"),
+                ("Hilton Shanghai", "北京希尔顿酒店"),
+                ("Hotel 1", "酒店2"),
+            ]
+            for english, chinese in different:
+                matches = matcher.match([{"name": english}], [{"name": chinese}])
+                if matches:
+                    raise AssertionError(f"误匹配: {english} / {chinese} ({matches[0][2]})")
+            self.log("Matcher: 中英文名匹配与误匹配", "PASS")
+        except Exception as e:
+            self.log("Matcher: 中英文名匹配与误匹配", "FAIL", str(e))
+
+        try:
+            from hotel_matcher import resolve_hotels
+            hotels = [
+                {"name": "Hilton", "source": "booking", "city": "Shanghai",
+                 "booking_url": "https://www.booking.com/hotel/cn/hilton-shanghai.html"},
+                {"name": "希尔顿酒店", "source": "ctrip", "city": "Beijing",
+                 "ctrip_url": "https://hotels.ctrip.com/hotels/1.html"},
+                {"name": "希尔顿酒店", "source": "ctrip", "city": "Shanghai",
+                 "ctrip_url": "https://hotels.ctrip.com/hotels/2.html"},
+            ]
+            resolved = resolve_hotels(hotels)
+            merged = [h for h in resolved if h.get("source") == "merged"]
+            if len(resolved) != 2 or len(merged) != 1:
+                raise AssertionError(f"合并结果: {[h.get('name') for h in resolved]}")
+            if merged[0].get("ctrip_url") != hotels[2]["ctrip_url"]:
+                raise AssertionError(f"跨城市合并: {merged[0].get('ctrip_url')}")
+            self.log("Matcher: 只在同一城市内合并", "PASS")
+        except Exception as e:
+            self.log("Matcher: 只在同一城市内合并", "FAIL", str(e))
+
+        try:
+            from hotel_matcher import normalize_name, resolve_hotels
+            # 同一个商圈名在两个城市有不同的译名：南京"鼓楼"区是 Gulou，西安"鼓楼"是 Drum Tower
+            translated = (normalize_name("鼓楼酒店", "Nanjing"), normalize_name("鼓楼酒店", "Xi'an"))
+            if translated != ("gulou", "drum tower"):
+                raise AssertionError(f"商圈名未按城市翻译: {translated}")
+            if normalize_name("西湖饭店", "Shanghai") != "西湖":
+                raise AssertionError("杭州的商圈名被用于上海的记录")
+            hotels = [
+                {"name": "Gulou Hotel", "source": "booking", "city": "Nanjing",
+                 "booking_url": "https://www.booking.com/hotel/cn/gulou-nanjing.html"},
+                {"name": "鼓楼酒店", "source": "ctrip", "city": "Nanjing",
+                 "ctrip_url": "https://hotels.ctrip.com/hotels/11.html"},
+                {"name": "Drum Tower Hotel", "source": "booking", "city": "Xi'an",
+                 "booking_url": "https://www.booking.com/hotel/cn/drum-tower-xian.html"},
+                {"name": "鼓楼酒店", "source": "ctrip", "city": "Xi'an",
+                 "ctrip_url": "https://hotels.ctrip.com/hotels/12.html"},
+            ]
+            pairs = {h["booking_url"]: h["ctrip_url"] for h in resolve_hotels(hotels) if h.get("source") == "merged"}
+            if pairs != {hotels[0]["booking_url"]: hotels[1]["ctrip_url"],
+                         hotels[2]["booking_url"]: hotels[3]["ctrip_url"]}:
+                raise AssertionError(f"合并结果: {pairs}")
+            self.log("Matcher: 商圈名只按所在城市翻译", "PASS")
+        except Exception as e:
+            self.log("Matcher: 商圈名只按所在城市翻译", "FAIL", str(e))
+
+    async def test_rate_limiter(self):
+        """测试按域名的 AIMD 限速：被限流时速率减半并暂停，正常响应逐步加速，各域名互不影响"""
+        try:
+            from scraper import AdaptiveRateLimiter
+            limiter = AdaptiveRateLimiter(rate=1.0, min_rate=0.3, max_rate=1.2, increase=0.1,
+                                          decrease=0.5, base_backoff=5.0, max_backoff=60.0)
+            url = "https://www.booking.com/searchresults.html"
+            limiter.record_success(url)
+            if abs(limiter.rates()["www.booking.com"] - 1.1) > 1e-9:
+                raise AssertionError(f"正常响应后速率: {limiter.rates()}")
+            limiter.record_success(url)
+            limiter.record_success(url)
+            if limiter.rates()["www.booking.com"] != 1.2:
+                raise AssertionError(f"速率超过 max_rate: {limiter.rates()}")
+
+            delays = [limiter.record_throttle(url) for _ in range(3)]
+            if limiter.rates()["www.booking.com"] != 0.3:
+                raise AssertionError(f"速率低于 min_rate 或未降低: {limiter.rates()}")
+            if not (5.0 <= delays[0] <= 7.5 and 20.0 <= delays[2] <= 30.0):
+                raise AssertionError(f"暂停时间未指数增长: {delays}")
+            if limiter.record_throttle(url, retry_after=120) != 60.0:
+                raise AssertionError("Retry-After 未按 max_backoff 截断")
+            if "hotels.ctrip.com" in limiter.rates():
+                raise AssertionError("限流影响了其他域名")
+            self.log("RateLimit: AIMD 速率调整与退避", "PASS")
+        except Exception as e:
+            self.log("RateLimit: AIMD 速率调整与退避", "FAIL", str(e))
+
+    async def test_hotel_record(self):
+        """测试酒店记录：与 dict 往返一致，额外字段保留，时间戳按 ISO 字符串读写"""
+        try:
+            from hotel_record import HotelRecord
+            data = {
+                "name": "Hilton Shanghai", "source": "booking", "city": "Shanghai", "price": 880,
+                "scraped_at": "2026-01-01T10:00:00", "details_scraped_at": None,
+                "images": ["https://cf.bstatic.com/1.jpg"], "room_types": ["Deluxe"],
+            }
+            record = HotelRecord.from_dict(data)
+            if record.to_dict() != data or dict(record) != data:
+                raise AssertionError(f"往返不一致: {record.to_dict()}")
+            if HotelRecord.from_dict(record) is not record:
+                raise AssertionError("from_dict 对已有记录重复构造")
+            if json.loads(json.dumps(record.to_dict())) != data:
+                raise AssertionError("JSON 往返不一致")
+
+            if record["scraped_at"] != "2026-01-01T10:00:00" or not isinstance(record.scraped_at, float):
+                raise AssertionError(f"时间戳存取错误: {record.scraped_at!r}")
+            record["details_scraped_at"] = datetime(2026, 1, 2, 8, 30)
+            if record.get("details_scraped_at") != "2026-01-02T08:30:00":
+                raise AssertionError(f"datetime 未按 ISO 读出: {record.get('details_scraped_at')}")
+
+            if record["room_types"] != ["Deluxe"] or "room_types" not in record:
+                raise AssertionError("额外字段丢失")
+            if "address" in record or record.get("address", "-") != "-" or record.get("missing") is not None:
+                raise AssertionError("未赋值字段被当作存在")
+            del record["room_types"]
+            record["address"] = "上海市"
+            if "room_types" in record or record.get("address") != "上海市":
+                raise AssertionError(f"删除/新增字段错误: {list(record)}")
+            if record["source"] is not HotelRecord(source="".join(["boo", "king"]))["source"]:
+                raise AssertionError("source 未驻留")
+            self.log("Record: HotelRecord 与 dict / JSON 往返", "PASS")
+        except Exception as e:
+            self.log("Record: HotelRecord 与 dict / JSON 往返", "FAIL", str(e))
+
+    async def test_ctrip_listing_pool(self):
+        """测试携程 DOM 翻页：列表页跨 yield 持有时，concurrency=1 下消费方仍能借到池中页面抓取照片"""
+        try:
+            from hotel_record import HotelRecord
+            from scraper import CtripScraper
+            scraper = offline_scraper(CtripScraper, concurrency=1)
+
+            async def loaded(*args, **kwargs):
+                return True
+
+            async def nothing(*args, **kwargs):
+                pass
+
+            async def extract(page, p):
+                return [HotelRecord(name=f"酒店{p}", source="ctrip",
+                                    ctrip_url=f"https://hotels.ctrip.com/hotels/{p}.html")]
+
+            async def photos(url):
+                async with scraper.page_pool.page():
+                    return []
+
+            scraper._retry_request = loaded
+            scraper._next_page = loaded
+            scraper._scroll_to_load = nothing
+            scraper._extract_hotels = extract
+            scraper.get_official_photos = photos
+
+            async def consume():
+                count = 0
+                async for hotels in scraper.iter_pages("杭州", 2):
+                    await scraper.fetch_photos(hotels)
+                    count += len(hotels)
+                return count
+
+            count = await asyncio.wait_for(consume(), timeout=5)
+            if count != 2:
+                raise AssertionError(f"产出 {count} 家酒店")
+            self.log("Scraper: concurrency=1 时携程翻页与照片抓取不互相等待", "PASS")
+        except asyncio.TimeoutError:
+            self.log("Scraper: concurrency=1 时携程翻页与照片抓取不互相等待", "FAIL", "死锁：5 秒内没有完成")
+        except Exception as e:
+            self.log("Scraper: concurrency=1 时携程翻页与照片抓取不互相等待", "FAIL", str(e))
+
+    async def test_streaming_output(self):
+        """测试流式输出：每页产出后立即写入 JSONL（含 gzip），运行中可读；任务中途出错时已产出的页面保留"""
+        import os
+        import tempfile
+        try:
+            from jsonl_io import read_records
+            from scraper import BookingScraper, JsonlPageWriter, ScrapeOrchestrator
+            for suffix in (".jsonl", ".jsonl.gz"):
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = os.path.join(tmp, f"hotels{suffix}")
+                    writer = JsonlPageWriter(path)
+                    scraper = offline_scraper(BookingScraper)
+                    seen_mid_run = []
+
+                    async def nothing(*args, **kwargs):
+                        pass
+
+                    async def job(booking):
+                        yield [{"name": "酒店1", "source": "booking"}, {"name": "酒店2", "source": "booking"}]
+                        # 第二页开始前，上一页已经可以从文件读到
+                        seen_mid_run.extend(hotel["name"] for hotel in read_records(path))
+                        raise RuntimeError("第二页被限流")
+
+                    scraper.init_browser = nothing
+                    scraper.close = nothing
+                    orchestrator = ScrapeOrchestrator(browser_manager=object(), page_handlers=[writer])
+                    orchestrator.add("booking", scraper, job)
+                    results = await orchestrator.run()
+                    writer.close()
+                    if seen_mid_run != ["酒店1", "酒店2"]:
+                        raise AssertionError(f"{suffix}: 运行中读到 {seen_mid_run}")
+                    if results["booking"]["count"] != 2 or not results["booking"]["error"]:
+                        raise AssertionError(f"{suffix}: 任务结果不符 {results}")
+                    if [hotel["name"] for hotel in read_records(path)] != ["酒店1", "酒店2"]:
+                        raise AssertionError(f"{suffix}: 出错后已写入的页面丢失")
+            self.log("Output: 按页流式写入 JSONL，运行中可读", "PASS")
+        except Exception as e:
+            self.log("Output: 按页流式写入 JSONL，运行中可读", "FAIL", str(e))
+
+    async def test_crawl_schedule(self):
+        """测试抓取计划：最久没抓取的城市先跑，TTL 内的跳过；编排器遵守总并发和每个数据源的并发上限"""
+        import os
+        import tempfile
+        from datetime import timedelta
+        try:
+            from crawl_schedule import CrawlState, plan_jobs, resolve_city
+            from scraper import BookingScraper, CtripScraper, ScrapeOrchestrator
+            if [resolve_city(name) for name in ("杭州", "Xi'an", "SHANGHAI")] != ["hangzhou", "xian", "shanghai"]:
+                raise AssertionError("城市名未统一为 CITIES 的键")
+            now = datetime(2026, 1, 10, 2, 0)
+            state = CrawlState()
+            state.mark("booking", "hangzhou", now - timedelta(days=3))
+            state.mark("ctrip", "hangzhou", now - timedelta(hours=2))
+            state.mark("booking", "shanghai", now - timedelta(days=1))
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "crawl_state.json")
+                state.save(path)
+                state = CrawlState.load(path)
+            jobs = plan_jobs(["hangzhou", "shanghai"], ["booking", "ctrip"], state, now=now)
+            expected = [("ctrip", "shanghai"), ("booking", "hangzhou"), ("booking", "shanghai"), ("ctrip", "hangzhou")]
+            if jobs != expected:
+                raise AssertionError(f"任务顺序不符: {jobs}")
+            if plan_jobs(["hangzhou", "shanghai"], ["booking", "ctrip"], state, min_age_hours=12, now=now) != expected[:3]:
+                raise AssertionError("TTL 内抓取过的任务没有跳过")
+
+            running = {"booking": 0, "ctrip": 0, None: 0}
+            peak = dict(running)
+
+            async def nothing(*args, **kwargs):
+                pass
+
+            def job(source):
+                async def run(scraper):
+                    for key in (source, None):
+                        running[key] += 1
+                        peak[key] = max(peak[key], running[key])
+                    await asyncio.sleep(0.01)
+                    for key in (source, None):
+                        running[key] -= 1
+                    yield [{"name": source}]
+                return run
+
+            orchestrator = ScrapeOrchestrator(browser_manager=object(), concurrency=3,
+                                              source_concurrency={"ctrip": 1})
+            for i, (source, cls) in enumerate([("booking", BookingScraper), ("ctrip", CtripScraper)] * 3):
+                scraper = offline_scraper(cls)
+                scraper.init_browser = nothing
+                scraper.close = nothing
+                orchestrator.add(source, scraper, job(source), name=f"{source}:{i}")
+            results = await orchestrator.run()
+            if sum(result["count"] for result in results.values()) != 6:
+                raise AssertionError(f"任务结果不符: {results}")
+            if peak["ctrip"] != 1 or peak[None] > 3 or peak["booking"] < 2:
+                raise AssertionError(f"并发上限不符: {peak}")
+            self.log("Schedule: 按抓取时间排序任务，遵守并发上限", "PASS")
+        except Exception as e:
+            self.log("Schedule: 按抓取时间排序任务，遵守并发上限", "FAIL", str(e))
+
+    async def test_price_history(self):
+        """测试价格历史：两次运行的差异只比较都抓取了的 (数据源, 城市)，按日期分区查询价格趋势"""
+        import tempfile
+        from datetime import date
+        try:
+            from price_history import PriceHistory, summarize
+
+            def hotel(n, city, price, source="booking", rating=8.5):
+                url = (f"https://www.booking.com/hotel/cn/h{n}.html?aid=1" if source == "booking"
+                       else f"https://hotels.ctrip.com/hotels/{n}.html")
+                return {"name": f"酒店{n}", "source": source, "city": city, "price": price,
+                        f"{source}_rating": rating, f"{source}_url": url}
+
+            with tempfile.TemporaryDirectory() as tmp:
+                history = PriceHistory(tmp)
+                history.append("run1", [hotel(1, "Hangzhou", 500), hotel(2, "Hangzhou", 600),
+                                        hotel(3, "Hangzhou", 700), hotel(4, "Shanghai", 800),
+                                        hotel(5, "Hangzhou", 300, source="ctrip")],
+                               run_time=datetime(2026, 1, 1, 2, 0))
+                # 第二次运行：上海和携程没有抓取；酒店 1 调价，酒店 3 下架，酒店 6 新上架
+                history.append("run2", [hotel(1, "Hangzhou", 550), hotel(2, "Hangzhou", 600),
+                                        hotel(6, "Hangzhou", 900)],
+                               run_time=datetime(2026, 1, 2, 2, 0))
+                history = PriceHistory(tmp)
+                changes = {change["hotel_key"].rsplit("/", 1)[1]: change for change in history.diff("run1", "run2")}
+                if {key: change["change"] for key, change in changes.items()} != {
+                        "h1.html": "changed", "h3.html": "removed", "h6.html": "added"}:
+                    raise AssertionError(f"差异不符: {changes}")
+                if changes["h1.html"]["fields"] != {"price": [500, 550]}:
+                    raise AssertionError(f"字段变化不符: {changes['h1.html']}")
+                if summarize(list(changes.values())) != {"added": 1, "removed": 1, "changed": 1, "price": 1}:
+                    raise AssertionError("变化汇总不符")
+                coverage = history.coverage("run1", "run2")
+                if coverage["not_scraped"] != [{"source": "booking", "city": "Shanghai"},
+                                               {"source": "ctrip", "city": "Hangzhou"}]:
+                    raise AssertionError(f"未抓取的分区不符: {coverage}")
+                trend = history.trend("https://www.booking.com/hotel/cn/h1.html")
+                if [(row["run_id"], row["price"]) for row in trend] != [("run1", 500), ("run2", 550)]:
+                    raise AssertionError(f"价格趋势不符: {trend}")
+                if history.scan(since=date(2026, 1, 2)).column("run_id").unique().to_pylist() != ["run2"]:
+                    raise AssertionError("日期范围查询读到了范围外的运行")
+            self.log("History: 运行间差异与价格趋势", "PASS")
+        except Exception as e:
+            self.log("History: 运行间差异与价格趋势", "FAIL", str(e))
+
+    async def test_detail_fetcher(self):
+        """测试详情抓取：坏 URL 只在 _retry_request 中重试一轮，worker 不再叠加重试；单个 URL 出错不影响其他 URL"""
+        try:
+            from scraper import CtripScraper, DetailFetcher
+            good = "https://hotels.ctrip.com/hotels/1.html"
+            bad = "https://hotels.ctrip.com/hotels/2.html"
+            scraper = offline_scraper(CtripScraper, broken=[bad], max_retries=3, concurrency=2)
+            hotels = [{"name": "有照片页", "ctrip_url": good}, {"name": "打不开", "ctrip_url": bad}]
+            summary = await scraper.fetch_photos(hotels)
+            visits = scraper.context.visits
+            if (visits.count(good), visits.count(bad)) != (1, 3):
+                raise AssertionError(f"导航次数不符（期望 1 / 3）: {visits.count(good)} / {visits.count(bad)}")
+            if (summary["succeeded"], summary["failed"], summary["retried"]) != (1, 1, 0):
+                raise AssertionError(f"统计不符: {summary}")
+
+            async def fetch(url):
+                if url == "boom":
+                    raise RuntimeError(url)
+                return url.upper()
+
+            fetcher = DetailFetcher(fetch, workers=2, retries=1, backoff=0)
+            results = await asyncio.wait_for(fetcher.run(["a", "boom", "b"]), timeout=5)
+            if results != {"a": "A", "boom": None, "b": "B"} or (fetcher.failed, fetcher.retried) != (1, 1):
+                raise AssertionError(f"worker 结果不符: {results}")
+            self.log("Scraper: 详情抓取只有一层重试", "PASS")
+        except Exception as e:
+            self.log("Scraper: 详情抓取只有一层重试", "FAIL", str(e))
+
+    async def test_detail_freshness(self):
+        """测试增量抓取：没有官方照片的酒店也记录抓取时间，下一次运行在 TTL 内跳过；加载失败的下次重抓"""
+        import os
+        import tempfile
+        try:
+            from jsonl_io import JsonlWriter
+            from scraper import CtripScraper, KnownHotels
+            empty = "https://hotels.ctrip.com/hotels/1.html"
+            bad = "https://hotels.ctrip.com/hotels/2.html"
+            scraper = offline_scraper(CtripScraper, broken=[bad], max_retries=1)
+            hotels = [{"name": "无官方照片", "ctrip_url": empty}, {"name": "打不开", "ctrip_url": bad}]
+            await scraper.fetch_photos(hotels)
+            if hotels[0].get("photos") != [] or not hotels[0].get("details_scraped_at"):
+                raise AssertionError(f"空相册没有记录抓取时间: {hotels[0]}")
+            if "details_scraped_at" in hotels[1]:
+                raise AssertionError("加载失败的页面被记为已抓取")
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "hotels.jsonl")
+                with JsonlWriter(path) as writer:
+                    writer.write_page(hotels)
+                known = KnownHotels.from_file(path)
+            rerun = offline_scraper(CtripScraper, broken=[bad], max_retries=1, known_hotels=known)
+            again = [{"name": "无官方照片", "ctrip_url": empty}, {"name": "打不开", "ctrip_url": bad}]
+            await rerun.fetch_photos(again)
+            if rerun.context.visits != [bad]:
+                raise AssertionError(f"第二次运行导航了 {rerun.context.visits}")
+            if again[0].get("details_scraped_at") != hotels[0]["details_scraped_at"]:
+                raise AssertionError("跳过的酒店没有补回抓取时间")
+            self.log("Scraper: 空相册的酒店在 TTL 内不重复抓取", "PASS")
+        except Exception as e:
+            self.log("Scraper: 空相册的酒店在 TTL 内不重复抓取", "FAIL", str(e))
+
+    async def test_selector_stats(self):
+        """测试选择器排序：主选择器失效后降级，页面恢复后经探索重新排回首位；统计按时间回归"""
+        import os
+        import random
+        import tempfile
+        try:
+            from selector_stats import SelectorStats
+            declared = ['[data-testid="title"]', '.hotel-name', '[class*="title"]']
+            primary, broad = declared[0], declared[2]
+            stats = SelectorStats(explore=0.1, rng=random.Random(7))
+
+            def run_page(primary_works):
+                # 模拟一页 25 张卡片的提取：按 order 的顺序查找，宽泛的备用选择器总能命中
+                tried = stats.order("Booking", "name", declared)
+                hit = next(s for s in tried if s != '.hotel-name' and (s != primary or primary_works))
+                stats.record("Booking", "name", hit, 25, tried[:tried.index(hit)])
+
+            for _ in range(3):
+                run_page(primary_works=False)
+            if stats.ranked("Booking", "name", declared)[0] != broad:
+                raise AssertionError(f"失效的主选择器没有降级: {stats.scores}")
+            if stats.promoted("Booking", {"name": declared}) != {"name": broad}:
+                raise AssertionError("promoted 未报告首选变化")
+
+            # 页面恢复：备用选择器同样能命中，只有探索时会尝试主选择器
+            for _ in range(100):
+                run_page(primary_works=True)
+                if stats.ranked("Booking", "name", declared)[0] == primary:
+                    break
+            if stats.ranked("Booking", "name", declared)[0] != primary:
+                raise AssertionError(f"主选择器恢复后没有排回首位: {stats.scores}")
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "selector_stats.json")
+                stats.record("Booking", "name", broad, 25, [primary])
+                stats.save(path)
+                if SelectorStats.load(path).ranked("Booking", "name", declared)[0] != broad:
+                    raise AssertionError("刚保存的统计被回归")
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                data["saved_at"] = "2020-01-01T00:00:00"
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                if SelectorStats.load(path).ranked("Booking", "name", declared)[0] != primary:
+                    raise AssertionError("长时间未观测的统计没有按时间回归")
+            self.log("Selector: 主选择器降级与恢复", "PASS")
+        except Exception as e:
+            self.log("Selector: 主选择器降级与恢复", "FAIL", str(e))
+
+    async def test_rating_aggregator(self):
+        """测试综合评分：与 src/lib/rating-converter.ts 的 getRatingStats 输出逐条一致"""
+        try:
+            from rating_aggregator import aggregate_ratings
+            # (输入, TS 版 weightedScore, totalReviews)；期望值由 rating-converter.ts 在 Node 中计算得出
+            cases = [
+                (dict(booking_rating=8.6, booking_review_count=1200), 8.6, 1200),
+                (dict(booking_rating=8.4, booking_review_count=350, ctrip_rating=4.7, ctrip_review_count=2500),
+                 8.2, 2850),
+                # 只有国内平台，飞猪缺评论数（置信度 0.5），Booking 缺失时按 8.8 拉回
+                (dict(ctrip_rating=4.2, ctrip_review_count=80, fliggy_rating=4.8), 8.6, 80),
+                (dict(booking_rating=9.1, booking_review_count=900, agoda_rating=8.7, agoda_review_count=40,
+                      hotelscom_rating=9.0, hotelscom_review_count=600, airbnb_rating=4.55, airbnb_review_count=99,
+                      ctrip_rating=4.6, ctrip_review_count=3000, fliggy_rating=4.4, fliggy_review_count=150),
+                 8.9, 4789),
+                # 无数据：8.5 与 8.8 的差在浮点下略大于 0.3，TS 版结果为 9.0
+                ({}, 9.0, 0),
+                (dict(airbnb_rating=4.55, airbnb_review_count=99), 8.6, 99),
+                (dict(booking_rating=6.5, booking_review_count=20), 7.0, 20),
+                (dict(agoda_rating=8.25, hotelscom_rating=8.35, hotelscom_review_count=120), 9.0, 120),
+                (dict(booking_rating=8.15, ctrip_rating=3.2, ctrip_review_count=10), 8.0, 10),
+                # 国际平台的权重 × 置信度决定加权平均（任一平台权重或 Airbnb 调整改变都会改变结果）
+                (dict(booking_rating=9.0, booking_review_count=300, agoda_rating=7.8, agoda_review_count=50,
+                      hotelscom_rating=9.1, hotelscom_review_count=1500), 8.7, 1850),
+                (dict(agoda_rating=9.4, agoda_review_count=1500, hotelscom_rating=8.2, hotelscom_review_count=1500),
+                 8.8, 3000),
+                (dict(agoda_rating=7.9, agoda_review_count=300, hotelscom_rating=9.4), 9.0, 300),
+                (dict(booking_rating=9.1, booking_review_count=300, agoda_rating=9.4, agoda_review_count=1500,
+                      hotelscom_rating=7.7, hotelscom_review_count=50, airbnb_rating=4.5, airbnb_review_count=1500),
+                 8.9, 3350),
+                (dict(booking_rating=9.3, booking_review_count=50, agoda_rating=8.8, agoda_review_count=700,
+                      hotelscom_rating=9.5, hotelscom_review_count=300, airbnb_rating=4.2, airbnb_review_count=1500),
+                 9.0, 2550),
+            ]
+            hotels = aggregate_ratings([dict(fields) for fields, _, _ in cases])
+            for (fields, score, reviews), hotel in zip(cases, hotels):
+                if (hotel["overall_rating"], hotel["review_count"]) != (score, reviews):
+                    raise AssertionError(f"{fields}: 期望 {(score, reviews)}，"
+                                         f"得到 {(hotel['overall_rating'], hotel['review_count'])}")
+            self.log("Rating: 与 rating-converter.ts 结果一致", "PASS")
+        except Exception as e:
+            self.log("Rating: 与 rating-converter.ts 结果一致", "FAIL", str(e))
+
     async def test_api_endpoints(self):
         """测试 API 端点"""
         endpoints = [
@@ -69,9 +774,62 @@ class LocalPupTester:
                 self.log(f"Scraper: {test}", "PASS")
             except Exception as e:
                 self.log(f"Scraper: {test}", "FAIL", str(e))
-    
+
+        try:
+            from listing_api import paginate_request
+            url = "https://m.ctrip.com/restapi/soa2/31454/fetchHotelList"
+            body = json.dumps({"paging": {"pageIndex": 1, "pageSize": 10}, "cityId": 17})
+            _, page_3 = paginate_request(url, body, 2, 25)
+            if json.loads(page_3)["paging"] != {"pageIndex": 3, "pageSize": 10}:
+                raise AssertionError(f"页码改写错误: {page_3}")
+            next_url, _ = paginate_request("https://www.booking.com/dml/graphql?offset=0&rows=25", None, 1, 10)
+            if not next_url.endswith("offset=25&rows=25"):
+                raise AssertionError(f"偏移量改写错误: {next_url}")
+            self.log("Scraper: 列表接口翻页请求改写", "PASS")
+        except Exception as e:
+            self.log("Scraper: 列表接口翻页请求改写", "FAIL", str(e))
+
     async def test_image_validation(self):
         """测试图片抓取和验证"""
+        try:
+            from image_check import canonical_image_url, candidate_urls
+            variants = [
+                ("https://cf.bstatic.com/xdata/images/hotel/max300/1.jpg?k=a",
+                 "https://cf.bstatic.com/xdata/images/hotel/max1024x768/1.jpg?k=a"),
+                ("//dimg04.c-ctrip.com/images/0200g1.jpg",
+                 "https://dimg04.c-ctrip.com/images/0200g1_R_300_225.jpg"),
+            ]
+            for small, large in variants:
+                if canonical_image_url(small) != canonical_image_url(large):
+                    raise AssertionError(f"尺寸变体未归并: {small} / {large}")
+            if candidate_urls([variants[0][0]])[0] != variants[0][1]:
+                raise AssertionError("Booking 缩略图未优先尝试大图")
+            self.log("Image: 图片 URL 规范化与尺寸变体归并", "PASS")
+        except Exception as e:
+            self.log("Image: 图片 URL 规范化与尺寸变体归并", "FAIL", str(e))
+
+        import os
+        import tempfile
+        try:
+            from db_sink import image_rows
+            from image_check import ImageIndex, content_hash
+            digest = content_hash(b"image bytes")
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "image_index.json")
+                index = ImageIndex()
+                index.put("https://a/1.jpg", "https://a/1.jpg", f"{'0' * 40}:2048", 2048)
+                index.put("https://a/2.jpg", "https://a/2.jpg", f"{digest}:2048", 2048)
+                index.save(path)
+                if list(ImageIndex.load(path).urls) != ["https://a/2.jpg"]:
+                    raise AssertionError("旧的 sha1 指纹没有被丢弃")
+            hotel = {"booking_url": "https://www.booking.com/hotel/cn/x.html",
+                     "gallery": [{"url": "https://a/2.jpg", "content_hash": digest}]}
+            if image_rows([hotel])[0][6] != digest:
+                raise AssertionError("gallery 的 content_hash 没有写入 contentHash")
+            self.log("Image: 指纹与 contentHash 共用 content_hash（sha256）", "PASS")
+        except Exception as e:
+            self.log("Image: 指纹与 contentHash 共用 content_hash（sha256）", "FAIL", str(e))
+
         checks = [
             "图片 URL 有效性",
             "官方照片过滤（非评论照片）",
@@ -103,6 +861,21 @@ class LocalPupTester:
             except Exception as e:
                 self.log(f"Page: {page}", "FAIL", str(e))
     
+    async def test_parser_benchmarks(self):
+        """用录制的页面离线跑解析基准，性能低于阈值时记为失败"""
+        try:
+            from parser_bench import ParserBenchmark
+            self.benchmarks = await ParserBenchmark().run()
+        except Exception as e:
+            self.log("Benchmark: 解析基准", "FAIL", str(e))
+            return
+
+        for result in self.benchmarks:
+            status = result['status']
+            message = "; ".join(result['violations'])
+            self.log(f"Benchmark: {result['name']} ({result['items_per_sec']} 条/秒, "
+                     f"{result['ms_per_page']} ms/页)", status, message)
+
     async def test_scheduled_tasks(self):
         """测试定时任务"""
         tasks = [
@@ -127,6 +900,7 @@ class LocalPupTester:
                 "success_rate": f"{(self.passed / len(self.results) * 100):.1f}%"
             },
             "results": self.results,
+            "benchmarks": self.benchmarks,
             "generated_at": datetime.now().isoformat()
         }
         
@@ -151,9 +925,23 @@ class LocalPupTester:
         print("\n🚀 LocalPup 自动化测试开始\n")
         
         await self.test_database_connection()
+        await self.test_db_sink()
+        await self.test_run_journal()
+        await self.test_hotel_matcher()
+        await self.test_rate_limiter()
+        await self.test_hotel_record()
+        await self.test_ctrip_listing_pool()
+        await self.test_streaming_output()
+        await self.test_crawl_schedule()
+        await self.test_detail_fetcher()
+        await self.test_detail_freshness()
+        await self.test_selector_stats()
+        await self.test_rating_aggregator()
+        await self.test_price_history()
         await self.test_api_endpoints()
         await self.test_scraper_functionality()
         await self.test_image_validation()
+        await self.test_parser_benchmarks()
         await self.test_frontend_pages()
         await self.test_scheduled_tasks()
         